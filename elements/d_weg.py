@@ -1,6 +1,7 @@
 """
 Module with 'dweg' values for train journey, with respect to train speed at the railway-track.
 """
+import numpy as np
 
 
 def get_d_weg(speed):
@@ -17,3 +18,13 @@ def get_d_weg(speed):
         return 100
     if speed > 60:
         return 200
+
+
+def get_d_weg_array(speeds):
+    """
+    Function to return d_weg for many speeds at once, same steps as get_d_weg
+    :param speeds: driving speeds of the train as array
+    :return: d_weg for every speed as array
+    """
+    speeds = np.asarray(speeds, dtype=np.float64)
+    return np.select([speeds <= 30, speeds <= 40, speeds <= 60], [0, 50, 100], default=200)
@@ -2,7 +2,11 @@
 Module to get all elements of trajectory of given train
 """
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
 
 
 @dataclass
@@ -29,9 +33,92 @@ def is_in_boundaries(kilometrage, start, end):
         return False
 
 
+class TrajectoryIndex:
+    """
+    Waypoint lookups on the trajectory of one link. The kilometrages of all records are computed once, the waypoint
+    before a position is then found by binary search instead of walking the records from the beginning.
+    """
+
+    def __init__(self, trajectory, direction, initial_pos):
+        """
+        :param trajectory: TrajectoryArrays of the link (see library.trajectory_loader)
+        :param direction: direction of the train (either "S" or "F")
+        :param initial_pos: kilometrisierung at the start of the train journey
+        """
+        self.trajectory = trajectory
+        self.direction = direction
+        self.initial_pos = initial_pos
+        if direction == "S":
+            self.kilometrages = initial_pos + trajectory.xs / 1000
+            # running maximum, so the first record past a position is found even if the trajectory ever steps back
+            self.passed_kilometrages = np.maximum.accumulate(self.kilometrages)
+        else:
+            self.kilometrages = initial_pos - trajectory.xs / 1000
+            self.passed_kilometrages = -np.minimum.accumulate(self.kilometrages)
+
+    def __len__(self):
+        return len(self.kilometrages)
+
+    def first_passed(self, position):
+        """
+        :return: index of the first record beyond the position in driving direction, len(self) if there is none
+        """
+        return int(np.searchsorted(self.passed_kilometrages, position if self.direction == "S" else -position,
+                                   side='right'))
+
+    def indices_before(self, positions):
+        """
+        Function to look up many positions at once, like waypoint_before
+        :param positions: kilometrisierungen as array
+        :return: array with the index of the record right before (or at) every position, -1 if there is none
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        keys = positions if self.direction == "S" else -positions
+        return np.searchsorted(self.passed_kilometrages, keys, side='right') - 1
+
+    def waypoint(self, index):
+        return Waypoint(float(self.trajectory.vs[index]), float(self.trajectory.ts[index]) / 60,
+                        float(self.kilometrages[index]),
+                        EPOCH + timedelta(milliseconds=int(self.trajectory.timestamps[index])))
+
+    def waypoint_before(self, position, interpolate=False):
+        """
+        :param position: kilometrisierung
+        :param interpolate: interpolate linearly between the records around the position instead of returning the
+        record right before it
+        :return: waypoint right before (or at) the position, None if the trajectory starts beyond the position
+        """
+        index = self.first_passed(position)
+        if index == 0:
+            return None
+        if not interpolate or index == len(self):
+            return self.waypoint(index - 1)
+
+        before, after = self.waypoint(index - 1), self.waypoint(index)
+        fraction = (position - before.kilometrage) / (after.kilometrage - before.kilometrage)
+        return Waypoint(before.velocity + fraction * (after.velocity - before.velocity),
+                        before.timestamp + fraction * (after.timestamp - before.timestamp),
+                        position,
+                        before.time + fraction * (after.time - before.time))
+
+    def get_waypoints(self, start=None, end=None):
+        """
+        Same as get_waypoints with the direction and initial position of the index
+        """
+        if start is not None and end is None:
+            return self.waypoint_before(start)
+
+        geschwindigkeiten = {}
+        for index, kilometrage in enumerate(self.kilometrages.tolist()):
+            if is_in_boundaries(kilometrage, start, end):
+                geschwindigkeiten[kilometrage] = self.waypoint(index)
+        return geschwindigkeiten
+
+
 def get_waypoints(records, direction, initial_pos, start=None, end=None):
     """
-    :param records:
+    :param records: <records> node of a link, its trajectory columns (see library.trajectory_loader) or its
+    TrajectoryIndex, whose own direction and initial position are used
     :param direction: direction of the train (either "S" or "F")
     :param initial_pos: kilometrisierung at the start of the train journey
     :param start: kilometrisierung from where to start (default: None)
@@ -39,6 +126,11 @@ def get_waypoints(records, direction, initial_pos, start=None, end=None):
     :return a dictonary of all the waypoints at the kilometrisierungen between start and end
     (if start is given and end is left empty -> only return waypoint right before that specific point)
     """
+    if isinstance(records, TrajectoryIndex):
+        return records.get_waypoints(start, end)
+    if hasattr(records, 'xs'):  # trajectory columns instead of xml records
+        return get_waypoints_from_arrays(records, direction, initial_pos, start, end)
+
     geschwindigkeiten = {}
 
     if start is not None and end is None:
@@ -65,3 +157,17 @@ def get_waypoints(records, direction, initial_pos, start=None, end=None):
         if is_in_boundaries(kilometrage, start, end):
             geschwindigkeiten[kilometrage] = point
     return geschwindigkeiten
+
+
+def get_waypoints_from_arrays(trajectory, direction, initial_pos, start=None, end=None):
+    """
+    Same as get_waypoints, working on the trajectory columns of a link
+    :param trajectory: TrajectoryArrays of the link (see library.trajectory_loader)
+    :param direction: direction of the train (either "S" or "F")
+    :param initial_pos: kilometrisierung at the start of the train journey
+    :param start: kilometrisierung from where to start (default: None)
+    :param end: kilometrisierung where to stop (default: None)
+    :return: waypoint right before start if only start is given, otherwise dictonary of all waypoints between start
+    and end
+    """
+    return TrajectoryIndex(trajectory, direction, initial_pos).get_waypoints(start, end)
@@ -0,0 +1,117 @@
+"""
+Library module with a size bounded LRU cache, used to keep parsed files in memory during a run. The cache can be shared
+by the threads of a thread pool executor, every operation holds a lock.
+"""
+from collections import OrderedDict
+from threading import RLock
+
+
+class LRUCache:
+    """
+    Least recently used cache with a budget on the summed size of its entries and hit/miss counters
+    """
+
+    def __init__(self, max_size=None):
+        """
+        :param max_size: budget for the summed size of all entries, None for an unbounded cache
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Function to get a cached value and mark it as most recently used
+        :param key: key of the entry
+        :param default: returned if the key is not cached
+        :return: cached value or default
+        """
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=1):
+        """
+        Function to add a value to the cache, evicting least recently used entries until the budget is kept
+        :param key: key of the entry
+        :param value: value to cache
+        :param size: size of the value, counted against max_size
+        """
+        with self._lock:
+            self.pop(key)
+            self._entries[key] = (value, size)
+            self.size += size
+            self._evict()
+
+    def pop(self, key):
+        """
+        Function to remove an entry from the cache
+        :param key: key of the entry
+        :return: removed value or None if the key was not cached
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.size -= entry[1]
+            return entry[0]
+
+    def items(self):
+        """
+        :return: list of (key, value) of all entries from least to most recently used, without touching their order
+        """
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._entries.items()]
+
+    def resize(self, max_size):
+        """
+        Function to change the budget of the cache, evicting entries if the new budget is smaller
+        :param max_size: new budget, None for an unbounded cache
+        """
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self):
+        """
+        Function to remove all entries and reset the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """
+        :return: dict with the counters and the current fill level of the cache
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'size': self.size, 'max_size': self.max_size}
+
+    def _evict(self):
+        # called with the lock held, the newest entry is always kept, even if it alone exceeds the budget
+        while self.max_size is not None and self.size > self.max_size and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
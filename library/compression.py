@@ -0,0 +1,181 @@
+"""
+Library module for transparently compressed xml resources. Every resource path can also exist as '<name>.xml.gz' or
+'<name>.xml.xz', readers resolve the variant on disk and stream-decompress it into the parser. The module also offers
+a one-shot command to compress a resource tree and a benchmark of cold-start read times for plain and compressed trees.
+
+    python library/compression.py compress resources/schedules --format xz --remove
+    python library/compression.py benchmark resources/schedules
+"""
+import argparse
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import time
+from os import path
+from xml.etree import ElementTree as ET
+
+# suffix -> opener, in the order in which variants are looked up after the plain file
+OPENERS = {
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+}
+XML_SUFFIX = '.xml'
+
+
+def resolve_path(resource_path):
+    """
+    Function to find the variant of a resource that exists on disk, the plain file wins over compressed ones
+    :param resource_path: path of the plain resource, e.g. '.../schedule_esf.xml'
+    :return: path of the existing variant, the plain path if no variant exists
+    """
+    if path.exists(resource_path):
+        return resource_path
+    for suffix in OPENERS:
+        if path.exists(resource_path + suffix):
+            return resource_path + suffix
+    return resource_path
+
+
+def plain_name(file_name):
+    """
+    :return: file name without compression suffix, e.g. 'schedule_esf.xml' for 'schedule_esf.xml.gz'
+    """
+    for suffix in OPENERS:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+def open_resource(resource_path):
+    """
+    Function to open a resource or one of its compressed variants for binary reading
+    :param resource_path: path of the plain resource or of a compressed variant
+    :return: binary file object, decompressing while it is read
+    """
+    resolved_path = resolve_path(resource_path)
+    opener = OPENERS.get(path.splitext(resolved_path)[1], open)
+    return opener(resolved_path, 'rb')
+
+
+def read_resource(resource_path):
+    """
+    :return: decompressed content of the resource as bytes
+    """
+    with open_resource(resource_path) as resource_file:
+        return resource_file.read()
+
+
+def parse_resource(resource_path):
+    """
+    :return: ElementTree of the resource
+    """
+    with open_resource(resource_path) as resource_file:
+        return ET.parse(resource_file)
+
+
+def compress_tree(root_dir, compression='gz', remove=False, level=None):
+    """
+    Function to compress all xml files below a directory
+    :param root_dir: root of the resource tree
+    :param compression: 'gz' or 'xz'
+    :param remove: delete the plain files after compressing them, otherwise readers keep using the plain files
+    :param level: compression level, None for the default of the format
+    :return: tuple of number of files, plain bytes and compressed bytes
+    """
+    suffix = '.' + compression
+    opener = OPENERS[suffix]
+    options = {} if level is None else ({'compresslevel': level} if suffix == '.gz' else {'preset': level})
+    files = plain_bytes = compressed_bytes = 0
+    for dir_name, _, file_list in os.walk(root_dir):
+        for file_name in file_list:
+            if not file_name.endswith(XML_SUFFIX):
+                continue
+            file_path = path.join(dir_name, file_name)
+            with open(file_path, 'rb') as plain_file, opener(file_path + suffix + '.tmp', 'wb', **options) as target:
+                shutil.copyfileobj(plain_file, target, 1 << 20)
+            os.replace(file_path + suffix + '.tmp', file_path + suffix)
+            files += 1
+            plain_bytes += path.getsize(file_path)
+            compressed_bytes += path.getsize(file_path + suffix)
+            if remove:
+                os.remove(file_path)
+    return files, plain_bytes, compressed_bytes
+
+
+def _drop_page_cache(file_path):
+    # best effort, without root privileges this is the closest to a cold start for a single file
+    if hasattr(os, 'posix_fadvise'):
+        file_descriptor = os.open(file_path, os.O_RDONLY)
+        try:
+            os.fsync(file_descriptor)
+            os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(file_descriptor)
+
+
+def benchmark_tree(root_dir, parse=True):
+    """
+    Function to measure the time to read (and parse) all xml resources below a directory after evicting them from
+    the page cache
+    :param root_dir: root of the resource tree
+    :param parse: build the ElementTree, otherwise only read and decompress
+    :return: tuple of number of files, bytes on disk and seconds
+    """
+    resources = []
+    for dir_name, _, file_list in os.walk(root_dir):
+        for file_name in file_list:
+            if plain_name(file_name).endswith(XML_SUFFIX):
+                resources.append(path.join(dir_name, file_name))
+    for resource_path in resources:
+        _drop_page_cache(resource_path)
+
+    disk_bytes = sum(path.getsize(resource_path) for resource_path in resources)
+    start = time.perf_counter()
+    for resource_path in resources:
+        if parse:
+            parse_resource(resource_path)
+        else:
+            read_resource(resource_path)
+    return len(resources), disk_bytes, time.perf_counter() - start
+
+
+def benchmark(root_dir, compressions=('gz', 'xz'), parse=True):
+    """
+    Function to compare cold-start read times of a plain resource tree with compressed copies of it
+    :param root_dir: root of the plain resource tree
+    :param compressions: compression formats to compare
+    :param parse: build the ElementTree, otherwise only read and decompress
+    :return: dict with 'plain' and every compression format as key and (files, bytes on disk, seconds) as value
+    """
+    results = {'plain': benchmark_tree(root_dir, parse)}
+    for compression in compressions:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            copy_dir = path.join(temp_dir, path.basename(path.normpath(root_dir)))
+            shutil.copytree(root_dir, copy_dir, ignore=shutil.ignore_patterns('*.csv', '*.jpg', '*.png'))
+            compress_tree(copy_dir, compression, remove=True)
+            results[compression] = benchmark_tree(copy_dir, parse)
+    return results
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = argument_parser.add_subparsers(dest='command', required=True)
+    compress_command = commands.add_parser('compress', help='compress all xml files of a resource tree')
+    compress_command.add_argument('root_dir')
+    compress_command.add_argument('--format', choices=[suffix[1:] for suffix in OPENERS], default='gz')
+    compress_command.add_argument('--level', type=int, default=None)
+    compress_command.add_argument('--remove', action='store_true', help='delete the plain files afterwards')
+    benchmark_command = commands.add_parser('benchmark', help='compare cold-start reads of plain and compressed trees')
+    benchmark_command.add_argument('root_dir')
+    benchmark_command.add_argument('--read-only', action='store_true', help='do not parse, only read and decompress')
+    arguments = argument_parser.parse_args()
+
+    if arguments.command == 'compress':
+        count, plain_size, compressed_size = compress_tree(arguments.root_dir, arguments.format, arguments.remove,
+                                                           arguments.level)
+        print(f'{count} files compressed, {plain_size / 1e6:.1f} MB -> {compressed_size / 1e6:.1f} MB')
+    else:
+        for variant, (count, size, seconds) in benchmark(arguments.root_dir, parse=not arguments.read_only).items():
+            print(f'{variant:>5}: {count} files, {size / 1e6:8.1f} MB on disk, {seconds:6.2f} s')
@@ -0,0 +1,120 @@
+"""
+Library module with a pluggable executor for the batch loops over trains and train pairs. The same loop runs serially,
+in a thread pool or in a process pool. Results always come back in the order of the items, independent of which worker
+finishes first, and an exception raised for one item is collected with the item instead of aborting the whole batch.
+"""
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+
+SERIAL = 'serial'
+THREAD = 'thread'
+PROCESS = 'process'
+BACKENDS = (SERIAL, THREAD, PROCESS)
+DEFAULT_BACKEND = SERIAL
+CHUNKS_PER_WORKER = 4  # more chunks than workers to balance items of different cost
+
+
+@dataclass
+class ItemError:
+    """
+    Exception raised while processing one item of a batch
+    """
+    index: int
+    item: object
+    error: str
+    traceback: str = field(repr=False)
+
+
+@dataclass
+class BatchResult:
+    """
+    Results of a batch in the order of its items. Failed items have None as result and an ItemError in errors.
+    """
+    results: list
+    errors: list
+
+    def succeeded(self, items):
+        """
+        :param items: items of the batch in the order they were passed to Executor.map
+        :return: list of (item, result) of all items that did not fail, in the order of the items
+        """
+        failed = {error.index for error in self.errors}
+        return [(item, result) for index, (item, result) in enumerate(zip(items, self.results)) if index not in failed]
+
+
+def _run_item(function, item):
+    # runs inside the worker, exceptions are sent back as text because not every exception can be pickled
+    try:
+        return True, function(item)
+    except Exception as exception:
+        return False, (repr(exception), traceback.format_exc())
+
+
+class Executor:
+    """
+    Maps a function over the items of a batch with a serial, thread or process backend
+    """
+
+    def __init__(self, backend=DEFAULT_BACKEND, workers=None, chunksize=None):
+        """
+        :param backend: 'serial', 'thread' or 'process'
+        :param workers: number of workers, None for one per cpu core
+        :param chunksize: items sent to a process worker at once, None to split every batch into CHUNKS_PER_WORKER
+        chunks per worker
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f'unknown executor backend {backend}, expected one of {", ".join(BACKENDS)}')
+        self.backend = backend
+        self.workers = workers
+        self.chunksize = chunksize
+
+    def map(self, function, items):
+        """
+        Function to apply a function to every item
+        :param function: function with one argument, module level for the process backend so it can be pickled
+        :param items: iterable of items, picklable for the process backend
+        :return: BatchResult in the order of the items
+        """
+        items = list(items)
+        workers = min(os.cpu_count() if self.workers is None else self.workers, len(items))
+        run = partial(_run_item, function)
+        if self.backend == SERIAL or workers <= 1:
+            outcomes = [run(item) for item in items]
+        else:
+            chunksize = self.chunksize or max(1, len(items) // (workers * CHUNKS_PER_WORKER))
+            pool = ThreadPoolExecutor if self.backend == THREAD else ProcessPoolExecutor
+            with pool(max_workers=workers) as executor:
+                outcomes = list(executor.map(run, items, chunksize=chunksize))
+
+        results, errors = [], []
+        for index, (item, (ok, value)) in enumerate(zip(items, outcomes)):
+            if ok:
+                results.append(value)
+            else:
+                results.append(None)
+                errors.append(ItemError(index, item, *value))
+        return BatchResult(results, errors)
+
+
+DEFAULT_EXECUTOR = Executor()
+
+
+def get_executor(executor=None):
+    """
+    :param executor: Executor, None for the default (serial) executor
+    :return: Executor to run a batch with
+    """
+    return DEFAULT_EXECUTOR if executor is None else executor
+
+
+def report_errors(batch, description):
+    """
+    Function to print the collected errors of a batch
+    :param batch: BatchResult
+    :param description: what the items of the batch are, e.g. 'train pairs'
+    """
+    for error in batch.errors:
+        print(f'Failed for {description} {error.item}: {error.error}')
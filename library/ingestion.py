@@ -0,0 +1,86 @@
+"""
+Library module for bulk ingestion of schedules. Parsing schedule_esf.xml is CPU bound and every file is independent, so
+the files are fanned out to a process pool. Workers send back compact, picklable summaries instead of ElementTrees.
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from library.train_schedule_parser import SCHEDULE_SECTIONS, Train
+from library.trajectory_loader import records_to_arrays
+from library.utils import determine_direction
+
+
+def hash_file(file_path):
+    """
+    :return: sha1 hex digest of the file content
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+@dataclass
+class ScheduleSummary:
+    """
+    Compact summary of one schedule_esf.xml, one list entry per link
+    """
+    train: str
+    line: str
+    journey_id: str
+    schedule_hash: str
+    departures: list = field(default_factory=list)  # abfahrtzeit of min_abfahrt as iso string
+    arrivals: list = field(default_factory=list)  # ankunftzeit of min_ankunft as iso string
+    directions: list = field(default_factory=list)
+    verlauf_ids: list = field(default_factory=list)  # element ids of the Verlauf in driving order
+    trajectories: list = field(default=None)  # TrajectoryArrays, only if requested
+
+
+def summarize_schedule(train, include_trajectories=False):
+    """
+    Function to parse one schedule and summarize it
+    :param train: train as string with format '<line> <journey_id>'
+    :param include_trajectories: also convert the trajectory records of every link to arrays
+    :return: ScheduleSummary
+    """
+    line, journey_id = train.split()
+    schedule = Train(line, journey_id, sections=None if include_trajectories else SCHEDULE_SECTIONS)
+    summary = ScheduleSummary(train=train, line=line, journey_id=journey_id,
+                              schedule_hash=hash_file(schedule.schedule_path))
+    for origin, verlauf, destination in zip(schedule.get_origin().values(), schedule.get_verlauf().values(),
+                                            schedule.get_destination().values()):
+        summary.departures.append(origin[0].find('abfahrtzeit').text)
+        summary.arrivals.append(destination[2].find('ankunftzeit').text)
+        summary.directions.append(determine_direction(verlauf))
+        summary.verlauf_ids.append([node[0].text for node in verlauf])
+    if include_trajectories:
+        summary.trajectories = [records_to_arrays(trajectory.find('records'))
+                                for trajectory in schedule.get_trajectory().values()]
+    return summary
+
+
+def _summarize_trajectories(train):
+    return summarize_schedule(train, include_trajectories=True)
+
+
+def ingest_schedules(trains, workers=None, include_trajectories=False):
+    """
+    Function to parse many schedules in parallel
+    :param trains: list of trains as string with format '<line> <journey_id>'
+    :param workers: number of worker processes, None for one per cpu core, 1 to parse in the calling process
+    :param include_trajectories: also convert the trajectory records of every link to arrays
+    :return: list of ScheduleSummary in the order of the given trains
+    """
+    trains = list(trains)
+    summarize = _summarize_trajectories if include_trajectories else summarize_schedule
+    workers = os.cpu_count() if workers is None else workers
+    workers = min(workers, len(trains))
+    if workers <= 1:
+        return [summarize(train) for train in trains]
+
+    # map() returns the results in the order of the input, independent of which worker finishes first
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(summarize, trains, chunksize=max(1, len(trains) // (workers * 4))))
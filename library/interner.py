@@ -0,0 +1,97 @@
+"""
+Library module with a process wide interner of infrastructure IDs. Every node ID of the infrastructure file (signals,
+Zugschlussstellen, Fahrstrassen and all other nodes of the Spurplanabschnitte) is mapped to a dense int32 code, its
+index in the topology index, so the codes are the same in every process working on the same infrastructure. Stages
+compare, intersect and join codes and only turn them back into strings for output.
+"""
+import numpy as np
+
+from library.topology import get_topology
+
+CODE_DTYPE = np.int32
+NONE_CODE = -1  # code of a missing ID
+NONE_ID = 'None'  # string of a missing ID, as written to the output files
+
+
+class IdInterner:
+    """
+    Two-way mapping between ID strings and int32 codes
+    """
+
+    def __init__(self, ids):
+        """
+        :param ids: ID strings in the order of their codes
+        """
+        self.strings = list(ids)
+        self.codes = {node_id: code for code, node_id in enumerate(self.strings)}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, node_id):
+        """
+        :param node_id: ID as int or string, None or 'None' for a missing ID
+        :return: code of the ID, IDs unknown to the infrastructure get the next free code
+        """
+        if node_id is None:
+            return NONE_CODE
+        node_id = str(node_id)
+        code = self.codes.get(node_id)
+        if code is None:
+            if node_id == NONE_ID:
+                return NONE_CODE
+            code = self.codes[node_id] = len(self.strings)
+            self.strings.append(node_id)
+        return code
+
+    def intern_many(self, node_ids):
+        """
+        :param node_ids: iterable of IDs
+        :return: numpy array with the codes of the IDs
+        """
+        return np.fromiter((self.intern(node_id) for node_id in node_ids), dtype=CODE_DTYPE)
+
+    def string(self, code):
+        """
+        :return: ID string of the code, 'None' for a missing ID
+        """
+        return NONE_ID if code < 0 else self.strings[code]
+
+    def strings_of(self, codes):
+        """
+        :param codes: iterable of codes
+        :return: list of the ID strings
+        """
+        strings = self.strings
+        return [NONE_ID if code < 0 else strings[code] for code in codes]
+
+    def translate(self, codes, ids):
+        """
+        Function to convert codes of another interner (e.g. one that was saved with a store) into codes of this one
+        :param codes: numpy array of codes of the other interner
+        :param ids: ID strings of the other interner in the order of its codes
+        :return: numpy array of codes of this interner, codes itself if both interners agree
+        """
+        if self.strings[:len(ids)] == list(ids):
+            return codes
+        mapping = np.append(self.intern_many(ids), CODE_DTYPE(NONE_CODE))  # index -1 stays a missing ID
+        return mapping[codes]
+
+
+_interner = {}
+
+
+def get_interner(refresh=False):
+    """
+    Function to get the shared interner, built from the topology index on first use in a process
+    :param refresh: rebuild it, e.g. after the infrastructure file changed during the run
+    :return: IdInterner
+    """
+    if refresh or 'interner' not in _interner:
+        _interner['interner'] = IdInterner(get_topology(refresh).ids)
+    return _interner['interner']
+
+
+if __name__ == '__main__':
+    interner = get_interner()
+    print(len(interner), interner.intern('162'), interner.string(interner.intern('162')))
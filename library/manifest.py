@@ -0,0 +1,66 @@
+"""
+Library module with a content hash manifest of generated outputs. For every output the manifest records the hashes of
+the inputs it was built from, so that a rebuild only recomputes the outputs whose inputs changed.
+"""
+import hashlib
+import json
+from os import makedirs, path, replace
+
+MANIFEST_VERSION = 1
+MISSING = 'not built yet'
+
+
+def hash_value(value):
+    """
+    Function to hash any json serializable value, e.g. a row of a table
+    :param value: value to hash, dicts are hashed independent of their key order
+    :return: sha1 as hex string
+    """
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """
+    Output name -> input name -> hash of the input, persisted as json
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.outputs = {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.outputs = manifest['outputs']
+
+    def changed_inputs(self, output, inputs):
+        """
+        Function to compare the current inputs of an output with the ones it was built from
+        :param output: name of the output
+        :param inputs: input name as key and current hash as value
+        :return: list of the names of all changed inputs, [MISSING] if the output was never recorded
+        """
+        recorded = self.outputs.get(output)
+        if recorded is None:
+            return [MISSING]
+        return [name for name, input_hash in inputs.items() if recorded.get(name) != input_hash]
+
+    def record(self, output, inputs):
+        """
+        Function to remember the inputs an output was built from
+        :param output: name of the output
+        :param inputs: input name as key and hash as value
+        """
+        self.outputs[output] = dict(inputs)
+
+    def forget(self, output):
+        self.outputs.pop(output, None)
+
+    def save(self):
+        makedirs(path.dirname(self.manifest_path), exist_ok=True)
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'outputs': self.outputs}, manifest_file, indent=1)
+        # replace only when complete, readers never see a half written manifest
+        replace(self.manifest_path + '.tmp', self.manifest_path)
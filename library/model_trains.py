@@ -1,13 +1,92 @@
 """
 module to retrieve train characteristics from given excel file in resources
+
+All sheets are read once into an in-memory registry. A decoded copy of the sheets is kept next to the excel file and
+reused as long as the modification time of the excel file does not change, so repeated runs do not need openpyxl.
 """
-from os import path
+import json
+from os import path, remove, replace
 from pathlib import Path
 
 import pandas as pd
 
 package_dir = path.dirname(Path(__file__).parent)
 path_model_trains = path.join(package_dir, Path('resources/trains/Model_Trains.xlsx'))
+path_model_trains_cache = path_model_trains + '.cache.json'
+
+LINE_COLUMN = 'Linien'
+TOTAL_LENGTH_COLUMN = 'Total lz [m]'
+
+_registry = {
+    'mtime': None,
+    'sheets': {},  # sheet name -> data frame with all columns of the sheet
+    'lines': {},  # line name -> dict of train characteristics
+}
+
+
+def load_model_trains(refresh=False):
+    """
+    Function to fill the registry of model trains, reading the decoded cache or the excel file if necessary
+    :param refresh: force reading the excel file and rewriting the cache
+    :return: dict with sheet name as key and pandas.core.frame.DataFrame of the complete sheet as value
+    """
+    mtime = path.getmtime(path_model_trains)
+    if not refresh and _registry['mtime'] == mtime:
+        return _registry['sheets']
+
+    sheets = None if refresh else _read_cache(mtime)
+    if sheets is None:
+        sheets = pd.read_excel(path_model_trains, sheet_name=None)
+        _write_cache(sheets, mtime)
+
+    lines = {}
+    for data_frame in sheets.values():
+        if LINE_COLUMN not in data_frame:
+            continue
+        # the first row of a line within a sheet and the last sheet with the line win, like the former sheet by sheet
+        # search
+        sheet_lines = {}
+        for row in data_frame.to_dict('records'):
+            sheet_lines.setdefault(row[LINE_COLUMN], row)
+        lines.update(sheet_lines)
+
+    _registry['mtime'] = mtime
+    _registry['sheets'] = sheets
+    _registry['lines'] = lines
+    return sheets
+
+
+def _read_cache(mtime):
+    """
+    :return: dict of data frames from the decoded cache, None if there is no cache for the given mtime
+    """
+    try:
+        with open(path_model_trains_cache, 'r', encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    if cache.get('mtime') != mtime:
+        return None
+    return {name: pd.DataFrame(sheet['rows'], columns=sheet['columns']) for name, sheet in cache['sheets'].items()}
+
+
+def _write_cache(sheets, mtime):
+    cache = {
+        'mtime': mtime,
+        'sheets': {name: {'columns': list(data_frame.columns), 'rows': data_frame.values.tolist()}
+                   for name, data_frame in sheets.items()}
+    }
+    try:
+        with open(path_model_trains_cache + '.tmp', 'w', encoding='utf-8') as cache_file:
+            json.dump(cache, cache_file)
+        # replace only when complete, a crash while writing never leaves a truncated cache
+        replace(path_model_trains_cache + '.tmp', path_model_trains_cache)
+    except (OSError, TypeError, ValueError):
+        # read-only resources or cells json can not hold, the registry still works in memory
+        try:
+            remove(path_model_trains_cache + '.tmp')
+        except OSError:
+            pass
 
 
 def get_model_train_data(with_sheet_name, with_columns):
@@ -17,8 +96,31 @@ def get_model_train_data(with_sheet_name, with_columns):
     :param with_columns: columns to retrieve from file
     :return: pandas.core.frame.DataFrame type
     """
-    data_frame = pd.read_excel(path_model_trains, sheet_name=with_sheet_name, usecols=with_columns)
-    return data_frame
+    sheets = load_model_trains()
+    if not isinstance(with_sheet_name, (str, int)) or not isinstance(with_columns, (list, tuple, type(None))) or \
+            not all(isinstance(column, str) for column in with_columns or []):
+        # uncommon selections (lists of sheets, column ranges or positions, callables) are left to pandas
+        return pd.read_excel(path_model_trains, sheet_name=with_sheet_name, usecols=with_columns)
+
+    data_frame = sheets[list(sheets)[with_sheet_name] if isinstance(with_sheet_name, int) else with_sheet_name]
+    if with_columns is not None:
+        missing = sorted(column for column in with_columns if column not in data_frame.columns)
+        if missing:
+            # same error as pd.read_excel with usecols
+            raise ValueError(f'Usecols do not match columns, columns expected but not found: {missing} '
+                             f'(sheet: {with_sheet_name})')
+        data_frame = data_frame[[column for column in data_frame.columns if column in with_columns]]
+    return data_frame.copy()
+
+
+def get_model_train(with_line_name):
+    """
+    Function to get all characteristics of the model train running on given line
+    :param with_line_name: line name of train
+    :return: dict with column name as key, None if the line has no model train
+    """
+    load_model_trains()
+    return _registry['lines'].get(with_line_name.upper())
 
 
 def get_train_total_length(with_line_name):
@@ -27,16 +129,7 @@ def get_train_total_length(with_line_name):
     :param with_line_name: line name of train
     :return: .2f precision float, total length of train on given line
     """
-    model_train = pd.ExcelFile(path_model_trains)
-    total_length = None
-
-    for sheet in model_train.sheet_names:
-        data_frame = pd.read_excel(path_model_trains, sheet_name=sheet, usecols=['Linien', 'Total lz [m]'],
-                                   na_values=None)
-        mask = data_frame['Linien'].eq(with_line_name.upper())
-        found_frame = data_frame.loc[mask]
-        if not found_frame.empty:
-            found_value = (found_frame['Total lz [m]']).values
-            total_length = float(format(found_value[0], '.4f'))
-
-    return total_length
+    model_train = get_model_train(with_line_name)
+    if model_train is None:
+        return None
+    return float(format(model_train[TOTAL_LENGTH_COLUMN], '.4f'))
@@ -0,0 +1,199 @@
+"""
+Library module with a columnar store of the occupancy times of all trains. Block times, block geometry, the ragged
+times and positions of the Fahrstrassenabschnitte of every block are kept as flat columns in one binary file, with the
+offsets of every train and link in a json index. Readers memory map the file, so the conflict and headway stages get
+the times of a train without parsing any occupancy_times.xml.
+
+Values are stored as they are read back from occupancy_times.xml, IDs as int32 codes of library.interner (the block
+ID '<start>-<end>' as the codes of its two signals), positions and times as floats (NaN if missing). The ID strings of
+the codes are saved with the index, so a store stays readable when the infrastructure changes.
+"""
+import json
+from os import makedirs, path, replace
+
+import numpy as np
+
+from library.interner import CODE_DTYPE, get_interner
+from library.schedule_catalog import CACHE_DIR
+
+STORE_PATH = path.join(CACHE_DIR, 'occupancy_times.bin')
+INDEX_PATH = path.join(CACHE_DIR, 'occupancy_times.json')
+STORE_VERSION = 2
+
+# one row per block
+BLOCK_ID_COLUMNS = ('block_start_id', 'block_end_id', 'vorsignal_id', 'start_hauptsignal_id', 'end_hauptsignal_id',
+                    'zugschlussstelle_id')
+BLOCK_FLOAT_COLUMNS = ('belegungszeit', 'vorbelegungszeit', 'vorsignal_pos', 'start_hauptsignal_pos',
+                       'end_hauptsignal_pos', 'zugschlussstelle_pos', 'zugschlussstelle_aufloesezeit', 'distance_a',
+                       'distance_b', 'distance_d')
+# one row per Fahrstrassenabschnitt
+ABSCHNITT_ID_COLUMNS = ('start_abschnitt_id', 'end_abschnitt_id')
+ABSCHNITT_FLOAT_COLUMNS = ('start_abschnitt_pos', 'end_abschnitt_pos')
+# ragged lists of every block -> offsets column
+RAGGED_COLUMNS = {
+    'fahrstrassenabschnitte': 'abschnitt_offsets',
+    'driving_time': 'driving_time_offsets',
+    'nachbelegungszeit': 'nachbelegungszeit_offsets',
+}
+
+
+def _to_float(value):
+    return np.nan if value is None else float(value)
+
+
+def pack_times(trains_times):
+    """
+    Function to convert the occupancy times of many trains into columns
+    :param trains_times: train as key and list of links as value, every link as tuple of belegungszeiten,
+    vorbelegungszeiten, driving times, nachbelegungszeiten and blocks as returned by get_times
+    :return: dict of columns and dict with the block range [start, end] of every link of every train
+    """
+    columns = {name: [] for name in BLOCK_ID_COLUMNS + BLOCK_FLOAT_COLUMNS + ABSCHNITT_ID_COLUMNS +
+               ABSCHNITT_FLOAT_COLUMNS + tuple(RAGGED_COLUMNS) + tuple(RAGGED_COLUMNS.values())}
+    for offsets in RAGGED_COLUMNS.values():
+        columns[offsets].append(0)
+    del columns['fahrstrassenabschnitte']
+
+    intern = get_interner().intern
+    trains = {}
+    for train, links in trains_times.items():
+        trains[train] = []
+        for belegungszeiten, vorbelegungszeiten, driving_times, nachbelegungszeiten, blocks in links:
+            start = len(columns['block_start_id'])
+            for i, block in enumerate(blocks):
+                block_start_id, block_end_id = block.block_id.split('-')
+                columns['block_start_id'].append(intern(block_start_id))
+                columns['block_end_id'].append(intern(block_end_id))
+                for name in BLOCK_ID_COLUMNS[2:]:
+                    columns[name].append(intern(getattr(block, name)))
+                for name in BLOCK_FLOAT_COLUMNS[2:]:
+                    columns[name].append(_to_float(getattr(block, name)))
+                columns['belegungszeit'].append(float(belegungszeiten[i]))
+                columns['vorbelegungszeit'].append(float(vorbelegungszeiten[i]))
+                for fahrstrassenabschnitt in block.fahrstrassenabschnitte:
+                    for name in ABSCHNITT_ID_COLUMNS:
+                        columns[name].append(intern(getattr(fahrstrassenabschnitt, name)))
+                    for name in ABSCHNITT_FLOAT_COLUMNS:
+                        columns[name].append(_to_float(getattr(fahrstrassenabschnitt, name)))
+                columns['driving_time'].extend(map(float, driving_times[i]))
+                columns['nachbelegungszeit'].extend(map(float, nachbelegungszeiten[i]))
+                columns['abschnitt_offsets'].append(len(columns['start_abschnitt_id']))
+                columns['driving_time_offsets'].append(len(columns['driving_time']))
+                columns['nachbelegungszeit_offsets'].append(len(columns['nachbelegungszeit']))
+            trains[train].append([start, len(columns['block_start_id'])])
+
+    arrays = {}
+    for name, values in columns.items():
+        if name in BLOCK_ID_COLUMNS + ABSCHNITT_ID_COLUMNS:
+            arrays[name] = np.asarray(values, dtype=CODE_DTYPE)
+        elif name in RAGGED_COLUMNS.values():
+            arrays[name] = np.asarray(values, dtype=np.int64)
+        else:
+            arrays[name] = np.asarray(values, dtype=np.float64)
+    return arrays, trains
+
+
+def write_occupancy_store(trains_times, hashes, store_path=STORE_PATH, index_path=INDEX_PATH):
+    """
+    Function to write the occupancy times of the given trains to the store, replacing its content
+    :param trains_times: see pack_times
+    :param hashes: train as key and hash of its schedule as value, to detect outdated entries
+    :param store_path: path of the binary file
+    :param index_path: path of the offsets table
+    """
+    arrays, trains = pack_times(trains_times)
+    layout = {}
+    offset = 0
+    makedirs(path.dirname(store_path), exist_ok=True)
+    with open(store_path + '.tmp', 'wb') as store_file:
+        for name, array in arrays.items():
+            layout[name] = [array.dtype.str, offset, len(array)]
+            array.tofile(store_file)
+            offset += array.nbytes
+    index = {'version': STORE_VERSION, 'columns': layout, 'trains': trains,
+             'hashes': {train: hashes[train] for train in trains}, 'ids': get_interner().strings}
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file)
+    # swap both files only when they are complete, readers never see a half written store
+    replace(store_path + '.tmp', store_path)
+    replace(index_path + '.tmp', index_path)
+
+
+class OccupancyStore:
+    """
+    Read-only, memory mapped view on the occupancy time store
+    """
+
+    def __init__(self, store_path=STORE_PATH, index_path=INDEX_PATH):
+        with open(index_path, 'r', encoding='utf-8') as index_file:
+            index = json.load(index_file)
+        if index.get('version') != STORE_VERSION:
+            raise ValueError('occupancy time store has an outdated format, rebuild it')
+        self.trains = index['trains']
+        self.hashes = index['hashes']
+        self.ids = index['ids']
+        self.columns = {}
+        for name, (dtype, offset, count) in index['columns'].items():
+            if count:
+                self.columns[name] = np.memmap(store_path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+            else:
+                self.columns[name] = np.empty(0, dtype=dtype)
+
+    def is_current(self, train, schedule_hash):
+        """
+        :return: True if the stored times of the train were calculated from the schedule with the given hash
+        """
+        return train in self.trains and self.hashes.get(train) == schedule_hash
+
+    def get_columns(self, train, link_id=None):
+        """
+        Function to get the occupancy times of a train, with the block geometry as columns
+        :param train: train as string with format '<line> <journey_id>'
+        :param link_id: if set -> return only times for specific link (starting at 0)
+        :return: belegungszeiten, vorbelegungszeiten, driving times, nachbelegungszeiten as lists, the block columns and
+        the Fahrstrassenabschnitt columns as dicts of arrays (IDs as codes of the current interner) and the offsets of
+        the Fahrstrassenabschnitte of every block into the Fahrstrassenabschnitt columns
+        """
+        links = self.trains[train]
+        if link_id is not None:
+            links = [links[link_id]]
+        start, end = links[0][0], links[-1][1]
+        columns = self.columns
+
+        # copies, so the returned columns stay valid when the store file is replaced
+        translate = get_interner().translate
+        block_columns = {name: np.array(columns[name][start:end]) for name in BLOCK_FLOAT_COLUMNS[2:]}
+        block_columns.update({name: np.array(translate(columns[name][start:end], self.ids))
+                              for name in BLOCK_ID_COLUMNS})
+        abschnitt_offsets = np.array(columns['abschnitt_offsets'][start:end + 1])
+        first, last = abschnitt_offsets[0], abschnitt_offsets[-1]
+        abschnitt_columns = {name: np.array(columns[name][first:last]) for name in ABSCHNITT_FLOAT_COLUMNS}
+        abschnitt_columns.update({name: np.array(translate(columns[name][first:last], self.ids))
+                                  for name in ABSCHNITT_ID_COLUMNS})
+
+        ragged = {}
+        for name in ('driving_time', 'nachbelegungszeit'):
+            offsets = columns[RAGGED_COLUMNS[name]][start:end + 1].tolist()
+            values = columns[name][offsets[0]:offsets[-1]].tolist()
+            ragged[name] = [values[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]] for i in range(end - start)]
+
+        return columns['belegungszeit'][start:end].tolist(), columns['vorbelegungszeit'][start:end].tolist(), \
+            ragged['driving_time'], ragged['nachbelegungszeit'], block_columns, abschnitt_columns, \
+            abschnitt_offsets - first
+
+
+_store = {}
+
+
+def get_occupancy_store(reload=False):
+    """
+    Function to open the shared store once per process
+    :param reload: open the store again, e.g. after it was written
+    :return: OccupancyStore or None if the store has not been written
+    """
+    if reload or 'store' not in _store:
+        try:
+            _store['store'] = OccupancyStore()
+        except (OSError, ValueError):
+            _store['store'] = None
+    return _store['store']
@@ -4,11 +4,13 @@ parser module to work with given train line and journey id
 from datetime import datetime
 from os import path
 from pathlib import Path
-from xml.etree import ElementTree as ET
 
-from library.train_schedule_parser import Train
+from library.compression import parse_resource, resolve_path
+from library.schedule_store import get_train
 
 package_root_dir = path.dirname(Path(__file__).parent)
+spurplan_betriebsstellen_path = path.join(package_root_dir, Path(
+    'resources/betriebsstellen/Spurplanbetriebsstellen_ZDBU-ZDW.xml'))
 
 
 def parse_date_time(date_time_str, get_date=False, get_time=False):
@@ -31,12 +33,10 @@ def parse_date_time(date_time_str, get_date=False, get_time=False):
 
 def get_spurplan_betriebsstellen():
     """
-    Function to get Spurplanbetriebsstellen tag from Spurplanbetriebsstellen_ZDBU-ZDW.xml
+    Function to get Spurplanbetriebsstellen tag from Spurplanbetriebsstellen_ZDBU-ZDW.xml (or its compressed variant)
     :return: type ElementTree.Element
     """
-    spurplan_betriebsstelle_path = path.join(package_root_dir, Path(
-        'resources/betriebsstellen/Spurplanbetriebsstellen_ZDBU-ZDW.xml'))
-    root = ET.parse(spurplan_betriebsstelle_path).getroot()
+    root = parse_resource(spurplan_betriebsstellen_path).getroot()
     spurplan_betriebsstelle = root.find('Spurplanbetriebsstellen')
     return spurplan_betriebsstelle
 
@@ -49,7 +49,7 @@ def get_departure_time(train_line, train_journey_id):
     :param train_journey_id: train journey id
     :return: link id as key and 'datetime.datetime' as value
     """
-    train = Train(train_line, train_journey_id)
+    train = get_train(train_line, train_journey_id)
     train_origin = train.get_origin()
     abfahrt_in_link = {}
     for link, origin in train_origin.items():
@@ -65,7 +65,7 @@ def get_trajectory_records(train_line, train_journey_id):
     :param train_journey_id:
     :return: record nodes from schedule_esf.xml as list
     """
-    train = Train(train_line, train_journey_id)
+    train = get_train(train_line, train_journey_id)
     train_trajectory = train.get_trajectory()
     records_list = [trajectory_nodes.find('records') for trajectory_nodes in train_trajectory.values()]
     return records_list
@@ -78,7 +78,7 @@ def get_all_verlauf_nodes(train_line, train_journey_id):
     :param train_journey_id:
     :return: verlauf nodes from schedule_esf.xml as list
     """
-    train = Train(train_line, train_journey_id)
+    train = get_train(train_line, train_journey_id)
     train_verlauf_links = train.get_verlauf()
     verlauf = [train_verlauf for train_verlauf in train_verlauf_links.values()]
     return verlauf
@@ -90,7 +90,7 @@ def path_generator(train_line, train_journey_id):
     project scope
     :param train_line:
     :param train_journey_id:
-    :return: absolute path to corresponding schedule_esf.xml file
+    :return: absolute path to corresponding schedule_esf.xml file, or to its compressed variant if only that exists
     """
-    return path.join(package_root_dir, Path('resources/schedules/'), train_line, train_journey_id,
-                     "schedule_esf.xml")
+    return resolve_path(path.join(package_root_dir, Path('resources/schedules/'), train_line, train_journey_id,
+                                  "schedule_esf.xml"))
@@ -0,0 +1,226 @@
+"""
+Library module with a persisted catalog of all schedules in resources/schedules. The catalog keeps one record per
+journey with the link departure and arrival times, the element ids of each link Verlauf, the driving direction and
+content hashes of the schedule file, so that pair finding and the pipeline can look them up without parsing any xml.
+The catalog is refreshed incrementally: only schedules whose files changed are parsed again.
+"""
+import json
+import os
+import re
+import string
+from dataclasses import dataclass, field
+from functools import cached_property
+from os import makedirs, path
+from pathlib import Path
+
+import numpy as np
+
+from library.compression import plain_name, resolve_path
+from library.ingestion import hash_file, ingest_schedules
+from library.parser import parse_date_time
+
+PACKAGE_DIR = path.dirname(Path(__file__).parent)
+SCHEDULES_ROOT_DIR = path.join(PACKAGE_DIR, Path('resources/schedules'))
+CACHE_DIR = path.join(PACKAGE_DIR, Path('output/cache'))
+CATALOG_PATH = path.join(CACHE_DIR, 'schedule_catalog.json')
+SCHEDULE_FILE = 'schedule_esf.xml'
+CATALOG_VERSION = 1
+
+
+@dataclass
+class LinkRecord:
+    """
+    Schedule information of one link of a journey
+    """
+    departure: str
+    arrival: str
+    direction: str
+    element_ids: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self.departure_time = parse_date_time(self.departure)
+        self.arrival_time = parse_date_time(self.arrival)
+        self.element_id_set = frozenset(self.element_ids)
+
+    @cached_property
+    def element_codes(self):
+        """
+        :return: sorted numpy array with the codes of library.interner of all element ids of the link
+        """
+        from library.interner import get_interner  # the interner is built from the topology, which uses the catalog
+        return np.unique(get_interner().intern_many(self.element_ids))
+
+    @cached_property
+    def element_code_set(self):
+        """
+        :return: frozenset of the codes of all element ids of the link
+        """
+        return frozenset(self.element_codes.tolist())
+
+
+@dataclass
+class JourneyRecord:
+    """
+    Catalog record of one journey (one schedule_esf.xml)
+    """
+    train: str
+    line: str
+    journey_id: str
+    size: int
+    mtime: float
+    hashes: dict
+    links: list
+
+    def get_departure_times(self):
+        """
+        :return: link id (counter) as key and departure time as 'datetime.datetime' as value, like
+        library.parser.get_departure_time
+        """
+        return {link_id: link.departure_time for link_id, link in enumerate(self.links, start=1)}
+
+
+def train_name(schedule_dir):
+    """
+    Function to build the train name '<line> <journey_id>' from the directory of a schedule
+    :param schedule_dir: directory containing the schedule_esf.xml
+    :return: train name as string
+    """
+    characters = re.escape(string.punctuation)
+    return re.sub(r'[' + characters + ']', ' ', (schedule_dir.split('schedules')[1])[1:])
+
+
+def build_record(summary, stat):
+    """
+    Function to build the catalog record of a journey from its schedule summary
+    :param summary: ScheduleSummary of the journey (see library.ingestion)
+    :param stat: os.stat_result of the schedule file
+    :return: JourneyRecord
+    """
+    links = [LinkRecord(departure=departure, arrival=arrival, direction=direction, element_ids=sorted(set(ids)))
+             for departure, arrival, direction, ids in zip(summary.departures, summary.arrivals, summary.directions,
+                                                           summary.verlauf_ids)]
+    return JourneyRecord(train=summary.train, line=summary.line, journey_id=summary.journey_id, size=stat.st_size,
+                         mtime=stat.st_mtime, hashes={SCHEDULE_FILE: summary.schedule_hash}, links=links)
+
+
+class ScheduleCatalog:
+    """
+    Catalog of all journeys, persisted as json and kept in the order in which the schedules are found on disk
+    """
+
+    def __init__(self, schedules_dir=SCHEDULES_ROOT_DIR, catalog_path=CATALOG_PATH):
+        self.schedules_dir = schedules_dir
+        self.catalog_path = catalog_path
+        self.records = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.catalog_path, 'r', encoding='utf-8') as catalog_file:
+                catalog = json.load(catalog_file)
+        except (OSError, ValueError):
+            return
+        if catalog.get('version') != CATALOG_VERSION:
+            return
+        for record in catalog['records']:
+            record['links'] = [LinkRecord(**link) for link in record['links']]
+            self.records[record['train']] = JourneyRecord(**record)
+
+    def save(self):
+        """
+        Function to write the catalog to disk
+        """
+        records = []
+        for record in self.records.values():
+            links = [dict(departure=link.departure, arrival=link.arrival, direction=link.direction,
+                          element_ids=link.element_ids) for link in record.links]
+            records.append(dict(train=record.train, line=record.line, journey_id=record.journey_id, size=record.size,
+                                mtime=record.mtime, hashes=record.hashes, links=links))
+        makedirs(path.dirname(self.catalog_path), exist_ok=True)
+        with open(self.catalog_path, 'w', encoding='utf-8') as catalog_file:
+            json.dump({'version': CATALOG_VERSION, 'records': records}, catalog_file)
+
+    def find_schedules(self):
+        """
+        :return: list of (train name, schedule path) of all schedules on disk, plain or compressed
+        """
+        schedules = []
+        for dir_name, _, file_list in os.walk(self.schedules_dir):
+            if SCHEDULE_FILE in map(plain_name, file_list):
+                schedules.append((train_name(dir_name), resolve_path(path.join(dir_name, SCHEDULE_FILE))))
+        return schedules
+
+    def refresh(self, workers=None):
+        """
+        Function to bring the catalog up to date with the schedules on disk. Schedules are only parsed again if their
+        size or modification time changed and their content hash differs from the catalog.
+        :param workers: number of processes parsing changed schedules, None for one per cpu core
+        :return: list of trains whose records were (re)built
+        """
+        updated_records = {}
+        stats = {}
+        touched = False
+        for train, schedule_path in self.find_schedules():
+            stat = os.stat(schedule_path)
+            record = self.records.get(train)
+            if record is not None and (record.size, record.mtime) != (stat.st_size, stat.st_mtime):
+                if record.hashes.get(SCHEDULE_FILE) == hash_file(schedule_path):
+                    record.size, record.mtime = stat.st_size, stat.st_mtime
+                    touched = True
+                else:
+                    record = None
+            updated_records[train] = record
+            stats[train] = stat
+
+        changed = [train for train, record in updated_records.items() if record is None]
+        for summary in ingest_schedules(changed, workers=workers):
+            updated_records[summary.train] = build_record(summary, stats[summary.train])
+
+        touched = touched or list(updated_records) != list(self.records)
+        self.records = updated_records
+        if changed or touched:
+            self.save()
+        return changed
+
+    def trains(self):
+        """
+        :return: list of all train names in the order they are found on disk
+        """
+        return list(self.records)
+
+    def get(self, train):
+        """
+        :param train: train name as string with format '<line> <journey_id>'
+        :return: JourneyRecord of the train
+        """
+        return self.records[train]
+
+    def get_line(self, line):
+        """
+        :param line: train line id
+        :return: list of JourneyRecord of all journeys of the line
+        """
+        return [record for record in self.records.values() if record.line == line]
+
+
+_catalog = {}
+
+
+def get_catalog(refresh=False, workers=None):
+    """
+    Function to get the shared catalog, refreshed against the files on disk on first use in a process
+    :param refresh: force a refresh, e.g. after schedules were edited during the run
+    :param workers: number of processes parsing changed schedules, None for one per cpu core
+    :return: ScheduleCatalog
+    """
+    catalog = _catalog.get('catalog')
+    if catalog is None:
+        catalog = _catalog['catalog'] = ScheduleCatalog()
+        refresh = True
+    if refresh:
+        catalog.refresh(workers)
+    return catalog
+
+
+if __name__ == '__main__':
+    print(get_catalog().trains())
@@ -0,0 +1,79 @@
+"""
+Library module holding a process wide store of parsed schedules, so that every schedule_esf.xml is parsed only once
+per run and shared by all modules asking for the same train
+"""
+from library.cache import LRUCache
+from library.train_schedule_parser import SCHEDULE_SECTIONS, Train
+
+# fully parsed ElementTrees take roughly six times the size of the xml file in memory, used as upper bound
+ELEMENT_TREE_SIZE_FACTOR = 6
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3  # in bytes, enough to keep all schedules of a full run
+
+
+class ScheduleStore:
+    """
+    Hands out one parsed Train object per (line, journey id) and evicts the least recently used trains when the
+    estimated memory of all parsed schedules exceeds the budget
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """
+        :param memory_budget: memory budget for all parsed schedules in bytes, None for no limit
+        """
+        self.trains = LRUCache(memory_budget)
+
+    def get_train(self, train_line, train_journey_id):
+        """
+        Function to get the parsed Train of given line and journey id, parsing the schedule on first access
+        :param train_line: train line id
+        :param train_journey_id: train journey id
+        :return: Train object
+        """
+        key = (train_line, train_journey_id)
+        train = self.trains.get(key)
+        if train is None:
+            # trajectories are only parsed once a caller asks for them
+            train = Train(train_line, train_journey_id, sections=SCHEDULE_SECTIONS)
+            self.trains.put(key, train, train.schedule_size * ELEMENT_TREE_SIZE_FACTOR)
+        return train
+
+    def set_memory_budget(self, memory_budget):
+        """
+        Function to change the memory budget, evicting trains if necessary
+        :param memory_budget: memory budget for all parsed schedules in bytes, None for no limit
+        """
+        self.trains.resize(memory_budget)
+
+    def invalidate(self, train_line, train_journey_id):
+        """
+        Function to drop a parsed train, e.g. after its schedule file has changed
+        """
+        self.trains.pop((train_line, train_journey_id))
+
+    def clear(self):
+        self.trains.clear()
+
+    def stats(self):
+        """
+        :return: dict with hits, misses, evictions, number of parsed trains and their estimated memory in bytes
+        """
+        return self.trains.stats()
+
+
+SCHEDULE_STORE = ScheduleStore()
+
+
+def get_train(train_line, train_journey_id):
+    """
+    Function to get the shared parsed Train of given line and journey id
+    :param train_line: train line id
+    :param train_journey_id: train journey id
+    :return: Train object
+    """
+    return SCHEDULE_STORE.get_train(train_line, train_journey_id)
+
+
+if __name__ == '__main__':
+    for _ in range(3):
+        get_train('RE50', '2512')
+    print(SCHEDULE_STORE.stats())
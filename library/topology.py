@@ -0,0 +1,193 @@
+"""
+Library module with a precomputed topology index of the infrastructure in Spurplanbetriebsstellen_ZDBU-ZDW.xml.
+The index is built in one walk over all Betriebsstellen, Spurplanabschnitte and nodes and gives constant time lookups
+of a node by ID (and tag) and of the preceding and following Hauptsignal / Fstr-Zugschlussstelle of every node within
+its Spurplanabschnitt. It is serialized to output/cache and only rebuilt when the infrastructure file changes.
+"""
+import json
+from os import makedirs, path, replace
+
+from library.compression import resolve_path
+from library.ingestion import hash_file
+from library.parser import spurplan_betriebsstellen_path
+from library.schedule_catalog import CACHE_DIR
+from library.utils import BETRIEBSSTELLEN, get_absolute_kilometrages
+
+TOPOLOGY_PATH = path.join(CACHE_DIR, 'topology.json')
+TOPOLOGY_VERSION = 1
+
+DIRECTIONS = ('F', 'S')
+HAUPTSIGNAL = 'Hauptsignal'
+FSTR = 'Fstr'
+# kind of signal -> tag prefixes of the nodes marking it, completed by the direction
+KIND_TAGS = {
+    HAUPTSIGNAL: ('Hauptsignal',),
+    FSTR: ('FstrZugschlussstelle', 'Hauptsignal'),
+}
+
+
+def neighbour_key(kind, direction):
+    return kind + direction
+
+
+class TopologyIndex:
+    """
+    Flat table of all infrastructure nodes in document order. Every node is referred to by its index in the table.
+    """
+
+    def __init__(self, source_hash, tags, ids, kilometrages, locations, previous, following):
+        """
+        :param source_hash: sha1 of the infrastructure file the index was built from
+        :param tags: tag of every node
+        :param ids: ID of every node as string
+        :param kilometrages: absolute kilometrage of every node
+        :param locations: (betriebsstelle, spurplanabschnitt, node) position of every node in the xml tree
+        :param previous: neighbour key -> index of the last marking node at or before every node, -1 for none
+        :param following: neighbour key -> index of the first marking node at or after every node, -1 for none
+        """
+        self.source_hash = source_hash
+        self.tags = tags
+        self.ids = ids
+        self.kilometrages = kilometrages
+        self.locations = locations
+        self.previous = previous
+        self.following = following
+        self.by_id = {node_id: index for index, node_id in enumerate(ids)}
+        self.betriebsstellen = None  # xml tree, set by get_topology
+
+    def to_dict(self):
+        return dict(version=TOPOLOGY_VERSION, source_hash=self.source_hash, tags=self.tags, ids=self.ids,
+                    kilometrages=self.kilometrages, locations=self.locations, previous=self.previous,
+                    following=self.following)
+
+    def save(self, topology_path=TOPOLOGY_PATH):
+        makedirs(path.dirname(topology_path), exist_ok=True)
+        with open(topology_path + '.tmp', 'w', encoding='utf-8') as topology_file:
+            json.dump(self.to_dict(), topology_file)
+        # replace only when complete, readers never see a half written index
+        replace(topology_path + '.tmp', topology_path)
+
+    def node_index(self, node_id, tag=None):
+        """
+        :param node_id: ID of the node as int or string
+        :param tag: tag the node must have, None for any tag
+        :return: index of the node or None if there is no such node
+        """
+        index = self.by_id.get(str(node_id))
+        if index is None or (tag is not None and self.tags[index] != tag):
+            return None
+        return index
+
+    def find_node(self, node_id):
+        """
+        :param node_id: ID of the node as int or string
+        :return: node element of the infrastructure tree or None
+        """
+        index = self.node_index(node_id)
+        if index is None:
+            return None
+        betriebsstelle, spurplan_abschnitt, node = self.locations[index]
+        return self.betriebsstellen[betriebsstelle][1][spurplan_abschnitt][1][node]
+
+    def get_previous(self, index, kind, direction):
+        """
+        :return: index of the last node of the kind and direction at or before the given node in its
+        Spurplanabschnitt, None if there is none
+        """
+        neighbour = self.previous[neighbour_key(kind, direction)][index]
+        return None if neighbour < 0 else neighbour
+
+    def get_following(self, index, kind, direction):
+        """
+        :return: index of the first node of the kind and direction at or after the given node in its
+        Spurplanabschnitt, None if there is none
+        """
+        neighbour = self.following[neighbour_key(kind, direction)][index]
+        return None if neighbour < 0 else neighbour
+
+    def position(self, index):
+        """
+        :return: ID as string and absolute kilometrage of the node
+        """
+        return self.ids[index], self.kilometrages[index]
+
+
+def build_topology(betriebsstellen, source_hash=None):
+    """
+    Function to build the topology index in one walk over the infrastructure tree
+    :param betriebsstellen: Spurplanbetriebsstellen element (see library.parser.get_spurplan_betriebsstellen)
+    :param source_hash: sha1 of the infrastructure file, stored to detect outdated indexes
+    :return: TopologyIndex
+    """
+    tags, ids, locations, abschnitte = [], [], [], []
+    for betriebsstelle_index, betriebsstelle in enumerate(betriebsstellen):
+        for abschnitt_index, spurplan_abschnitt in enumerate(betriebsstelle[1]):
+            start = len(tags)
+            for node_index, node in enumerate(spurplan_abschnitt[1]):
+                tags.append(node.tag)
+                ids.append(node.find('ID').text)
+                locations.append([betriebsstelle_index, abschnitt_index, node_index])
+            abschnitte.append((start, len(tags)))
+    kilometrages = get_absolute_kilometrages(ids).tolist()
+
+    previous, following = {}, {}
+    for kind, prefixes in KIND_TAGS.items():
+        for direction in DIRECTIONS:
+            marking_tags = {prefix + direction for prefix in prefixes}
+            key = neighbour_key(kind, direction)
+            previous[key] = [-1] * len(tags)
+            following[key] = [-1] * len(tags)
+            for start, end in abschnitte:
+                last = -1
+                for index in range(start, end):
+                    if tags[index] in marking_tags:
+                        last = index
+                    previous[key][index] = last
+                last = -1
+                for index in reversed(range(start, end)):
+                    if tags[index] in marking_tags:
+                        last = index
+                    following[key][index] = last
+    return TopologyIndex(source_hash, tags, ids, kilometrages, locations, previous, following)
+
+
+def load_topology(topology_path=TOPOLOGY_PATH, source_hash=None):
+    """
+    :return: serialized TopologyIndex, None if there is none or it was built from another infrastructure file
+    """
+    try:
+        with open(topology_path, 'r', encoding='utf-8') as topology_file:
+            topology = json.load(topology_file)
+    except (OSError, ValueError):
+        return None
+    if topology.pop('version', None) != TOPOLOGY_VERSION or topology['source_hash'] != source_hash:
+        return None
+    return TopologyIndex(**topology)
+
+
+_topology = {}
+
+
+def get_topology(refresh=False):
+    """
+    Function to get the shared topology index, loaded from disk or built and saved on first use in a process
+    :param refresh: check the infrastructure file again, e.g. after it was edited during the run
+    :return: TopologyIndex
+    """
+    topology = _topology.get('topology')
+    if topology is None or refresh:
+        source_hash = hash_file(resolve_path(spurplan_betriebsstellen_path))
+        topology = load_topology(source_hash=source_hash)
+        if topology is None:
+            topology = build_topology(BETRIEBSSTELLEN, source_hash)
+            topology.save()
+        topology.betriebsstellen = BETRIEBSSTELLEN
+        _topology['topology'] = topology
+    return topology
+
+
+if __name__ == '__main__':
+    index = get_topology()
+    hauptsignal = index.node_index('162')
+    print(index.tags[hauptsignal], index.position(hauptsignal))
+    print(index.position(index.get_previous(hauptsignal, FSTR, 'S')))
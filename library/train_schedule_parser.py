@@ -1,64 +1,154 @@
 """
 Library module, that parses complete schedule_esf.xml of each train as Train object and the tags used in the file can be
 called using functions of Train object
+
+A Train can be restricted to a subset of the link sections. Sections that are left out are loaded on first access of
+their getter, so schedule-only workloads never build the thousands of trajectory records of a link.
 """
+from io import BytesIO
 from os import path
 from pathlib import Path
+from threading import Lock
 from xml.etree import ElementTree as ET
 
+from library.compression import open_resource, resolve_path
 from library.model_trains import get_train_total_length
 
+SECTIONS = ('Origin', 'trajectory', 'Betriebsstellenfahrwege', 'Verlauf', 'Destination')
+SCHEDULE_SECTIONS = ('Origin', 'Betriebsstellenfahrwege', 'Verlauf', 'Destination')
+
+TRAJECTORY_START = b'<trajectory>'
+TRAJECTORY_END = b'</trajectory>'
+
+
+def cut_trajectories(data):
+    """
+    Function to remove all trajectory sections from the raw content of a schedule_esf.xml. The trajectory is the bulk
+    of every schedule and never nested, so it can be cut out before the remaining schedule is parsed
+    :param data: content of the schedule file as bytes
+    :return: content without trajectory sections as bytes
+    """
+    parts = []
+    position = 0
+    start = data.find(TRAJECTORY_START)
+    while start != -1:
+        end = data.find(TRAJECTORY_END, start)
+        if end == -1:
+            raise ValueError(f'trajectory at byte {start} has no closing tag')
+        end += len(TRAJECTORY_END)
+        parts.append(data[position:start].rstrip())  # the indentation in front of the section goes with it
+        position = end
+        start = data.find(TRAJECTORY_START, position)
+    parts.append(data[position:])
+    return b''.join(parts)
+
 
 class Train:
     root_dir = path.dirname(Path(__file__).parent)
 
-    def __init__(self, train_line, train_journey_id):
+    def __init__(self, train_line, train_journey_id, sections=None):
+        """
+        :param train_line: train line id
+        :param train_journey_id: train journey id
+        :param sections: tags of the link sections to build right away (see SECTIONS), None for all sections
+        """
         self.train_line = train_line
         self.train_journey_id = train_journey_id
-        schedule_path = path.join(Train.root_dir,
-                                  Path('resources/schedules/', train_line, train_journey_id, 'schedule_esf.xml'))
-        self.root_schedule = ET.parse(schedule_path).getroot()
+        # plain schedule_esf.xml or its compressed variant
+        self.schedule_path = resolve_path(path.join(
+            Train.root_dir, Path('resources/schedules/', train_line, train_journey_id, 'schedule_esf.xml')))
+        self.loaded_sections = set(SECTIONS if sections is None else sections)
+        with open_resource(self.schedule_path) as schedule_file:
+            self.root_schedule = self._parse_sections(schedule_file, self.loaded_sections)
+            self.schedule_size = schedule_file.tell()  # size of the (decompressed) xml in bytes
         self.train_length = get_train_total_length(train_line)
+        self._section_lock = Lock()  # threads sharing the train load a left out section only once
 
-    def get_origin(self):
+    @staticmethod
+    def _parse_sections(schedule_file, sections):
+        """
+        Function to build the schedule tree with only the given link sections. The file is decompressed while it is
+        parsed, only without trajectories it is read as a whole to cut them out before parsing
+        :param schedule_file: binary file object of the schedule, read to its end
+        :param sections: tags of the link sections to keep
+        :return: root of the schedule tree
+        """
+        source = schedule_file
+        if 'trajectory' not in sections:
+            source = BytesIO(cut_trajectories(schedule_file.read()))
+        if set(SECTIONS) - {'trajectory'} <= set(sections):
+            return ET.parse(source).getroot()
+
+        depth = 0
+        links = []
+        root = None
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if depth == 0:
+                    root = element
+                elif depth == 1:
+                    links.append(element)
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 2 and element.tag in SECTIONS and element.tag not in sections:
+                links[-1].remove(element)
+        return root
+
+    def _load_section(self, section):
+        """
+        Function to add a link section, which was left out at construction time, to the schedule tree
+        :param section: tag of the link section
+        """
+        depth = 0
+        link_index = -1
+        with open_resource(self.schedule_path) as schedule_file:
+            for event, element in ET.iterparse(schedule_file, events=('start', 'end')):
+                if event == 'start':
+                    if depth == 1:
+                        link_index += 1
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 2 and element.tag == section:
+                    link = self.root_schedule[link_index]
+                    position = SECTIONS.index(section)
+                    index = 0
+                    while index < len(link) and (link[index].tag not in SECTIONS or
+                                                 SECTIONS.index(link[index].tag) < position):
+                        index += 1
+                    link.insert(index, element)
+                elif depth == 2:
+                    element.clear()  # keep only the requested section in memory while parsing
+        self.loaded_sections.add(section)
+
+    def _get_section(self, section):
+        if section not in self.loaded_sections:
+            with self._section_lock:
+                # another thread may have loaded the section while this one was waiting
+                if section not in self.loaded_sections:
+                    self._load_section(section)
         link_count = 0
-        origin = {}
+        sections = {}
         for link in self.root_schedule:  # for multiple links
             link_count += 1
-            origin[link_count] = link.find('Origin')
-        return origin
+            sections[link_count] = link.find(section)
+        return sections
+
+    def get_origin(self):
+        return self._get_section('Origin')
 
     def get_trajectory(self):
-        link_count = 0
-        trajectory = {}
-        for link in self.root_schedule:  # for multiple links
-            link_count += 1
-            trajectory[link_count] = link.find('trajectory')
-        return trajectory
+        return self._get_section('trajectory')
 
     def get_betriebsstellenfahrwege(self):
-        link_count = 0
-        betriebsstellenfahrwege = {}
-        for link in self.root_schedule:  # for multiple links
-            link_count += 1
-            betriebsstellenfahrwege[link_count] = link.find('Betriebsstellenfahrwege')
-        return betriebsstellenfahrwege
+        return self._get_section('Betriebsstellenfahrwege')
 
     def get_verlauf(self):
-        link_count = 0
-        verlauf = {}
-        for link in self.root_schedule:  # for multiple links
-            link_count += 1
-            verlauf[link_count] = link.find('Verlauf')
-        return verlauf
+        return self._get_section('Verlauf')
 
     def get_destination(self):
-        link_count = 0
-        destination = {}
-        for link in self.root_schedule:  # for multiple links
-            link_count += 1
-            destination[link_count] = link.find('Destination')
-        return destination
+        return self._get_section('Destination')
 
 
 # examples of creating train objects and getting their values from XML files
@@ -71,3 +161,8 @@ if __name__ == '__main__':
     print(test_train_object.get_trajectory())
     print(test_train_object.get_destination())
     print(test_train_object.root_schedule)
+
+    # schedule-only train, the trajectory is parsed on the first call of get_trajectory
+    test_train_object = Train(train_line='RE50', train_journey_id='2512', sections=SCHEDULE_SECTIONS)
+    print(test_train_object.get_origin())
+    print(test_train_object.get_trajectory())
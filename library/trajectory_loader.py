@@ -0,0 +1,167 @@
+"""
+Library module to load train trajectories into contiguous NumPy columns, either in one bulk call from the
+trajectory.csv of a journey or from the <record> elements of schedule_esf.xml, and to cross-check both sources
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+from os import path
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from elements.trajectory import EPOCH
+from library.schedule_store import get_train
+
+package_root_dir = path.dirname(Path(__file__).parent)
+
+
+# array name -> column of trajectory.csv / tag of <record>
+FLOAT_COLUMNS = {
+    'xs': 'Lower_xs',
+    'vs': 'Lower_vs',
+    'ts': 'Lower_ts',
+    'upper_absolute_ts': 'Upper_absolute_ts',
+}
+TIMESTAMP_COLUMN = 'Lower_timestamps'
+
+_csv_agrees = {}  # (line, journey id) -> result of the cross-check of trajectory.csv
+
+
+@dataclass
+class TrajectoryArrays:
+    """
+    Trajectory of one link as columns: xs in m, vs in km/h, ts and upper_absolute_ts in s and timestamps in ms since
+    epoch (naive local time, as written in the schedule)
+    """
+    xs: np.ndarray
+    vs: np.ndarray
+    ts: np.ndarray
+    upper_absolute_ts: np.ndarray
+    timestamps: np.ndarray
+
+    def __len__(self):
+        return len(self.xs)
+
+    def time_at(self, index):
+        """
+        :return: timestamp of the given record as 'datetime.datetime'
+        """
+        return EPOCH + timedelta(milliseconds=int(self.timestamps[index]))
+
+
+def _to_float_array(texts):
+    values = np.asarray(texts, dtype=str)
+    if np.char.find(values, ',').max(initial=-1) >= 0:  # decimal comma as in the infrastructure files
+        values = np.char.replace(values, ',', '.')
+    return values.astype(np.float64)
+
+
+def _to_timestamp_array(texts):
+    return np.asarray(texts, dtype='datetime64[ms]').astype(np.int64)
+
+
+def records_to_arrays(records):
+    """
+    Function to convert the <record> elements of one link into trajectory columns
+    :param records: <records> node of a link in schedule_esf.xml
+    :return: TrajectoryArrays
+    """
+    columns = {name: _to_float_array([record.findtext(tag) for record in records])
+               for name, tag in FLOAT_COLUMNS.items()}
+    columns['timestamps'] = _to_timestamp_array([record.findtext(TIMESTAMP_COLUMN) for record in records])
+    return TrajectoryArrays(**columns)
+
+
+def get_trajectory_arrays(train_line, train_journey_id):
+    """
+    Function to get the trajectory columns of every link from schedule_esf.xml
+    :param train_line: train line id
+    :param train_journey_id: train journey id
+    :return: list of TrajectoryArrays, one per link
+    """
+    trajectory = get_train(train_line, train_journey_id).get_trajectory()
+    return [records_to_arrays(trajectory_node.find('records')) for trajectory_node in trajectory.values()]
+
+
+def csv_path(train_line, train_journey_id, file_name='trajectory.csv'):
+    return path.join(package_root_dir, Path('resources/schedules/'), train_line, train_journey_id, file_name)
+
+
+def load_csv_trajectory(train_line, train_journey_id, file_name='trajectory.csv'):
+    """
+    Function to read the trajectory csv of a journey in one bulk call. The file holds all links one after another,
+    a new link starts wherever the driven distance drops back
+    :param train_line: train line id
+    :param train_journey_id: train journey id
+    :param file_name: name of the csv file in the journey directory
+    :return: list of TrajectoryArrays, one per link
+    """
+    usecols = list(FLOAT_COLUMNS.values()) + [TIMESTAMP_COLUMN]
+    data_frame = pd.read_csv(csv_path(train_line, train_journey_id, file_name), usecols=usecols,
+                             dtype={column: np.float64 for column in FLOAT_COLUMNS.values()})
+    columns = {name: data_frame[column].to_numpy(dtype=np.float64) for name, column in FLOAT_COLUMNS.items()}
+    columns['timestamps'] = _to_timestamp_array(data_frame[TIMESTAMP_COLUMN].to_numpy(dtype=str))
+
+    link_starts = np.flatnonzero(np.diff(columns['xs']) < 0) + 1
+    bounds = np.concatenate(([0], link_starts, [len(data_frame)]))
+    return [TrajectoryArrays(**{name: values[start:end] for name, values in columns.items()})
+            for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def cross_check(train_line, train_journey_id, sample_size=50, file_name='trajectory.csv', rtol=1e-6):
+    """
+    Function to compare a sample of the csv trajectory with the records of schedule_esf.xml
+    :param train_line: train line id
+    :param train_journey_id: train journey id
+    :param sample_size: number of evenly spread records per link to compare
+    :param file_name: name of the csv file in the journey directory
+    :param rtol: relative tolerance for float columns
+    :return: list of mismatch descriptions, empty if both sources agree
+    """
+    csv_links = load_csv_trajectory(train_line, train_journey_id, file_name)
+    xml_links = get_trajectory_arrays(train_line, train_journey_id)
+    if len(csv_links) != len(xml_links):
+        return [f'{len(csv_links)} links in csv, {len(xml_links)} links in xml']
+
+    mismatches = []
+    for link_id, (csv_link, xml_link) in enumerate(zip(csv_links, xml_links)):
+        if len(csv_link) != len(xml_link):
+            mismatches.append(f'link {link_id}: {len(csv_link)} records in csv, {len(xml_link)} records in xml')
+            continue
+        sample = np.unique(np.linspace(0, len(xml_link) - 1, num=min(sample_size, len(xml_link)), dtype=np.int64))
+        for name in list(FLOAT_COLUMNS) + ['timestamps']:
+            csv_values = getattr(csv_link, name)[sample]
+            xml_values = getattr(xml_link, name)[sample]
+            if name == 'timestamps':
+                equal = csv_values == xml_values
+            else:
+                equal = np.isclose(csv_values, xml_values, rtol=rtol)
+            if not equal.all():
+                first = sample[np.argmin(equal)]
+                mismatches.append(f'link {link_id}: {name} differs at record {first} '
+                                  f'({getattr(csv_link, name)[first]} != {getattr(xml_link, name)[first]})')
+    return mismatches
+
+
+def load_trajectory(train_line, train_journey_id, prefer_csv=True):
+    """
+    Function to get the trajectory columns of every link, read from trajectory.csv if it exists and agrees with the
+    schedule, otherwise converted from the records of schedule_esf.xml
+    :param train_line: train line id
+    :param train_journey_id: train journey id
+    :param prefer_csv: try the csv file first
+    :return: list of TrajectoryArrays, one per link
+    """
+    key = (train_line, train_journey_id)
+    if prefer_csv and key not in _csv_agrees:
+        _csv_agrees[key] = path.exists(csv_path(train_line, train_journey_id)) \
+                           and not cross_check(train_line, train_journey_id)
+    if prefer_csv and _csv_agrees[key]:
+        return load_csv_trajectory(train_line, train_journey_id)
+    return get_trajectory_arrays(train_line, train_journey_id)
+
+
+if __name__ == '__main__':
+    for mismatch in cross_check('RE50', '2512'):
+        print(mismatch)
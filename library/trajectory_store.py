@@ -0,0 +1,167 @@
+"""
+Library module with a flat binary store of all link trajectories. The build step packs the trajectory columns of every
+journey into one file (one contiguous column after another) plus an offsets table keyed by train and link. Readers open
+the file with numpy.memmap, so worker processes share the page cache instead of parsing and copying the records.
+
+The store is built by rewrite_all_occupancy_times (modules/occupancy_times.py) or by running this module. Trains whose
+schedule changed since the build are read from their schedule_esf.xml until the store is built again.
+"""
+import json
+import os
+from os import makedirs, path, replace
+
+import numpy as np
+
+from library.ingestion import ingest_schedules
+from library.schedule_catalog import CACHE_DIR, SCHEDULE_FILE, get_catalog
+from library.trajectory_loader import TrajectoryArrays, get_trajectory_arrays
+
+STORE_PATH = path.join(CACHE_DIR, 'trajectories.bin')
+INDEX_PATH = path.join(CACHE_DIR, 'trajectories.json')
+STORE_VERSION = 1
+
+# column name -> dtype, all columns have 8 byte items
+COLUMNS = {
+    'xs': np.float64,
+    'vs': np.float64,
+    'ts': np.float64,
+    'upper_absolute_ts': np.float64,
+    'timestamps': np.int64,
+}
+ITEM_SIZE = 8
+
+
+def link_key(train, link_id):
+    """
+    :param train: train as string with format '<line> <journey_id>'
+    :param link_id: index of the link, starting at 0
+    :return: key of the link in the offsets table
+    """
+    return f'{train}/{link_id}'
+
+
+def build_trajectory_store(trains=None, store_path=STORE_PATH, index_path=INDEX_PATH, workers=None):
+    """
+    Function to pack the trajectories of the given trains into the binary store
+    :param trains: list of trains as string with format '<line> <journey_id>', None for all trains of the catalog
+    :param store_path: path of the binary file
+    :param index_path: path of the offsets table
+    :param workers: number of processes parsing the schedules, None for one per cpu core
+    :return: number of records written
+    """
+    trains = get_catalog(workers=workers).trains() if trains is None else trains
+
+    links = {}
+    hashes = {}
+    chunks = {name: [] for name in COLUMNS}
+    count = 0
+    for summary in ingest_schedules(trains, workers=workers, include_trajectories=True):
+        hashes[summary.train] = summary.schedule_hash
+        for link_id, trajectory in enumerate(summary.trajectories):
+            links[link_key(summary.train, link_id)] = [count, count + len(trajectory)]
+            count += len(trajectory)
+            for name, dtype in COLUMNS.items():
+                chunks[name].append(np.asarray(getattr(trajectory, name), dtype=dtype))
+
+    makedirs(path.dirname(store_path), exist_ok=True)
+    with open(store_path + '.tmp', 'wb') as store_file:
+        for name in COLUMNS:
+            if count:
+                np.concatenate(chunks[name]).tofile(store_file)
+    index = {'version': STORE_VERSION, 'count': count, 'columns': list(COLUMNS), 'links': links, 'hashes': hashes}
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file)
+    # swap both files only when they are complete, readers never see a half written store
+    replace(store_path + '.tmp', store_path)
+    replace(index_path + '.tmp', index_path)
+    return count
+
+
+class TrajectoryStore:
+    """
+    Read-only, memory mapped view on the binary trajectory store
+    """
+
+    def __init__(self, store_path=STORE_PATH, index_path=INDEX_PATH):
+        with open(index_path, 'r', encoding='utf-8') as index_file:
+            index = json.load(index_file)
+        if index.get('version') != STORE_VERSION:
+            raise ValueError('trajectory store has an outdated format, rebuild it with build_trajectory_store')
+        self.links = index['links']
+        self.hashes = index['hashes']
+        count = index['count']
+        self.columns = {}
+        for position, name in enumerate(index['columns']):
+            if count:
+                self.columns[name] = np.memmap(store_path, dtype=COLUMNS[name], mode='r',
+                                               offset=position * count * ITEM_SIZE, shape=(count,))
+            else:
+                self.columns[name] = np.empty(0, dtype=COLUMNS[name])
+
+    def is_current(self, train, schedule_hash):
+        """
+        :return: True if the stored trajectories of the train were built from the schedule with the given hash
+        """
+        return self.hashes.get(train) == schedule_hash
+
+    def get(self, train, link_id):
+        """
+        Function to get the trajectory of one link without copying it
+        :param train: train as string with format '<line> <journey_id>'
+        :param link_id: index of the link, starting at 0
+        :return: TrajectoryArrays backed by the memory map
+        """
+        start, end = self.links[link_key(train, link_id)]
+        return TrajectoryArrays(**{name: column[start:end] for name, column in self.columns.items()})
+
+    def get_train(self, train):
+        """
+        :return: list of TrajectoryArrays for all links of the train
+        """
+        trajectories = []
+        while link_key(train, len(trajectories)) in self.links:
+            trajectories.append(self.get(train, len(trajectories)))
+        return trajectories
+
+
+_store = {}
+
+
+def get_trajectory_store():
+    """
+    Function to open the shared store once per process, and again whenever the store is rebuilt
+    :return: TrajectoryStore or None if the store has not been built (or has an outdated format)
+    """
+    try:
+        stamp = os.stat(INDEX_PATH).st_mtime_ns
+    except OSError:
+        return None
+    cached = _store.get('store')
+    if cached is None or cached[0] != stamp:
+        try:
+            store = TrajectoryStore()
+        except (OSError, ValueError):
+            store = None
+        cached = _store['store'] = (stamp, store)
+    return cached[1]
+
+
+def get_link_trajectories(train_line, train_journey_id):
+    """
+    Function to get the trajectory columns of every link, from the memory mapped store if it holds an up to date copy
+    of the journey, otherwise from schedule_esf.xml
+    :param train_line: train line id
+    :param train_journey_id: train journey id
+    :return: list of TrajectoryArrays, one per link
+    """
+    store = get_trajectory_store()
+    train = train_line + ' ' + train_journey_id
+    if store is not None:
+        record = get_catalog().records.get(train)
+        if record is not None and store.is_current(train, record.hashes[SCHEDULE_FILE]):
+            return store.get_train(train)
+    return get_trajectory_arrays(train_line, train_journey_id)
+
+
+if __name__ == '__main__':
+    print(f'{build_trajectory_store()} records written to {STORE_PATH}')
@@ -2,11 +2,82 @@
 Utilities module to cope with schedule file and its characteristics
 """
 import xml.etree.ElementTree
+from math import isnan
+
+import numpy as np
 
 from library.parser import get_spurplan_betriebsstellen
 
 BETRIEBSSTELLEN = get_spurplan_betriebsstellen()
 
+MAINLINE = 0
+SECTION_ONE = 1
+SECTION_TWO = 2
+# section -> (sign, offset), the absolute kilometrage of a node is offset + sign * Kilometrierung
+SECTION_OFFSETS = {
+    MAINLINE: (1.0, 0.0),
+    SECTION_ONE: (1.0, 11.67),
+    SECTION_TWO: (-1.0, 28.499),
+}
+# (first node ID, last node ID, section) of all nodes that are not on the mainline
+SECTION_RANGES = (
+    (26, 26, SECTION_ONE), (66, 73, SECTION_ONE),
+    (168, 170, SECTION_TWO), (175, 175, SECTION_TWO), (217, 223, SECTION_TWO), (250, 250, SECTION_TWO),
+    (263, 268, SECTION_TWO), (270, 270, SECTION_TWO), (282, 287, SECTION_TWO), (297, 297, SECTION_TWO),
+    (299, 305, SECTION_TWO), (328, 328, SECTION_TWO), (330, 331, SECTION_TWO), (353, 358, SECTION_TWO),
+    (360, 360, SECTION_TWO), (382, 385, SECTION_TWO), (397, 397, SECTION_TWO),
+)
+
+
+def parse_kilometrierung(kilometrierung: str) -> float:
+    """
+    :param kilometrierung: Kilometrierung with decimal comma as in the xml files, e.g. '12,345'
+    :return: Kilometrierung as float
+    """
+    return float(str.replace(kilometrierung, ",", "."))
+
+
+def section_of_id(node_id: int) -> int:
+    """
+    :param node_id: ID of a node
+    :return: section of the node (MAINLINE, SECTION_ONE or SECTION_TWO)
+    """
+    for first_id, last_id, section in SECTION_RANGES:
+        if first_id <= node_id <= last_id:
+            return section
+    return MAINLINE
+
+
+def build_kilometrage_table(betriebsstellen: xml.etree.ElementTree.ElementTree):
+    """
+    Builds the linear referencing table of all nodes of the infrastructure
+
+    :param betriebsstellen: Spurplanbetriebsstellen tag of the infrastructure file
+    :return: array with the absolute kilometrage of every node at the index of its ID, NaN for unknown IDs
+    """
+    ids = []
+    kilometrierungen = []
+    for betriebsstelle in betriebsstellen:
+        for spurplan_abschnitt in betriebsstelle[1]:
+            for node in spurplan_abschnitt[1]:
+                ids.append(int(node.find('ID').text))
+                kilometrierungen.append(parse_kilometrierung(node.find('Kilometrierung').text))
+    ids = np.asarray(ids, dtype=np.int64)
+
+    sections = np.full(ids.max(initial=0) + 1, MAINLINE, dtype=np.int64)
+    for first_id, last_id, section in SECTION_RANGES:
+        sections[first_id:last_id + 1] = section
+    signs = np.array([SECTION_OFFSETS[section][0] for section in sorted(SECTION_OFFSETS)])
+    offsets = np.array([SECTION_OFFSETS[section][1] for section in sorted(SECTION_OFFSETS)])
+
+    table = np.full(len(sections), np.nan)
+    table[ids] = offsets[sections[ids]] + signs[sections[ids]] * np.asarray(kilometrierungen)
+    return table
+
+
+ABSOLUTE_KILOMETRAGE = build_kilometrage_table(BETRIEBSSTELLEN)
+_absolute_kilometrage = ABSOLUTE_KILOMETRAGE.tolist()  # for scalar lookups without numpy scalars
+
 
 def determine_direction(verlauf_node: xml.etree.ElementTree.ElementTree):
     """
@@ -43,12 +114,26 @@ def get_absolute_kilometrage(node: xml.etree.ElementTree.ElementTree):
     :param node: The node for which to get the kilometrage
     :return: the kilometrage of that node
     """
-    node_kilometrage = float(str.replace(node.find('Kilometrierung').text, ",", "."))
-    if is_on_section_one(node):
-        node_kilometrage = node_kilometrage + 11.67
-    elif is_on_section_two(node):
-        node_kilometrage = 28.499 - node_kilometrage
-    return node_kilometrage
+    node_id = int(node.find('ID').text)
+    if 0 <= node_id < len(_absolute_kilometrage) and not isnan(_absolute_kilometrage[node_id]):
+        return _absolute_kilometrage[node_id]
+    # node that is not part of the infrastructure file
+    sign, offset = SECTION_OFFSETS[section_of_id(node_id)]
+    return offset + sign * parse_kilometrierung(node.find('Kilometrierung').text)
+
+
+def get_absolute_kilometrages(node_ids) -> np.ndarray:
+    """
+    returns the absolute kilometrages of many nodes at once, e.g. of all IDs of a Verlauf
+
+    :param node_ids: IDs of the nodes as ints or strings
+    :return: array with the kilometrage of every node, NaN for nodes that are not part of the infrastructure file
+    """
+    node_ids = np.asarray(node_ids).astype(np.int64)
+    kilometrages = np.full(len(node_ids), np.nan)
+    known = (node_ids >= 0) & (node_ids < len(ABSOLUTE_KILOMETRAGE))
+    kilometrages[known] = ABSOLUTE_KILOMETRAGE[node_ids[known]]
+    return kilometrages
 
 
 def is_on_section_one(node: xml.etree.ElementTree.ElementTree):
@@ -58,8 +143,7 @@ def is_on_section_one(node: xml.etree.ElementTree.ElementTree):
     :param node: the node in question
     :return: true if on the first section
     """
-    node_id = int(node.find('ID').text)
-    return 73 >= node_id >= 66 or node_id == 26
+    return section_of_id(int(node.find('ID').text)) == SECTION_ONE
 
 
 def is_on_section_two(node: xml.etree.ElementTree.ElementTree):
@@ -69,11 +153,7 @@ def is_on_section_two(node: xml.etree.ElementTree.ElementTree):
     :param node: the node in question
     :return: true if on the second section
     """
-    node_id = int(node.find('ID').text)
-    condition_section_two = (
-            168 <= node_id <= 170 or node_id == 175 or 217 <= node_id <= 223 or node_id == 250 or 263 <= node_id <= 268 or node_id == 270 or 282 <= node_id <= 287 or node_id == 297 or 299 <= node_id <= 305 or node_id == 328 or 330 <= node_id <= 331 or 353 <= node_id <= 358 or node_id == 360 or 382 <= node_id <= 385 or node_id == 397)
-
-    return condition_section_two
+    return section_of_id(int(node.find('ID').text)) == SECTION_TWO
 
 
 def find_node_by_id(node_id: int) -> xml.etree.ElementTree.ElementTree:
@@ -82,11 +162,6 @@ def find_node_by_id(node_id: int) -> xml.etree.ElementTree.ElementTree:
     :param node_id: The id parameter of the node.
     :return: The node element with the id.
     """
-    for betriebsstelle in BETRIEBSSTELLEN:
-        spurplan_abschnitte = betriebsstelle[1]
-        for spurplan_abschnitt in spurplan_abschnitte:
-            spurplan_knoten = spurplan_abschnitt[1]
-            for node in spurplan_knoten:
-                if node.find('ID').text == node_id:
-                    return node
-    return None
+    # the topology index is built from BETRIEBSSTELLEN of this module, hence imported on use
+    from library.topology import get_topology
+    return get_topology().find_node(node_id)
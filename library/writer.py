@@ -1,13 +1,66 @@
 """
 Library module for writing files in xml
+
+Elements are streamed to the file handle one line at a time, so writing a tree needs no second copy of it as string or
+DOM. The indented output is the same as the former minidom round-trip (toprettyxml with two spaces), including text
+next to child elements and the tails of elements.
 """
+import gzip
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
+
+XML_DECLARATION = '<?xml version="1.0" ?>\n'
+INDENT = '  '
+
+# escaping of minidom, which is applied to text and attribute values alike
+_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '"': '&quot;', '>': '&gt;'})
+
+
+def _escape(text):
+    return text.translate(_ESCAPES)
+
+
+def _text(text):
+    # text nodes go through an xml parser in the minidom round-trip, which normalizes line endings
+    return _escape(text.replace('\r\n', '\n').replace('\r', '\n'))
+
+
+def _write_element(element, file, level=0):
+    # the nodes of minidom: text, then every child followed by its tail
+    nodes = [element.text] if element.text else []
+    for child in element:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+
+    indent = INDENT * level
+    attributes = ''.join(f' {name}="{_escape(value)}"' for name, value in element.attrib.items())
+    if not nodes:
+        file.write(f'{indent}<{element.tag}{attributes}/>\n')
+    elif len(nodes) == 1 and isinstance(nodes[0], str):
+        file.write(f'{indent}<{element.tag}{attributes}>{_text(nodes[0])}</{element.tag}>\n')
+    else:
+        file.write(f'{indent}<{element.tag}{attributes}>\n')
+        for node in nodes:
+            if isinstance(node, str):
+                file.write(f'{indent}{INDENT}{_text(node)}\n')
+            else:
+                _write_element(node, file, level + 1)
+        file.write(f'{indent}</{element.tag}>\n')
 
 
-def write_et(et, path):
-    data = ET.tostring(et, 'utf-8')
-    dom = minidom.parseString(data)
-    pretty_data = dom.toprettyxml(indent='  ')
-    with open(path, 'w') as occupancy_times_file:
-        occupancy_times_file.write(pretty_data)
+def write_et(et, path, compact=False, compress=None):
+    """
+    Function to write an element and its children to a xml file
+    :param et: root element of the tree
+    :param path: path of the xml file
+    :param compact: write everything in one line without indentation
+    :param compress: True to write gzip, None to decide by the file suffix '.gz'
+    """
+    compress = path.endswith('.gz') if compress is None else compress
+    if compact:
+        with (gzip.open(path, 'wb') if compress else open(path, 'wb')) as xml_file:
+            ET.ElementTree(et).write(xml_file, encoding='utf-8', xml_declaration=True, short_empty_elements=True)
+        return
+    with (gzip.open(path, 'wt', encoding='utf-8') if compress else open(path, 'w', encoding='utf-8')) as xml_file:
+        xml_file.write(XML_DECLARATION)
+        _write_element(et, xml_file)
@@ -1,12 +1,31 @@
 """
 block identification modules to divide the track into blocks (identification in track)
+
+All journeys of a line and direction usually drive the same Verlauf, so the blocks are memoized on a fingerprint of
+the Verlauf and the carried-in Fahrstrasse. The memo can be saved to and loaded from output/cache.
 """
-from dataclasses import dataclass, field
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from os import makedirs, path
+
+import numpy as np
 
-import library.parser as parse
+from library.cache import LRUCache
+from library.interner import get_interner
+from library.schedule_catalog import CACHE_DIR
+from library.topology import FSTR, HAUPTSIGNAL, get_topology
 from library.utils import get_absolute_kilometrage
 
 
+BLOCK_CACHE_PATH = path.join(CACHE_DIR, 'blocks.json')
+BLOCK_CACHE_VERSION = 1
+
+BLOCK_CACHE_SIZE = 10000  # routes kept in the memo, routes not driven for the longest time are dropped first
+
+block_cache = LRUCache(BLOCK_CACHE_SIZE)  # route fingerprint -> (blocks, last_fstr_id, last_fstr_pos)
+
+
 @dataclass
 class Fahrstrassenabschnitt:
     """
@@ -39,6 +58,165 @@ class Block:
     distance_d: float = field(default=None)
 
 
+# the block ID '<start>-<end>' is kept as the codes of its two signals
+BLOCK_KEY_FIELDS = ('block_start_id', 'block_end_id')
+BLOCK_ID_FIELDS = ('vorsignal_id', 'start_hauptsignal_id', 'end_hauptsignal_id', 'zugschlussstelle_id')
+BLOCK_FLOAT_FIELDS = ('vorsignal_pos', 'start_hauptsignal_pos', 'end_hauptsignal_pos', 'zugschlussstelle_pos',
+                      'zugschlussstelle_aufloesezeit', 'distance_a', 'distance_b', 'distance_d')
+ABSCHNITT_ID_FIELDS = ('start_abschnitt_id', 'end_abschnitt_id')
+ABSCHNITT_FLOAT_FIELDS = ('start_abschnitt_pos', 'end_abschnitt_pos')
+
+
+def _float_value(value):
+    value = float(value)
+    return None if value != value else value  # NaN -> None
+
+
+def _to_float(value):
+    return np.nan if value is None else float(value)
+
+
+class BlockTable:
+    """
+    Struct of arrays of many blocks: one numpy column per field of Block, IDs as int32 codes of library.interner and
+    positions, distances and Aufloesezeit as floats (NaN if missing). The Fahrstrassenabschnitte of all blocks are kept
+    in a second table, block i owns the rows abschnitt_offsets[i] to abschnitt_offsets[i + 1] of it. ID strings are
+    only made when a view is read.
+    """
+    __slots__ = ('columns', 'abschnitt_columns', 'abschnitt_offsets')
+
+    def __init__(self, columns, abschnitt_columns, abschnitt_offsets):
+        """
+        :param columns: field name of Block as key and numpy array with one value per block as value
+        :param abschnitt_columns: field name of Fahrstrassenabschnitt as key and numpy array as value
+        :param abschnitt_offsets: numpy array with len(blocks) + 1 offsets into the Fahrstrassenabschnitt table
+        """
+        self.columns = columns
+        self.abschnitt_columns = abschnitt_columns
+        self.abschnitt_offsets = abschnitt_offsets
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """
+        :param blocks: list of Block (or BlockView)
+        :return: BlockTable with the values of the blocks
+        """
+        interner = get_interner()
+        block_keys = [block.block_id.split('-') for block in blocks]
+        columns = {name: interner.intern_many(key[i] for key in block_keys) for i, name in enumerate(BLOCK_KEY_FIELDS)}
+        columns.update({name: interner.intern_many(getattr(block, name) for block in blocks)
+                        for name in BLOCK_ID_FIELDS})
+        columns.update({name: np.array([_to_float(getattr(block, name)) for block in blocks], dtype=np.float64)
+                        for name in BLOCK_FLOAT_FIELDS})
+        abschnitte = [abschnitt for block in blocks for abschnitt in block.fahrstrassenabschnitte]
+        abschnitt_columns = {name: interner.intern_many(getattr(abschnitt, name) for abschnitt in abschnitte)
+                             for name in ABSCHNITT_ID_FIELDS}
+        abschnitt_columns.update({name: np.array([_to_float(getattr(abschnitt, name)) for abschnitt in abschnitte],
+                                                 dtype=np.float64) for name in ABSCHNITT_FLOAT_FIELDS})
+        abschnitt_offsets = np.cumsum([0] + [len(block.fahrstrassenabschnitte) for block in blocks])
+        return cls(columns, abschnitt_columns, abschnitt_offsets)
+
+    @classmethod
+    def of(cls, blocks):
+        """
+        :param blocks: list of Block (or BlockView)
+        :return: the BlockTable the blocks are views on if they are all blocks of one table in order, else a new one
+        """
+        if blocks and isinstance(blocks[0], BlockView):
+            table = blocks[0].table
+            if len(table) == len(blocks) and all(isinstance(block, BlockView) and block.table is table
+                                                 and block.index == index for index, block in enumerate(blocks)):
+                return table
+        return cls.from_blocks(blocks)
+
+    def __len__(self):
+        return len(self.abschnitt_offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('block index out of range')
+        return BlockView(self, index)
+
+    def blocks(self):
+        """
+        :return: list with a BlockView of every block
+        """
+        return [BlockView(self, index) for index in range(len(self))]
+
+
+class BlockView:
+    """
+    Read-only view on one block of a BlockTable with the attributes of Block
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getattr__(self, name):
+        if name in BLOCK_ID_FIELDS:
+            return get_interner().string(self.table.columns[name][self.index])
+        if name == 'block_id':
+            start, end = (self.table.columns[key][self.index] for key in BLOCK_KEY_FIELDS)
+            return get_interner().string(start) + '-' + get_interner().string(end)
+        if name in BLOCK_FLOAT_FIELDS:
+            return _float_value(self.table.columns[name][self.index])
+        if name == 'fahrstrassenabschnitte':
+            offsets = self.table.abschnitt_offsets
+            return [FahrstrassenabschnittView(self.table, row)
+                    for row in range(offsets[self.index], offsets[self.index + 1])]
+        raise AttributeError(name)
+
+    def to_block(self):
+        """
+        :return: Block with the values of the view
+        """
+        values = {name: getattr(self, name) for name in ('block_id',) + BLOCK_ID_FIELDS + BLOCK_FLOAT_FIELDS}
+        return Block(fahrstrassenabschnitte=[abschnitt.to_fahrstrassenabschnitt()
+                                             for abschnitt in self.fahrstrassenabschnitte], **values)
+
+    def __eq__(self, other):
+        if isinstance(other, BlockView):
+            other = other.to_block()
+        return self.to_block() == other
+
+    def __repr__(self):
+        return repr(self.to_block())
+
+
+class FahrstrassenabschnittView:
+    """
+    Read-only view on one Fahrstrassenabschnitt of a BlockTable with the attributes of Fahrstrassenabschnitt
+    """
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getattr__(self, name):
+        if name in ABSCHNITT_ID_FIELDS:
+            return get_interner().string(self.table.abschnitt_columns[name][self.row])
+        if name in ABSCHNITT_FLOAT_FIELDS:
+            return _float_value(self.table.abschnitt_columns[name][self.row])
+        raise AttributeError(name)
+
+    def to_fahrstrassenabschnitt(self):
+        return Fahrstrassenabschnitt(**{name: getattr(self, name) for name in ABSCHNITT_ID_FIELDS +
+                                        ABSCHNITT_FLOAT_FIELDS})
+
+    def __eq__(self, other):
+        if isinstance(other, FahrstrassenabschnittView):
+            other = other.to_fahrstrassenabschnitt()
+        return self.to_fahrstrassenabschnitt() == other
+
+    def __repr__(self):
+        return repr(self.to_fahrstrassenabschnitt())
+
+
 def find_last_hs(id_of_prev_node, name_of_prev_node, pos_of_prev_node, direction):
     """
     Function to find last 'Hauptsignal' of a journey and return id and position accordingly
@@ -49,38 +227,23 @@ def find_last_hs(id_of_prev_node, name_of_prev_node, pos_of_prev_node, direction
     :return: id and position of the next 'Hauptsignal' in the given direction.
     In case no 'Hauptsignal' is in the section, id and position of the previous node is returned
     """
-    hs_node_id = None
-    spurplan_betriebsstellen = parse.get_spurplan_betriebsstelle()
-    hs_id = None
-    hs_pos = None
-    spurplanknoten_id = 0
-
-    for betriebsstelle in spurplan_betriebsstellen:
-        spurplan_abschnitte = betriebsstelle.find('Spurplanabschnitte')
-        for spurplan_abschnitt in spurplan_abschnitte:
-            spurplanknoten_id += 1
-            nodes = spurplan_abschnitt.find('Spurplanknoten')
-
-            for node in nodes:
-                # If direction is Fallend we save the newest seen Hauptsignal until we reached our target element
-                if direction == "F" and node.tag == "HauptsignalF":
-                    hs_id = node.find("ID").text
-                    hs_pos = get_absolute_kilometrage(node)
-                    hs_node_id = spurplanknoten_id
-                if node.tag == name_of_prev_node and int(node.find('ID').text) == id_of_prev_node:
-                    # If the direction is Fallend  -> return last seen Hauptsignal
-                    # If the direction is Steigend -> search for the next occurring Hauptsignal by setting search_hs
-                    if direction == "S" and node.tag == "HauptsignalS":
-                        # Return the first seen Hauptsignal when search_hs is set to True
-                        hs_id = node.find('ID').text
-                        hs_pos = get_absolute_kilometrage(node)
-                        return hs_id, hs_pos
-
-                    if hs_node_id == spurplanknoten_id:
-                        return hs_id, hs_pos
-
-                    # Return previous node id and position if hs_node is not found in spurplanknoten
-                    return id_of_prev_node, pos_of_prev_node
+    topology = get_topology()
+    node = topology.node_index(id_of_prev_node, name_of_prev_node)
+    if node is None:
+        return None
+
+    # If the direction is Steigend and the node is a Hauptsignal itself -> return it
+    if direction == "S" and name_of_prev_node == "HauptsignalS":
+        return topology.position(node)
+    # If the direction is Fallend -> return the last Hauptsignal of the Spurplanabschnitt up to the node
+    if direction == "F":
+        hs_node = topology.get_previous(node, HAUPTSIGNAL, direction)
+        if hs_node is not None:
+            return topology.position(hs_node)
+
+    # Return previous node id and position if hs_node is not found in spurplanknoten
+    return id_of_prev_node, pos_of_prev_node
+
 
 def find_prev_fstr(id_of_node, name_of_node, pos_of_node, direction):
     """
@@ -92,38 +255,22 @@ def find_prev_fstr(id_of_node, name_of_node, pos_of_node, direction):
     :return: id and position of the next 'Hauptsignal' in the given direction.
     In case no 'Hauptsignal' is in the section, id and position of the previous node is returned
     """
-    fstr_node_id = None
-    spurplan_betriebsstellen = parse.get_spurplan_betriebsstellen()
-    fstr_id = None
-    fstr_pos = None
-    spurplanknoten_id = 0
-
-    for betriebsstelle in spurplan_betriebsstellen:
-        spurplan_abschnitte = betriebsstelle.find('Spurplanabschnitte')
-        for spurplan_abschnitt in spurplan_abschnitte:
-            spurplanknoten_id += 1
-            nodes = spurplan_abschnitt.find('Spurplanknoten')
-
-            for node in nodes:
-                # If direction is Fallend we save the newest seen Hauptsignal until we reached our target element
-                if direction == "S" and node.tag in ["FstrZugschlussstelleS", "HauptsignalS"]:
-                    fstr_id = node.find("ID").text
-                    fstr_pos = get_absolute_kilometrage(node)
-                    fstr_node_id = spurplanknoten_id
-                if node.tag == name_of_node and int(node.find('ID').text) == id_of_node:
-                    # If the direction is Fallend  -> return last seen Hauptsignal
-                    # If the direction is Steigend -> search for the next occurring Hauptsignal by setting search_hs
-                    if direction == "F" and node.tag in ["HauptsignalF", "FstrZugschlussstelleF"]:
-                        # Return the first seen Hauptsignal when search_hs is set to True
-                        fstr_id = node.find('ID').text
-                        fstr_pos = get_absolute_kilometrage(node)
-                        return fstr_id, fstr_pos
-
-                    if fstr_node_id == spurplanknoten_id:
-                        return fstr_id, fstr_pos
-
-                    # Return previous node id and position if hs_node is not found in spurplanknoten
-                    return id_of_node, pos_of_node
+    topology = get_topology()
+    node = topology.node_index(id_of_node, name_of_node)
+    if node is None:
+        return None
+
+    # If the direction is Fallend and the node starts a Fahrstrasse itself -> return it
+    if direction == "F" and name_of_node in ["HauptsignalF", "FstrZugschlussstelleF"]:
+        return topology.position(node)
+    # If the direction is Steigend -> return the last Fstr of the Spurplanabschnitt up to the node
+    if direction == "S":
+        fstr_node = topology.get_previous(node, FSTR, direction)
+        if fstr_node is not None:
+            return topology.position(fstr_node)
+
+    # Return previous node id and position if fstr_node is not found in spurplanknoten
+    return id_of_node, pos_of_node
 
 
 def determine_blocks(nodes, direction, last_fstr_abschnitt_id=None, last_fstr_abschnitt_pos=None):
@@ -276,11 +423,107 @@ def calculate_distances(blocks, direction):
     return blocks
 
 
-def get_blocks(nodes, direction, last_fstr_id=None, last_fstr_pos=None):
+def route_fingerprint(nodes, direction, last_fstr_id=None, last_fstr_pos=None):
     """
+    :param nodes: ElementTree <Verlauf> containing all elements of a journey
     :param direction: The direction the train is driving along ("F" or "S")
+    :return: fingerprint of everything determine_blocks depends on as hex string
+    """
+    parts = [repr((direction, last_fstr_id, last_fstr_pos))]
+    for node in nodes:
+        parts.append(node.tag)
+        parts.append(node.findtext('ID', ''))
+        parts.append(node.findtext('Kilometrierung', ''))
+        if "SignalZugschlussstelle" in node.tag:
+            parts.append(node.findtext('FstrAufloesezeit', ''))
+    return hashlib.sha1('\0'.join(parts).encode()).hexdigest()
+
+
+def copy_blocks(blocks):
+    """
+    :return: copy of the blocks with own Fahrstrassenabschnitte, so callers can change them without touching the memo
+    """
+    copies = []
+    for block in blocks:
+        values = dict(vars(block))
+        if block.fahrstrassenabschnitte is not None:
+            values['fahrstrassenabschnitte'] = [Fahrstrassenabschnitt(**vars(fahrstrassenabschnitt))
+                                                for fahrstrassenabschnitt in block.fahrstrassenabschnitte]
+        copies.append(Block(**values))
+    return copies
+
+
+def get_blocks(nodes, direction, last_fstr_id=None, last_fstr_pos=None, use_cache=True):
+    """
+    :param direction: The direction the train is driving along ("F" or "S")
+    :param use_cache: look the blocks up in the memo of already identified routes
     :return: list of blocks dataclass
     """
+    if use_cache:
+        key = route_fingerprint(nodes, direction, last_fstr_id, last_fstr_pos)
+        cached = block_cache.get(key)
+        if cached is not None:
+            return copy_blocks(cached[0]), cached[1], cached[2]
+
     blocks, last_fstr_id, last_fstr_pos = determine_blocks(nodes, direction, last_fstr_id, last_fstr_pos)
     blocks = calculate_distances(blocks, direction)
+    if use_cache:
+        block_cache.put(key, (copy_blocks(blocks), last_fstr_id, last_fstr_pos))
     return blocks, last_fstr_id, last_fstr_pos
+
+
+def new_routes(function, item):
+    """
+    Function to call a function and collect the routes it added to the memo of identified routes, so the memo entries
+    made in a worker process can be sent to the parent
+    :param function: function with one argument
+    :param item: argument of the function
+    :return: result of the function and fingerprint -> memo entry of all new routes
+    """
+    known = {key for key, _ in block_cache.items()}
+    result = function(item)
+    return result, {key: entry for key, entry in block_cache.items() if key not in known}
+
+
+def merge_routes(routes):
+    """
+    Function to add routes identified elsewhere, e.g. in a worker process, to the memo of identified routes
+    :param routes: fingerprint -> memo entry as returned by new_routes
+    """
+    for key, entry in routes.items():
+        if key not in block_cache:
+            block_cache.put(key, entry)
+
+
+def save_block_cache(cache_path=BLOCK_CACHE_PATH):
+    """
+    Function to write the memo of identified routes to disk, from the least to the most recently used route, so the
+    order in which routes are evicted carries over to the next run
+    """
+    entries = {key: [[asdict(block) for block in blocks], last_fstr_id, last_fstr_pos]
+               for key, (blocks, last_fstr_id, last_fstr_pos) in block_cache.items()}
+    makedirs(path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as cache_file:
+        json.dump({'version': BLOCK_CACHE_VERSION, 'infrastructure': get_topology().source_hash,
+                   'entries': entries}, cache_file)
+
+
+def load_block_cache(cache_path=BLOCK_CACHE_PATH):
+    """
+    Function to fill the memo of identified routes from disk, if it was built from the same infrastructure
+    :return: number of loaded routes
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return 0
+    if cache.get('version') != BLOCK_CACHE_VERSION or cache.get('infrastructure') != get_topology().source_hash:
+        return 0
+    for key, (blocks, last_fstr_id, last_fstr_pos) in cache['entries'].items():
+        for block in blocks:
+            if block['fahrstrassenabschnitte'] is not None:
+                block['fahrstrassenabschnitte'] = [Fahrstrassenabschnitt(**fahrstrassenabschnitt)
+                                                   for fahrstrassenabschnitt in block['fahrstrassenabschnitte']]
+        block_cache.put(key, ([Block(**block) for block in blocks], last_fstr_id, last_fstr_pos))
+    return len(cache['entries'])
@@ -1,26 +1,76 @@
 """
 Module for conflict identification of given two trains.
 """
-from datetime import timedelta
 from os import path
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-from library.parser import get_departure_time
+from library.executor import SERIAL, Executor, get_executor, report_errors
+from library.interner import get_interner
+from library.schedule_catalog import get_catalog
 
 from modules.train_pairs import get_relevant_train_pairs
-from modules.occupancy_times import get_times
+from modules.occupancy_times import get_times_many
+from modules.timelines import get_timeline, load_timelines, save_timelines, PERSIST_TIMELINES, TIME_DTYPE
 
 PACKAGE_DIR = path.dirname(Path(__file__).parent)
 CONFLICTS_PATH = path.join(PACKAGE_DIR, Path('output/conflicts.csv'))
 
 PRINT_OUTPUTS = True
+ENGINE_PAIRS = 'pairs'
+ENGINE_SWEEP = 'sweep'
+CONFLICT_ENGINE = ENGINE_PAIRS
 
 
-def identify_conflicts(train_pairs):
+def identify_conflicts(train_pairs, executor=None, engine=None):
     """
     Identifies conflicts in relevant train pairs and writes the output to a csv.
-    :param train_pairs: relevant train pairs to check for conflicts.
+    :param train_pairs: relevant train pairs to check for conflicts. None for all pairs of trains of the schedule catalog
+    with the sweep engine, for the relevant train pairs with the pairs engine
+    :param executor: library.executor.Executor checking the pairs, None for the default executor
+    :param engine: 'pairs' to check every train pair on its own, 'sweep' to sweep the sections of all trains at once,
+    None for CONFLICT_ENGINE. For the same train pairs both engines find the same conflicts in the same order. With
+    train_pairs None they differ: the sweep engine checks all pairs of trains, so it also finds conflicts of pairs that
+    get_relevant_train_pairs leaves out because only their blocking times, not their links, overlap in time.
+    """
+    engine = CONFLICT_ENGINE if engine is None else engine
+    if engine == ENGINE_SWEEP:
+        conflicts = sweep_conflicts(train_pairs)
+    elif engine == ENGINE_PAIRS:
+        conflicts = pair_conflicts(get_relevant_train_pairs(executor) if train_pairs is None else train_pairs, executor)
+    else:
+        raise ValueError(f'unknown conflict engine {engine}, expected {ENGINE_PAIRS} or {ENGINE_SWEEP}')
+
+    conflicts_df = pd.DataFrame(data=conflicts)
+
+    if PRINT_OUTPUTS:
+        header = 'Conflict report\n\n' + 'Identified ' + str(len(conflicts_df)) + ' conflicts:\n'
+        print(header, conflicts_df.to_string())
+
+    # write output to csv
+    conflicts_df.to_csv(CONFLICTS_PATH, index=True, sep='\t')
+
+
+def prepare_timelines(trains):
+    """
+    Builds the timeline of every train once, shared by all its pairs and by forked workers.
+    :param trains: list of trains as string with format '<line> <journey_id>'
+    :return: library.executor.BatchResult with the timelines in the order of the trains
+    """
+    # bring the occupancy times of all trains into the occupancy time store at once
+    get_times_many(trains)
+    if PERSIST_TIMELINES:
+        load_timelines()
+    return Executor(SERIAL).map(get_timeline, trains)
+
+
+def pair_conflicts(train_pairs, executor=None):
+    """
+    Checks every train pair on its own for conflicts.
+    :param train_pairs: train pairs to check for conflicts
+    :param executor: library.executor.Executor checking the pairs, None for the default executor
+    :return: dictionary with the columns of conflicts.csv
     """
     conflicts = {
         'train_pair': [],
@@ -31,9 +81,17 @@ def identify_conflicts(train_pairs):
         'delta': []
     }
 
-    for pair in train_pairs:
-        # check for conflicts for train pair
-        conflict_blocks = get_conflict_blocks(pair[0], pair[1])
+    train_pairs = list(train_pairs)
+    # failures of single trains are reported with their pairs
+    prepare_timelines(list(dict.fromkeys(train for pair in train_pairs for train in pair)))
+
+    # check for conflicts for every train pair, merged in the order of the pairs
+    batch = get_executor(executor).map(get_pair_conflict_blocks, train_pairs)
+    report_errors(batch, 'train pair')
+    if PERSIST_TIMELINES:
+        save_timelines()
+
+    for pair, conflict_blocks in batch.succeeded(train_pairs):
         for i in range(len(conflict_blocks['start_abschnitt_id'])):
             conflicts['train_pair'].append(pair)
             conflicts['start_abschnitt_id'].append(conflict_blocks['start_abschnitt_id'][i])
@@ -41,104 +99,170 @@ def identify_conflicts(train_pairs):
             conflicts['start_abschnitt_pos'].append(conflict_blocks['start_abschnitt_pos'][i])
             conflicts['end_abschnitt_pos'].append(conflict_blocks['end_abschnitt_pos'][i])
             conflicts['delta'].append(conflict_blocks['delta'][i])
+    return conflicts
 
-    conflicts_df = pd.DataFrame(data=conflicts)
 
-    if PRINT_OUTPUTS:
-        header = 'Conflict report\n\n' + 'Identified ' + str(len(conflicts_df)) + ' conflicts:\n'
-        print(header, conflicts_df.to_string())
+def sweep_conflicts(train_pairs=None):
+    """
+    Finds the conflicts of all trains at once by sweeping the blocking times of every section, without checking train
+    pairs on their own. The conflicts are the ones get_conflict_blocks finds, in the order of pair_conflicts.
+    :param train_pairs: train pairs to report conflicts for, None for all pairs of trains of the schedule catalog (not
+    only the relevant ones) in the order of itertools.combinations
+    :return: dictionary with the columns of conflicts.csv
+    """
+    if train_pairs is None:
+        train_pairs, trains = None, get_catalog().trains()
+    else:
+        train_pairs = list(train_pairs)
+        trains = list(dict.fromkeys(train for pair in train_pairs for train in pair))
+    batch = prepare_timelines(trains)
+    report_errors(batch, 'train')
+    if PERSIST_TIMELINES:
+        save_timelines()
+    built = batch.succeeded(trains)
+    names = [train for train, _ in built]
+    timelines = [timeline for _, timeline in built]
 
-    # write output to csv
-    conflicts_df.to_csv(CONFLICTS_PATH, index=True, sep='\t')
+    # all timelines as one table, the row of every section in the timeline of its train
+    lengths = [len(timeline) for timeline in timelines]
+    owner = np.repeat(np.arange(len(timelines)), lengths)
+    row = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    start = np.concatenate([timeline.start_time for timeline in timelines] + [np.empty(0, dtype=TIME_DTYPE)])
+    end = np.concatenate([timeline.end_time for timeline in timelines] + [np.empty(0, dtype=TIME_DTYPE)])
+    earlier, later = sweep_sections(timelines, start, end)
+    different = owner[earlier] != owner[later]
+    earlier, later = earlier[different], later[different]
 
+    # turn every overlap into (first, second) in the orientation of the train pair it is reported for
+    trains_count = len(timelines)
+    forward = owner[earlier].astype(np.int64) * trains_count + owner[later]
+    backward = owner[later].astype(np.int64) * trains_count + owner[earlier]
+    if train_pairs is None:
+        is_forward = owner[earlier] < owner[later]
+        first, second = np.where(is_forward, earlier, later), np.where(is_forward, later, earlier)
+        rank = np.where(is_forward, forward, backward)
+    else:
+        index = {train: i for i, train in enumerate(names)}
+        pair_codes = np.array([index[a] * trains_count + index[b] for a, b in train_pairs
+                               if a in index and b in index], dtype=np.int64)
+        pair_ranks = np.array([rank for rank, (a, b) in enumerate(train_pairs) if a in index and b in index],
+                              dtype=np.int64)
+        code_order = np.argsort(pair_codes, kind='stable')
+        pair_codes, pair_ranks = pair_codes[code_order], pair_ranks[code_order]
+        first, second, rank = [], [], []
+        for codes, a, b in ((forward, earlier, later), (backward, later, earlier)):
+            # a pair given more than once is reported once for every time it is given, like pair_conflicts does
+            lower = np.searchsorted(pair_codes, codes, side='left')
+            counts = np.searchsorted(pair_codes, codes, side='right') - lower
+            first.append(np.repeat(a, counts))
+            second.append(np.repeat(b, counts))
+            rank.append(pair_ranks[np.repeat(lower - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())])
+        first, second, rank = np.concatenate(first), np.concatenate(second), np.concatenate(rank)
 
-def get_conflict_blocks(first_train, second_train):
+    # the predicate of get_conflict_blocks, it only differs from the sweep for sections entered at the same time
+    first_start, second_start = start[first], start[second]
+    first_earlier = first_start < second_start
+    conflict = np.where(first_earlier, second_start < end[first], first_start < end[second])
+    delta = np.where(first_earlier, second_start - first_start, first_start - second_start)
+    order = np.lexsort((row[second], row[first], rank))
+    order = order[conflict[order]]
+    first, rank, delta = first[order], rank[order], delta[order]
+
+    start_code = np.concatenate([timeline.start_abschnitt_code for timeline in timelines] + [np.empty(0, dtype=int)])
+    start_pos = np.concatenate([timeline.start_abschnitt_pos for timeline in timelines] + [np.empty(0)])
+    end_pos = np.concatenate([timeline.end_abschnitt_pos for timeline in timelines] + [np.empty(0)])
+    if train_pairs is None:
+        pairs = [(names[code // trains_count], names[code % trains_count]) for code in rank.tolist()]
+    else:
+        pairs = [train_pairs[code] for code in rank.tolist()]
+    start_ids = get_interner().strings_of(start_code[first])
+    return {
+        'train_pair': pairs,
+        'start_abschnitt_id': start_ids,
+        'end_abschnitt_id': start_ids,
+        'start_abschnitt_pos': _positions(start_pos[first]),
+        'end_abschnitt_pos': _positions(end_pos[first]),
+        'delta': delta.tolist(),
+    }
+
+
+def sweep_sections(timelines, start, end):
     """
-    Checks if the given two trains have any conflicts in blocks on their journey.
-    :param first_train: First train as string with format '<line> <journey_id>'
-    :param second_train: Second train as string with format '<line> <journey_id>'
-    :return: list of conflict block ids
+    Sweeps the blocking times of the sections of all timelines, grouped by section and sorted by their start.
+    :param timelines: list of Timeline
+    :param start: start times of all timelines concatenated
+    :param end: end times of all timelines concatenated
+    :return: arrays with the indices of the earlier and the later blocking time of every pair of blocking times of a
+    section, where the later one starts before the earlier one ends or both start at the same time
     """
-    first_blocks = calculate_block_entry_times(first_train)
-    second_blocks = calculate_block_entry_times(second_train)
+    if not len(start):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    keys = np.concatenate([timeline.section_keys() for timeline in timelines])
+    order = np.lexsort((start, keys))
+    keys = keys[order]
+
+    # shift the starts of every section by its group, so one searchsorted sweeps all sections at once
+    group = np.concatenate(([0], np.cumsum(keys[1:] != keys[:-1])))
+    origin = min(start.min(), end.min())
+    unit = np.datetime_data(start.dtype)[0]
+    span = max(start.max(), end.max()) - origin + np.timedelta64(1, unit)
+    sweep = group * span + (start[order] - origin)
+    reach = group * span + np.maximum(end[order] - origin, np.timedelta64(0, unit))
+    upper = np.maximum(np.searchsorted(sweep, reach, side='left'), np.searchsorted(sweep, sweep, side='right'))
+    lower = np.arange(1, len(sweep) + 1)
+    counts = np.maximum(upper - lower, 0)
+    earlier = np.repeat(np.arange(len(sweep)), counts)
+    later = np.repeat(lower - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return order[earlier], order[later]
 
-    conflict_blocks = {
-        'start_abschnitt_id': [],
-        'end_abschnitt_id': [],
-        'start_abschnitt_pos': [],
-        'end_abschnitt_pos': [],
-        'delta': [],
-    }
 
-    for i in range(len(first_blocks['start_abschnitt_id'])):
-        for j in range(len(second_blocks['start_abschnitt_id'])):
-            if first_blocks['start_abschnitt_id'][i] == second_blocks['start_abschnitt_id'][j] \
-                    and first_blocks['end_abschnitt_id'][i] == second_blocks['end_abschnitt_id'][j]:
-                if first_blocks['start_time'][i] < second_blocks['start_time'][j]:
-                    if second_blocks['start_time'][j] < first_blocks['end_time'][i]:
-                        conflict_blocks['start_abschnitt_id'].append(first_blocks['start_abschnitt_id'][i])
-                        conflict_blocks['end_abschnitt_id'].append(first_blocks['end_abschnitt_id'][i])
-                        conflict_blocks['start_abschnitt_pos'].append(first_blocks['start_abschnitt_pos'][i])
-                        conflict_blocks['end_abschnitt_pos'].append(first_blocks['end_abschnitt_pos'][i])
-                        conflict_blocks['delta'].append(second_blocks['start_time'][j] - first_blocks['start_time'][i])
-                else:
-                    if first_blocks['start_time'][i] < second_blocks['end_time'][j]:
-                        conflict_blocks['start_abschnitt_id'].append(first_blocks['start_abschnitt_id'][i])
-                        conflict_blocks['end_abschnitt_id'].append(first_blocks['end_abschnitt_id'][i])
-                        conflict_blocks['start_abschnitt_pos'].append(first_blocks['start_abschnitt_pos'][i])
-                        conflict_blocks['end_abschnitt_pos'].append(first_blocks['end_abschnitt_pos'][i])
-                        conflict_blocks['delta'].append(first_blocks['start_time'][i] - second_blocks['start_time'][j])
-    return conflict_blocks
-
-
-def calculate_block_entry_times(train):
+def get_pair_conflict_blocks(pair):
     """
-    Calculates the entry time of the train for every section of a block on the trains journey depending on the
-    departure time of the train.
-    :param train: Train as string with format '<line> <journey_id>'
-    :return: A dictionary with the section id, position and entry and exit times as datetime
+    :param pair: tuple of two trains as string with format '<line> <journey_id>'
+    :return: see get_conflict_blocks
     """
-    block_entry_times = {
-        'start_abschnitt_id': [],
-        'end_abschnitt_id': [],
-        'start_abschnitt_pos': [],
-        'end_abschnitt_pos': [],
-        'start_time': [],
-        'end_time': []
-    }
+    return get_conflict_blocks(pair[0], pair[1])
 
-    (line, journey_id) = train.split()
-    departure_times = get_departure_time(line, journey_id)
 
-    for link_id in departure_times:
-        _, vorbelegungszeiten, driving_times, nachbelegungszeiten, blocks = \
-            get_times(train, link_id=link_id - 1)
+def get_conflict_blocks(first_train, second_train):
+    """
+    Checks if the given two trains have any conflicts in blocks on their journey.
+    :param first_train: First train as string with format '<line> <journey_id>'
+    :param second_train: Second train as string with format '<line> <journey_id>'
+    :return: list of conflict block ids
+    """
+    first, second = get_timeline(first_train), get_timeline(second_train)
 
-        entry_time = departure_times[link_id]
+    # join both timelines on the sections they share, for every section of the first train all sections of the second
+    # train with the same key in ascending order
+    second_keys = second.section_keys()
+    second_order = np.argsort(second_keys, kind='stable')
+    sorted_keys = second_keys[second_order]
+    first_keys = first.section_keys()
+    lower = np.searchsorted(sorted_keys, first_keys, side='left')
+    counts = np.searchsorted(sorted_keys, first_keys, side='right') - lower
+    i = np.repeat(np.arange(len(first)), counts)
+    j = second_order[np.repeat(lower - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
 
-        for i, block in enumerate(blocks):
-            for j, abschnitt in enumerate(block.fahrstrassenabschnitte):
-                # if section is the last section of the last block in link
-                if i == len(blocks) - 1 and j == len(block.fahrstrassenabschnitte) - 1 \
-                        and link_id < len(departure_times):
-                    # exit time is departure time of the next link
-                    exit_time = departure_times[link_id + 1] + timedelta(minutes=sum(driving_times[i][:j + 1]))
-                else:
-                    # calculate exit time of the section
-                    exit_time = entry_time + timedelta(minutes=sum(driving_times[i][:j + 1]))
+    first_start, first_end = first.start_time[i], first.end_time[i]
+    second_start, second_end = second.start_time[j], second.end_time[j]
+    first_earlier = first_start < second_start
+    conflict = np.where(first_earlier, second_start < first_end, first_start < second_end)
+    delta = np.where(first_earlier, second_start - first_start, first_start - second_start)[conflict]
+    i = i[conflict]
 
-                # add entry and exit time to dict
-                block_entry_times['start_abschnitt_id'].append(abschnitt.start_abschnitt_id)
-                block_entry_times['end_abschnitt_id'].append(abschnitt.end_abschnitt_id)
-                block_entry_times['start_abschnitt_pos'].append(abschnitt.start_abschnitt_pos)
-                block_entry_times['end_abschnitt_pos'].append(abschnitt.end_abschnitt_pos)
-                block_entry_times['start_time'].append(entry_time - timedelta(minutes=vorbelegungszeiten[i]))
-                block_entry_times['end_time'].append(exit_time + timedelta(minutes=nachbelegungszeiten[i][j]))
+    strings_of = get_interner().strings_of
+    return {
+        'start_abschnitt_id': strings_of(first.start_abschnitt_code[i]),
+        'end_abschnitt_id': strings_of(first.end_abschnitt_code[i]),
+        'start_abschnitt_pos': _positions(first.start_abschnitt_pos[i]),
+        'end_abschnitt_pos': _positions(first.end_abschnitt_pos[i]),
+        'delta': delta.tolist(),
+    }
 
-            # entry time of the next block is exit time of the last block
-            entry_time = exit_time
 
-    return block_entry_times
+def _positions(values):
+    return [None if np.isnan(value) else value for value in values.tolist()]
 
 
 if __name__ == "__main__":
@@ -147,3 +271,5 @@ if __name__ == "__main__":
     # for identifying conflicts between any two given trains
     # relevant_pairs type: tuples of list, where a tuple consists of a pair of trains with their journey ids
     # identify_conflicts([('IC100 3103', 'RB40 2413')])
+    # for identifying conflicts between all trains of the schedules at once
+    # identify_conflicts(None, engine=ENGINE_SWEEP)
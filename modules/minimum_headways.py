@@ -12,10 +12,11 @@ from xml.etree import ElementTree as ET
 
 import library.utils
 import library.writer
+from library.executor import get_executor, report_errors
 from library.parser import get_all_verlauf_nodes
 
 import modules.occupancy_times
-from occupancy_times import read_occupancy_times
+from occupancy_times import get_times as get_occupancy_times
 from train_pairs import get_relevant_train_pairs
 
 dict_of_minimum_headways = {}
@@ -32,19 +33,18 @@ class Times:
     nachbelegungszeit: float
 
 
-def get_times(block: ET.ElementTree, cutoff: int = None) -> list:
+def get_times(block_times: tuple, cutoff: int = None) -> list:
     """
     Create a list of Times objects for all relevant parts in the block
 
     :param cutoff: The number of the last zugschlussstelle to consider
-    :param block:
+    :param block_times: block, vorbelegungszeit, driving times and nachbelegungszeiten of the block
     :return:
     """
-    block_id = block.attrib['id']
-    vorbelegungszeit = float(block.find('vorbelegungszeit').text)
-    fahrzeit = sum(map(float, block.find('driving_time').text.split(" ")[0:cutoff]))
-    nachbelegungszeit = float(block.find('nachbelegungszeit').text.split(" ")[-1 if cutoff is None else cutoff - 1])
-    return Times(block_id, vorbelegungszeit, fahrzeit, nachbelegungszeit)
+    block, vorbelegungszeit, driving_times, nachbelegungszeiten = block_times
+    fahrzeit = sum(driving_times[0:cutoff])
+    nachbelegungszeit = nachbelegungszeiten[-1 if cutoff is None else cutoff - 1]
+    return Times(block.block_id, vorbelegungszeit, fahrzeit, nachbelegungszeit)
 
 
 def is_einfahrsignal(element: object, verlauf: list, direction: str) -> bool:
@@ -115,11 +115,11 @@ def is_ausfahrsignal(element: object, verlauf: list, direction: str) -> bool:
     return False
 
 
-def block_sections_on_mainline(occupancy_times: ET.ElementTree, verlauf: list[ET.ElementTree]) -> list[list[Times]]:
+def block_sections_on_mainline(occupancy_times: tuple, verlauf: list[ET.ElementTree]) -> list[list[Times]]:
     """
     generates sections of blocks between nodes
 
-    :param occupancy_times: all the blocks (output of the occupancy times module)
+    :param occupancy_times: all the blocks and their times (output of get_times of the occupancy times module)
     :param verlauf: list containing the verlauf from every link (output from get_all_verlauf_nodes)
     :return: list of every section between the exit from a node and the entry of another
     (The sections are lists of blocks as generated by the occupancy times module)
@@ -128,33 +128,34 @@ def block_sections_on_mainline(occupancy_times: ET.ElementTree, verlauf: list[ET
     times_in_section = []
     ongoing_section = False
     get_last_parts = False
-    for link in occupancy_times:
-        for block in link:
-            signal_ids = block.attrib['id'].split('-')
-            direction = library.utils.direction_of_node(library.utils.find_node_by_id(signal_ids[0]))
-            if get_last_parts:
-                cutoff = 1
-                last_block_until = {}
-                for fahrstrassenabschnitt in block.find("block_info").findall('fahrstrassenabschnitt'):
-                    times = get_times(block, cutoff)
-                    last_block_until[fahrstrassenabschnitt.find("end_abschnitt_id").text] = times
-                    cutoff += 1
-                list_of_sections.append(
-                    (times_in_section, last_block_until))  # add the list of times in section to list of sections
-                get_last_parts = False  # reset
-                times_in_section = []  # empty list1
-            elif not ongoing_section and is_ausfahrsignal(
-                    library.utils.find_node_by_id(signal_ids[0]), verlauf,
-                    direction):  # startsignal of block is exitsignal of knoten
-                ongoing_section = True  # start section
-            elif ongoing_section and is_einfahrsignal(
-                    library.utils.find_node_by_id(signal_ids[1]), verlauf,
-                    direction):  # endsignal of block is einfahrsignal of knoten
-                ongoing_section = False  # stop section
-                times_in_section.append(get_times(block))  # add block to list1
-                get_last_parts = True
-            elif ongoing_section:
-                times_in_section.append(get_times(block))  # add block to list1
+    _, vorbelegungszeiten, driving_times, nachbelegungszeiten, blocks = occupancy_times
+    for block_times in zip(blocks, vorbelegungszeiten, driving_times, nachbelegungszeiten):
+        block = block_times[0]
+        signal_ids = block.block_id.split('-')
+        direction = library.utils.direction_of_node(library.utils.find_node_by_id(signal_ids[0]))
+        if get_last_parts:
+            cutoff = 1
+            last_block_until = {}
+            for fahrstrassenabschnitt in block.fahrstrassenabschnitte:
+                times = get_times(block_times, cutoff)
+                last_block_until[fahrstrassenabschnitt.end_abschnitt_id] = times
+                cutoff += 1
+            list_of_sections.append(
+                (times_in_section, last_block_until))  # add the list of times in section to list of sections
+            get_last_parts = False  # reset
+            times_in_section = []  # empty list1
+        elif not ongoing_section and is_ausfahrsignal(
+                library.utils.find_node_by_id(signal_ids[0]), verlauf,
+                direction):  # startsignal of block is exitsignal of knoten
+            ongoing_section = True  # start section
+        elif ongoing_section and is_einfahrsignal(
+                library.utils.find_node_by_id(signal_ids[1]), verlauf,
+                direction):  # endsignal of block is einfahrsignal of knoten
+            ongoing_section = False  # stop section
+            times_in_section.append(get_times(block_times))  # add block to list1
+            get_last_parts = True
+        elif ongoing_section:
+            times_in_section.append(get_times(block_times))  # add block to list1
     return list_of_sections
 
 
@@ -164,16 +165,28 @@ def add_shared_sections(train_pair: tuple):
 
     :param train_pair: pair of trains (e.x.: ("S1 1111", "S1 1113"))
     """
-    occupancy_times_i = read_occupancy_times(train_pair[0])
+    merge_minimum_headways(train_pair, get_shared_sections(train_pair))
+
+
+def get_shared_sections(train_pair: tuple) -> list[tuple[str, float]]:
+    """
+    Calculates the minimum headway times of this train pair on all shared sections, without touching
+    dict_of_minimum_headways, so it can run in any worker
+
+    :param train_pair: pair of trains (e.x.: ("S1 1111", "S1 1113"))
+    :return: list of (section name, minimum headway) in the order they are found
+    """
+    occupancy_times_i = get_occupancy_times(train_pair[0])
     verlauf_i = get_all_verlauf_nodes(split(" ", train_pair[0])[0], split(" ", train_pair[0])[1])
     train_i = block_sections_on_mainline(occupancy_times_i, verlauf_i)
 
-    occupancy_times_j = read_occupancy_times(train_pair[1])
+    occupancy_times_j = get_occupancy_times(train_pair[1])
     verlauf_j = get_all_verlauf_nodes(split(" ", train_pair[1])[0], split(" ", train_pair[1])[1])
     train_j = block_sections_on_mainline(occupancy_times_j, verlauf_j)
 
     print("adding: " + str(train_pair))
 
+    shared_sections = []
     for (train_i_section_k, train_j_section_l) in itertools.product(train_i, train_j):
         times_of_train_i_section_k = train_i_section_k[0]
         times_of_train_j_section_l = train_j_section_l[0]
@@ -186,13 +199,20 @@ def add_shared_sections(train_pair: tuple):
             times_of_train_j_section_l.append(train_j_section_l[1][last_shared_zugschlussstelle])
 
             section_name = times_of_train_i_section_k[0].id.split("-")[0]
-            try:
-                dict_of_minimum_headways[section_name][train_pair] = \
-                    calculate_minimum_headway(times_of_train_i_section_k, times_of_train_j_section_l)
-            except KeyError:
-                dict_of_minimum_headways[section_name] = {}
-                dict_of_minimum_headways[section_name][train_pair] = \
-                    calculate_minimum_headway(times_of_train_i_section_k, times_of_train_j_section_l)
+            shared_sections.append(
+                (section_name, calculate_minimum_headway(times_of_train_i_section_k, times_of_train_j_section_l)))
+    return shared_sections
+
+
+def merge_minimum_headways(train_pair: tuple, shared_sections: list[tuple[str, float]]) -> None:
+    """
+    Adds the minimum headway times of a train pair (output of get_shared_sections) to dict_of_minimum_headways
+
+    :param train_pair: pair of trains (e.x.: ("S1 1111", "S1 1113"))
+    :param shared_sections: list of (section name, minimum headway)
+    """
+    for section_name, minimum_headway in shared_sections:
+        dict_of_minimum_headways.setdefault(section_name, {})[train_pair] = minimum_headway
 
 
 def calculate_minimum_headway(section_train_i: list[Times], section_train_j: list[Times]) -> float:
@@ -219,18 +239,23 @@ def calculate_minimum_headway(section_train_i: list[Times], section_train_j: lis
     return z_max
 
 
-def generate_minimum_headways(train_pair: tuple = None) -> dict:
+def generate_minimum_headways(train_pair: tuple = None, executor=None) -> dict:
     """
     Calls the relevant functions for either generating all minimum headways and storing them in csv format
     or only for one train pair and returning the dictionary in either case (for one train only it doesn't update the csv)
 
     :param train_pair: empty -> all train pairs or the desired train pair like e.x.: ("S1 1111", "S1 1113") -> just this pair
+    :param executor: library.executor.Executor calculating the train pairs, None for the default executor
     :return: a dictionary containing dictionaries for every section with the minimum headways on there
     """
     if train_pair is None:
         trains = modules.train_pairs.get_relevant_directories()
-        for pair in permutations(trains, 2):
-            add_shared_sections(pair)
+        pairs = list(permutations(trains, 2))
+        batch = get_executor(executor).map(get_shared_sections, pairs)
+        report_errors(batch, 'train pair')
+        # merged in the order of the pairs, so the dictionary does not depend on the order the workers finish in
+        for pair, shared_sections in batch.succeeded(pairs):
+            merge_minimum_headways(pair, shared_sections)
     else:
         add_shared_sections(train_pair)
     return dict_of_minimum_headways
@@ -3,20 +3,34 @@ occupancy time calculations
 
 """
 
+import os
+import sys
 from os import makedirs, path
 from pathlib import Path
 from xml.etree import ElementTree as ET
 
+import numpy as np
+
 import library.writer
 from elements.constants import FAHRSTRASSEN_BILDEZEIT, SIGNAL_SICHTZEIT
-from elements.d_weg import get_d_weg
-from elements.trajectory import get_waypoints
-from library.model_trains import get_train_total_length
-from library.parser import get_all_verlauf_nodes, get_trajectory_records
+from elements.d_weg import get_d_weg, get_d_weg_array
+from elements.trajectory import TrajectoryIndex, get_waypoints
+from library.cache import LRUCache
+from library.compression import parse_resource, resolve_path
+from library.executor import get_executor, report_errors
+from library.manifest import MISSING, Manifest, hash_value
+from library.model_trains import get_model_train, get_train_total_length
+from library.occupancy_store import get_occupancy_store, write_occupancy_store
+from library.parser import get_all_verlauf_nodes
+from library.schedule_catalog import CACHE_DIR, SCHEDULE_FILE, get_catalog
+from library.topology import get_topology
+from library.trajectory_loader import records_to_arrays
+from library.trajectory_store import build_trajectory_store, get_link_trajectories
 from library.utils import determine_direction, get_absolute_kilometrage
 
-from modules.block_identification import (Block, Fahrstrassenabschnitt,
-                                          get_blocks)
+from modules.block_identification import (Block, BlockTable, Fahrstrassenabschnitt,
+                                          get_blocks, load_block_cache, merge_routes,
+                                          new_routes, save_block_cache)
 from modules.train_pairs import get_relevant_directories
 
 PACKAGE_DIR = path.dirname(Path(__file__).parent)
@@ -24,6 +38,35 @@ SCHEDULES_ROOT_DIR = path.join(PACKAGE_DIR, Path('resources/schedules'))
 OCCUPANCY_TIMES_DIR = path.join(PACKAGE_DIR, Path('output/occupancy_times'))
 
 PRINT_OUTPUTS = False
+# write the occupancy_times.xml of every train next to the occupancy time store
+EXPORT_XML = True
+
+# part of the inputs of all occupancy times, increase it when a change of the calculation changes the results
+OCCUPANCY_TIMES_VERSION = 1
+OCCUPANCY_MANIFEST_PATH = path.join(CACHE_DIR, 'occupancy_manifest.json')
+
+TIMES_CACHE_SIZE = 200000  # in blocks, enough to keep the times of all trains of a full run
+times_cache = LRUCache(TIMES_CACHE_SIZE)  # (train, source stamp) -> times of every link
+
+# 'scalar' looks up every position of a block on its own, 'vectorized' resolves all positions of a link at once
+ENGINES = ('scalar', 'vectorized')
+DEFAULT_ENGINE = 'vectorized'
+
+
+def _timestamp_at(records, direction, initial_position, position):
+    """
+    Function to get the timestamp (in minutes) of the waypoint right before a position
+    :param records: <records> node of the link, its trajectory columns or its TrajectoryIndex
+    :param direction: The direction the train is driving along ("F" or "S")
+    :param initial_position: The Kilometrierung of the first element of the schedule
+    :param position: kilometrisierung
+    :return: timestamp in minutes
+    :raise ValueError: if the trajectory has no waypoint before the position
+    """
+    waypoint = None if position is None else get_waypoints(records, direction, initial_position, position)
+    if waypoint is None:
+        raise ValueError(f'the trajectory has no waypoint before position {position}')
+    return waypoint.timestamp
 
 
 def calculate_vorbelegungszeit(records, vorsignal_position, hauptsignal_position, initial_position, direction):
@@ -42,8 +85,8 @@ def calculate_vorbelegungszeit(records, vorsignal_position, hauptsignal_position
         if PRINT_OUTPUTS:
             print("Kein VS vorhanden")
     else:
-        start_ts = get_waypoints(records, direction, initial_position, vorsignal_position).timestamp
-        end_ts = get_waypoints(records, direction, initial_position, hauptsignal_position).timestamp
+        start_ts = _timestamp_at(records, direction, initial_position, vorsignal_position)
+        end_ts = _timestamp_at(records, direction, initial_position, hauptsignal_position)
         annaeherungsfahrzeit = end_ts - start_ts
         vorbelegungszeit = round((FAHRSTRASSEN_BILDEZEIT + SIGNAL_SICHTZEIT + annaeherungsfahrzeit), 4)
     return vorbelegungszeit
@@ -65,22 +108,22 @@ def calculate_driving_time_block(records, fahrstrassenabschnitte, start_hs_pos,
     fahrzeiten = []
 
     try:
-        start_ts = get_waypoints(records, direction, initial_position, start_hs_pos).timestamp
-    except:
-        start_ts = get_waypoints(records, direction, initial_position,
-                                 initial_position).timestamp
-    end_ts = get_waypoints(records, direction, initial_position, end_hs_pos).timestamp
+        start_ts = _timestamp_at(records, direction, initial_position, start_hs_pos)
+    except ValueError:
+        start_ts = _timestamp_at(records, direction, initial_position,
+                                 initial_position)
+    end_ts = _timestamp_at(records, direction, initial_position, end_hs_pos)
     b_driving_time = round((end_ts - start_ts), 4)
 
     for fahrstrassenabschnitt in fahrstrassenabschnitte:
         try:
-            start_ts = get_waypoints(records, direction, initial_position,
-                                     fahrstrassenabschnitt.start_abschnitt_pos).timestamp
-        except:
-            start_ts = get_waypoints(records, direction, initial_position,
-                                     initial_position).timestamp
-        end_ts = get_waypoints(records, direction, initial_position,
-                               fahrstrassenabschnitt.end_abschnitt_pos).timestamp
+            start_ts = _timestamp_at(records, direction, initial_position,
+                                     fahrstrassenabschnitt.start_abschnitt_pos)
+        except ValueError:
+            start_ts = _timestamp_at(records, direction, initial_position,
+                                     initial_position)
+        end_ts = _timestamp_at(records, direction, initial_position,
+                               fahrstrassenabschnitt.end_abschnitt_pos)
         driving_time = round((end_ts - start_ts), 4)
         fahrzeiten.append(driving_time)
 
@@ -129,9 +172,9 @@ def calculate_nachbelegungszeit(records, fahrstrassenabschnitte, train_total_len
 
             raeumfahrstecke = end_pos + train_total_length / 1000 if direction == "S" else end_pos - train_total_length / 1000
 
-            start_ts = get_waypoints(records, direction, initial_position,
-                                     fahrstrassenabschnitte[i].end_abschnitt_pos).timestamp
-            end_ts = get_waypoints(records, direction, initial_position, raeumfahrstecke).timestamp
+            start_ts = _timestamp_at(records, direction, initial_position,
+                                     fahrstrassenabschnitte[i].end_abschnitt_pos)
+            end_ts = _timestamp_at(records, direction, initial_position, raeumfahrstecke)
             d_driving_time = end_ts - start_ts
 
             nachbelegungszeit = round((d_driving_time + aufloesezeit / 60), 4)
@@ -152,8 +195,8 @@ def calculate_nachbelegungszeit(records, fahrstrassenabschnitte, train_total_len
 
     raeumfahrstecke = end_pos + train_total_length / 1000 if direction == "S" else end_pos - train_total_length / 1000
 
-    start_ts = get_waypoints(records, direction, initial_position, end_hs_pos).timestamp
-    end_ts = get_waypoints(records, direction, initial_position, raeumfahrstecke).timestamp
+    start_ts = _timestamp_at(records, direction, initial_position, end_hs_pos)
+    end_ts = _timestamp_at(records, direction, initial_position, raeumfahrstecke)
     d_driving_time = end_ts - start_ts
 
     nachbelegungszeit = round((d_driving_time + aufloesezeit / 60), 4)
@@ -203,12 +246,129 @@ def calculate_occupancy_time(records, block, train_total_length, initial_positio
     return vorbelegungszeit, driving_time_block[1], nachbelegungszeit[1], occupancy_time
 
 
-def calculate_times(nodes, records, train_total_length, last_fstr_id=None, last_fstr_pos=None):
+def _timestamps_at(trajectory, positions):
+    """
+    Function to get the timestamps (in minutes) of the waypoints right before many positions
+    :param trajectory: TrajectoryIndex of the link
+    :param positions: kilometrisierungen as array
+    :return: timestamps as array
+    :raise ValueError: if the trajectory has no waypoint before one of the positions
+    """
+    indices = trajectory.indices_before(positions)
+    indices[np.isnan(positions)] = -1
+    failed = np.flatnonzero(indices < 0)
+    if len(failed):
+        # same as _timestamp_at on a missing position or a position in front of the trajectory
+        position = None if np.isnan(positions[failed[0]]) else float(positions[failed[0]])
+        raise ValueError(f'the trajectory has no waypoint before position {position}')
+    return trajectory.trajectory.ts[indices] / 60
+
+
+def _to_array(positions):
+    return np.array([np.nan if position is None else position for position in positions], dtype=np.float64)
+
+
+def calculate_times_vectorized(trajectory, blocks, train_total_length, initial_position, direction):
+    """
+    Function to calculate the occupancy times of all blocks of a link in one pass. All positions of the link are
+    collected into arrays and resolved with one batched lookup, the results are the same as those of
+    calculate_occupancy_time for every block.
+    :param trajectory: TrajectoryIndex of the link
+    :param blocks: blocks of the link (see get_blocks)
+    :param train_total_length: the total length of the current train in m
+    :param initial_position: The Kilometrierung of the first element of the schedule
+    :param direction: The direction the train is driving along ("F" or "S")
+    :return all vorbelegungszeiten, driving times through blocks, nachbelegungszeiten, occupancy times of the link
+    as lists
+    """
+    sign = 1 if direction == "S" else -1
+
+    def ahead(positions, distances):
+        return positions + distances if sign == 1 else positions - distances
+
+    def timestamps_or_initial(positions):
+        # a failing lookup of a start position falls back to the initial position, as in
+        # calculate_driving_time_block
+        indices = trajectory.indices_before(positions)
+        indices[np.isnan(positions)] = -1
+        failed = indices < 0
+        if failed.any():
+            indices[failed] = trajectory.indices_before([initial_position])[0]
+            if (indices < 0).any():
+                raise ValueError(f'the trajectory has no waypoint before position {initial_position}')
+        return trajectory.trajectory.ts[indices] / 60
+
+    # Vorbelegungszeit
+    with_vorsignal = [index for index, block in enumerate(blocks) if block.vorsignal_pos is not None]
+    annaeherungsfahrzeiten = \
+        _timestamps_at(trajectory, _to_array([blocks[index].start_hauptsignal_pos for index in with_vorsignal])) - \
+        _timestamps_at(trajectory, _to_array([blocks[index].vorsignal_pos for index in with_vorsignal]))
+    vorbelegungszeiten = [round((FAHRSTRASSEN_BILDEZEIT + SIGNAL_SICHTZEIT), 4)] * len(blocks)
+    for index, annaeherungsfahrzeit in zip(with_vorsignal, annaeherungsfahrzeiten.tolist()):
+        vorbelegungszeiten[index] = round((FAHRSTRASSEN_BILDEZEIT + SIGNAL_SICHTZEIT + annaeherungsfahrzeit), 4)
+
+    # Fahrzeit through the whole blocks and through all their fahrstrassenabschnitte
+    abschnitte = [(index, fahrstrassenabschnitt) for index, block in enumerate(blocks)
+                  for fahrstrassenabschnitt in block.fahrstrassenabschnitte]
+    block_driving_times = \
+        _timestamps_at(trajectory, _to_array([block.end_hauptsignal_pos for block in blocks])) - \
+        timestamps_or_initial(_to_array([block.start_hauptsignal_pos for block in blocks]))
+    abschnitt_driving_times = \
+        _timestamps_at(trajectory, _to_array([abschnitt.end_abschnitt_pos for _, abschnitt in abschnitte])) - \
+        timestamps_or_initial(_to_array([abschnitt.start_abschnitt_pos for _, abschnitt in abschnitte]))
+    driving_times = [[] for _ in blocks]
+    for (index, _), driving_time in zip(abschnitte, abschnitt_driving_times.tolist()):
+        driving_times[index].append(round(driving_time, 4))
+
+    # Nachbelegungszeit: one entry per fahrstrassenabschnitt except the last one, plus one for the whole block
+    owners, speed_positions, start_positions, end_positions, aufloesezeiten = [], [], [], [], []
+    for index, block in enumerate(blocks):
+        fahrstrassenabschnitte = block.fahrstrassenabschnitte
+        aufloesezeit = 3 if block.zugschlussstelle_pos is None else block.zugschlussstelle_aufloesezeit
+        for fahrstrassenabschnitt in fahrstrassenabschnitte[:-1]:
+            owners.append(index)
+            speed_positions.append(fahrstrassenabschnitt.start_abschnitt_pos)
+            start_positions.append(fahrstrassenabschnitt.end_abschnitt_pos)
+            end_positions.append(None)
+            aufloesezeiten.append(aufloesezeit)
+        last_fstr_abschnitt_pos = fahrstrassenabschnitte[-2].start_abschnitt_pos \
+            if len(fahrstrassenabschnitte) > 1 else block.start_hauptsignal_pos
+        owners.append(index)
+        speed_positions.append(last_fstr_abschnitt_pos)
+        start_positions.append(block.end_hauptsignal_pos)
+        end_positions.append(block.zugschlussstelle_pos)
+        aufloesezeiten.append(aufloesezeit)
+
+    start_positions = _to_array(start_positions)
+    end_positions = _to_array(end_positions)
+    speed_indices = trajectory.indices_before(_to_array(speed_positions))
+    speed_indices[np.isnan(_to_array(speed_positions))] = -1
+    known_speed = speed_indices >= 0
+    d_weg = np.where(known_speed, get_d_weg_array(trajectory.trajectory.vs[speed_indices]), 200)
+    for _ in range(int(np.count_nonzero(~known_speed & np.isnan(end_positions)))):
+        print("Nachbelegungszeit berechnen? Zug ist an Endhaltestelle angelangt")
+    end_positions = np.where(np.isnan(end_positions), ahead(start_positions, d_weg / 1000), end_positions)
+    raeumfahrstrecken = ahead(end_positions, train_total_length / 1000)
+    d_driving_times = _timestamps_at(trajectory, raeumfahrstrecken) - _timestamps_at(trajectory, start_positions)
+
+    nachbelegungszeiten = [[] for _ in blocks]
+    for index, d_driving_time, aufloesezeit in zip(owners, d_driving_times.tolist(), aufloesezeiten):
+        nachbelegungszeiten[index].append(round((d_driving_time + aufloesezeit / 60), 4))
+
+    belegungszeiten = [round((vorbelegungszeit + round(block_driving_time, 4) + nachbelegungszeit[-1]), 4)
+                       for vorbelegungszeit, block_driving_time, nachbelegungszeit in
+                       zip(vorbelegungszeiten, block_driving_times.tolist(), nachbelegungszeiten)]
+    return vorbelegungszeiten, driving_times, nachbelegungszeiten, belegungszeiten
+
+
+def calculate_times(nodes, records, train_total_length, last_fstr_id=None, last_fstr_pos=None,
+                    engine=DEFAULT_ENGINE):
     """
     calculated the occupancy time for each block of a journey
     :param train_total_length:
-    :param records:
+    :param records: <records> node of the link or its trajectory columns (see library.trajectory_loader)
     :param nodes:
+    :param engine: 'scalar' to calculate block by block, 'vectorized' to calculate all blocks of the link at once
     :return all vorbelegungszeiten of journey(list),driving times through blocks(list), nachbelegungszeiten(list),
     occupancy times(list)
     """
@@ -221,12 +381,25 @@ def calculate_times(nodes, records, train_total_length, last_fstr_id=None, last_
     else:
         initial_position = get_absolute_kilometrage(nodes[0])
 
+    # all waypoint lookups of the link are answered by one index instead of walking the records each time
+    if not hasattr(records, 'xs'):
+        records = records_to_arrays(records)
+    trajectory = TrajectoryIndex(records, direction, initial_position)
+
+    if engine not in ENGINES:
+        raise ValueError(f'unknown engine {engine}, expected one of {ENGINES}')
+    if engine == 'vectorized':
+        vorbelegungszeiten, driving_times, nachbelegungszeiten, belegungszeiten = calculate_times_vectorized(
+            trajectory, blocks, train_total_length, initial_position, direction)
+        return vorbelegungszeiten, driving_times, nachbelegungszeiten, belegungszeiten, blocks, last_fstr_id, \
+            last_fstr_pos
+
     vorbelegungszeiten = []
     driving_times = []
     nachbelegungszeiten = []
     belegungszeiten = []
     for block in blocks:
-        vorbelegungszeit, driving_time, nachbelegungszeit, belegungszeit = calculate_occupancy_time(records,
+        vorbelegungszeit, driving_time, nachbelegungszeit, belegungszeit = calculate_occupancy_time(trajectory,
                                                                                                     block,
                                                                                                     train_total_length,
                                                                                                     initial_position,
@@ -239,29 +412,26 @@ def calculate_times(nodes, records, train_total_length, last_fstr_id=None, last_
     return vorbelegungszeiten, driving_times, nachbelegungszeiten, belegungszeiten, blocks, last_fstr_id, last_fstr_pos
 
 
-def write_occupancy_times(train):
+def calculate_occupancy_times(train):
     """
-    Writes a xml-file with the occupancy times for a given train in the trains schedule directory.
+    Calculates the occupancy times of all links of a given train.
     :param train: The train as string with format '<line> <journey_id>'
+    :return: List with the belegungszeiten, vorbelegungszeiten, driving times, nachbelegungszeiten and blocks of every
+    link, in the order returned by get_times
     """
-    if PRINT_OUTPUTS:
-        print('Write occupancy times of train ' + train + '...')
-
     train_info = train.split()
 
-    # initialize root element of ET
-    occupancy_times = ET.Element('occupancy_times')
-
     # get train information from schedule
     schedules_train_dir = path.join(SCHEDULES_ROOT_DIR, Path(train_info[0], train_info[1]))
     schedule_path = path.join(schedules_train_dir, Path('schedule.xml'))
     try:
         nodes_list = get_all_verlauf_nodes(train_info[0], train_info[1])
-        records_list = get_trajectory_records(train_info[0], train_info[1])
+        records_list = get_link_trajectories(train_info[0], train_info[1])
         train_length = get_train_total_length(train_info[0])
     except FileNotFoundError:
         print('File not found:', schedule_path)
 
+    links = []
     last_fstr_id = None
     last_fstr_pos = None
     # calculate occupancy times
@@ -269,6 +439,24 @@ def write_occupancy_times(train):
 
         vorbelegungszeiten, driving_times, nachbelegungszeiten, belegungszeiten, blocks, last_fstr_id, last_fstr_pos = \
             calculate_times(nodes, records, train_length, last_fstr_id, last_fstr_pos)
+        links.append((belegungszeiten, vorbelegungszeiten, driving_times, nachbelegungszeiten, blocks))
+
+    return links
+
+
+def export_occupancy_times(train, links):
+    """
+    Writes a xml-file with the given occupancy times of a train in the trains schedule directory.
+    :param train: The train as string with format '<line> <journey_id>'
+    :param links: occupancy times of every link (see calculate_occupancy_times)
+    :return: path of the xml-file
+    """
+    train_info = train.split()
+
+    # initialize root element of ET
+    occupancy_times = ET.Element('occupancy_times')
+
+    for belegungszeiten, vorbelegungszeiten, driving_times, nachbelegungszeiten, blocks in links:
 
         # create the file structure
         link = ET.SubElement(occupancy_times, 'link')
@@ -298,18 +486,173 @@ def write_occupancy_times(train):
         makedirs(times_dir)
     times_path = path.join(times_dir, Path('occupancy_times.xml'))
     library.writer.write_et(occupancy_times, times_path)
+    return times_path
 
+
+def write_occupancy_times(train, export_xml=EXPORT_XML, update_store=True):
+    """
+    Calculates the occupancy times for a given train and writes them to the occupancy time store and optionally to a
+    xml-file in the trains schedule directory.
+    :param train: The train as string with format '<line> <journey_id>'
+    :param export_xml: also write the occupancy_times.xml
+    :param update_store: put the times into the occupancy time store, False if the caller puts the times of many
+    trains into the store at once
+    """
     if PRINT_OUTPUTS:
-        print(times_path + ' successfully written.')
+        print('Write occupancy times of train ' + train + '...')
 
+    links = calculate_occupancy_times(train)
+    invalidate_times(train)
+    if update_store:
+        update_occupancy_store({train: links})
+    record_occupancy_inputs([train])
 
-def rewrite_all_occupancy_times():
+    if export_xml:
+        times_path = export_occupancy_times(train, links)
+        if PRINT_OUTPUTS:
+            print(times_path + ' successfully written.')
+
+
+def rewrite_all_occupancy_times(export_xml=EXPORT_XML, executor=None):
+    """
+    recalculate all occupancy times and write them to the occupancy time store in one go, after building the
+    trajectory store the calculation reads the trajectories from
+    :param export_xml: also write the occupancy_times.xml of every train
+    :param executor: library.executor.Executor calculating the trains, None for the default executor
+    """
+    build_trajectory_store()
+    rebuild_occupancy_times(export_xml=export_xml, force=True, executor=executor)
+
+
+def occupancy_inputs(train):
     """
-    recalculate and write all occupancy times xmls
+    Hashes of all inputs the occupancy times of a train are calculated from.
+    :param train: The train as string with format '<line> <journey_id>'
+    :return: input name as key and hash as value
     """
-    trains = get_relevant_directories()
+    return {
+        SCHEDULE_FILE: schedule_hash(train),
+        'infrastructure': get_topology().source_hash,
+        'model_train': hash_value(get_model_train(train.split()[0])),
+        'version': hash_value(OCCUPANCY_TIMES_VERSION),
+    }
+
+
+def record_occupancy_inputs(trains):
+    """
+    Records the current inputs of the given trains in the occupancy manifest, after their times were written.
+    :param trains: list of trains as strings with format '<line> <journey_id>'
+    """
+    manifest = Manifest(OCCUPANCY_MANIFEST_PATH)
     for train in trains:
-        write_occupancy_times(train)
+        manifest.record(train, occupancy_inputs(train))
+    manifest.save()
+
+
+def rebuild_occupancy_times(trains=None, export_xml=EXPORT_XML, force=False, executor=None):
+    """
+    Recalculates the occupancy times of all trains whose inputs changed since their times were written, according to
+    the occupancy manifest, and writes them to the occupancy time store in one go.
+    :param trains: list of trains as strings with format '<line> <journey_id>', None for all relevant trains
+    :param export_xml: also write the occupancy_times.xml of every recalculated train
+    :param force: recalculate all trains regardless of their inputs
+    :param executor: library.executor.Executor calculating the trains, None for the default executor
+    :return: dict of recalculated trains and dict of skipped (or failed) trains, with the reasons as list of strings as
+    values
+    """
+    if trains is None:
+        trains = get_relevant_directories()
+    manifest = Manifest(OCCUPANCY_MANIFEST_PATH)
+    store = get_occupancy_store()
+
+    rebuilt, skipped = {}, {}
+    for train in trains:
+        inputs = occupancy_inputs(train)
+        reasons = ['forced'] if force else [name + ' changed' if name != MISSING else name
+                                            for name in manifest.changed_inputs(train, inputs)]
+        if not reasons and (store is None or not store.is_current(train, inputs[SCHEDULE_FILE])):
+            reasons.append('not in occupancy time store')
+        if not reasons and export_xml and not path.exists(occupancy_times_path(train)):
+            reasons.append('occupancy_times.xml missing')
+        if reasons:
+            rebuilt[train] = reasons
+        else:
+            skipped[train] = ['inputs unchanged']
+
+    load_block_cache()
+    items = list(rebuilt)
+    batch = get_executor(executor).map(calculate_occupancy_times_and_routes, items)
+    report_errors(batch, 'train')
+    for error in batch.errors:
+        skipped[error.item] = ['failed: ' + error.error]
+        del rebuilt[error.item]
+
+    trains_times = {}
+    for train, (links, routes) in batch.succeeded(items):
+        # routes identified by worker processes, so save_block_cache keeps them
+        merge_routes(routes)
+        if PRINT_OUTPUTS:
+            print('Write occupancy times of train ' + train + '...')
+        trains_times[train] = links
+        invalidate_times(train)
+        if export_xml:
+            export_occupancy_times(train, links)
+    if trains_times:
+        save_block_cache()
+        update_occupancy_store(trains_times)
+        record_occupancy_inputs(list(trains_times))
+    return rebuilt, skipped
+
+
+def calculate_occupancy_times_and_routes(train):
+    """
+    Calculates the occupancy times of a train like calculate_occupancy_times, together with the routes added to the
+    memo of identified routes meanwhile (see block_identification.new_routes)
+    :param train: The train as string with format '<line> <journey_id>'
+    :return: occupancy times of every link and the new routes
+    """
+    return new_routes(calculate_occupancy_times, train)
+
+
+def schedule_hash(train):
+    """
+    :return: content hash of the schedule of the train in the schedule catalog, None for unknown trains
+    """
+    record = get_catalog().records.get(train)
+    return None if record is None else record.hashes.get(SCHEDULE_FILE)
+
+
+def update_occupancy_store(trains_times):
+    """
+    Puts the occupancy times of the given trains into the occupancy time store, keeping the times of all other trains
+    as long as their schedules did not change.
+    :param trains_times: train as key and occupancy times of every link as value (see calculate_occupancy_times)
+    """
+    store = get_occupancy_store()
+    merged = {}
+    if store is not None:
+        for train in store.trains:
+            if train not in trains_times and store.is_current(train, schedule_hash(train)):
+                merged[train] = [get_stored_times(store, train, link_id)
+                                 for link_id in range(len(store.trains[train]))]
+    merged.update(trains_times)
+    write_occupancy_store(merged, {train: schedule_hash(train) for train in merged})
+    get_occupancy_store(reload=True)
+
+
+def get_stored_times(store, train, link_id=None):
+    """
+    Reads the occupancy times of a train from the occupancy time store. The blocks are views on one BlockTable, built
+    from the columns of the store without creating a Block object per block.
+    :param store: OccupancyStore
+    :param train: The train as string with format '<line> <journey_id>'
+    :param link_id: if set -> return only times for specific link
+    :return: see get_times
+    """
+    belegungszeiten, vorbelegungszeiten, driving_times, nachbelegungszeiten, block_columns, abschnitt_columns, \
+        abschnitt_offsets = store.get_columns(train, link_id)
+    blocks_info = BlockTable(block_columns, abschnitt_columns, abschnitt_offsets).blocks()
+    return belegungszeiten, vorbelegungszeiten, driving_times, nachbelegungszeiten, blocks_info
 
 
 def deconstruct_block(block, et):
@@ -359,27 +702,89 @@ def deconstruct_block(block, et):
 
 def read_occupancy_times(train):
     """
-    Reads the occupancy times xml-file for a given train in the trains schedule directory.
+    Reads the occupancy times xml-file (plain or compressed) for a given train in the trains schedule directory.
     :param train: The train as string with format '<line> <journey_id>'
     """
+    try:
+        root = parse_resource(occupancy_times_path(train)).getroot()
+    except FileNotFoundError:
+        # the times are read from the new xml-file, get_times_many puts the times of all missing trains into the
+        # occupancy time store with one write instead of one write per train
+        write_occupancy_times(train, export_xml=True, update_store=False)
+        root = parse_resource(occupancy_times_path(train)).getroot()
+
+    return root
+
+
+def occupancy_times_path(train):
+    """
+    :param train: The train as string with format '<line> <journey_id>'
+    :return: path of the occupancy times xml-file of the train, plain or compressed
+    """
     train_info = train.split()
-    times_path = path.join(OCCUPANCY_TIMES_DIR, Path(train_info[0], train_info[1], 'occupancy_times.xml'))
+    return resolve_path(path.join(OCCUPANCY_TIMES_DIR, Path(train_info[0], train_info[1], 'occupancy_times.xml')))
+
 
+def times_source_stamp(train):
+    """
+    Identifies the version of the occupancy times a train would be read from: the schedule hash of its entry in the
+    occupancy time store or modification time and size of its xml-file.
+    :param train: The train as string with format '<line> <journey_id>'
+    :return: hashable stamp, None if there are no occupancy times of the train yet
+    """
+    store = get_occupancy_store()
+    train_hash = schedule_hash(train)
+    if store is not None and store.is_current(train, train_hash):
+        return 'store', train_hash
     try:
-        root = ET.parse(times_path).getroot()
+        stat = os.stat(occupancy_times_path(train))
     except FileNotFoundError:
-        write_occupancy_times(train)
-        root = ET.parse(times_path).getroot()
+        return None
+    return 'xml', stat.st_mtime_ns, stat.st_size
 
-    return root
+
+def invalidate_times(train):
+    """
+    Removes all cached occupancy times of a train from times_cache.
+    :param train: The train as string with format '<line> <journey_id>'
+    """
+    for key, _ in times_cache.items():
+        if key[0] == train:
+            times_cache.pop(key)
+
+
+def get_link_times(train):
+    """
+    Reads the occupancy times of every link of a train. Results are kept in times_cache under the train and the stamp
+    of their source, so they are read again as soon as the store entry or the xml-file of the train changes.
+    :param train: The train as string with format '<line> <journey_id>'
+    :return: list with the times of every link as returned by get_times
+    """
+    stamp = times_source_stamp(train)
+    links = times_cache.get((train, stamp))
+    if links is not None:
+        return links
+
+    if stamp is not None and stamp[0] == 'store':
+        store = get_occupancy_store()
+        links = [get_stored_times(store, train, link_id) for link_id in range(len(store.trains[train]))]
+    else:
+        root = read_occupancy_times(train)
+        links = [read_xml_times(train, link_id, root) for link_id in range(len(root.findall('link')))]
+        # the xml-file is written by read_occupancy_times if it did not exist
+        stamp = times_source_stamp(train)
+
+    times_cache.put((train, stamp), links, sum(len(link[4]) for link in links))
+    return links
 
 
 def get_times(train, link_id=None, update_times=False):
     """
-    Reads the occupancy times from xml-file and returns them as lists.
+    Reads the occupancy times from the occupancy time store, or from the xml-file if the store does not hold current
+    times of the train, and returns them as lists.
     :param train: The train as string with format '<line> <journey_id>'
     :param link_id: if set -> return only times for specific link
-    :param update_times: Update occupancy times xml-file
+    :param update_times: Update occupancy times
     :return All vorbelegungszeiten, driving times through blocks, nachbelegungszeiten, occupancy times and
     blocks as lists
     """
@@ -388,8 +793,40 @@ def get_times(train, link_id=None, update_times=False):
     if update_times:
         write_occupancy_times(train)
 
+    links = get_link_times(train)
+    if link_id is not None:
+        return links[link_id]
+
+    return tuple([value for link in links for value in link[column]] for column in range(5))
+
+
+def get_times_many(trains, link_id=None):
+    """
+    Reads the occupancy times of many trains. Trains without current times in the occupancy time store are read from
+    their xml-files and added to the store in one go, so later calls are served from the store.
+    :param trains: iterable of trains as strings with format '<line> <journey_id>'
+    :param link_id: if set -> return only times for specific link
+    :return: train as key and the times as returned by get_times as value
+    """
+    trains = list(dict.fromkeys(trains))
+    store = get_occupancy_store()
+    missing = [train for train in trains if store is None or not store.is_current(train, schedule_hash(train))]
+    if missing:
+        update_occupancy_store({train: get_link_times(train) for train in missing})
+    return {train: get_times(train, link_id) for train in trains}
+
+
+def read_xml_times(train, link_id=None, root=None):
+    """
+    Reads the occupancy times from xml-file and returns them as lists.
+    :param train: The train as string with format '<line> <journey_id>'
+    :param link_id: if set -> return only times for specific link
+    :param root: root element of the already parsed xml-file
+    :return: see get_times
+    """
     # read occupancy times file of the train
-    root = read_occupancy_times(train)
+    if root is None:
+        root = read_occupancy_times(train)
 
     # init lists to return times
     blocks_info = []
@@ -478,4 +915,10 @@ def safe_float(string):
 
 # example of getting occupancy times of given train with it's journey id, passed as String type
 if __name__ == "__main__":
-    print(get_times("S1 1111"))
+    if sys.argv[1:2] == ['rebuild']:
+        # python modules/occupancy_times.py rebuild [--force]
+        rebuilt_trains, skipped_trains = rebuild_occupancy_times(force='--force' in sys.argv)
+        for name, reasons in list(rebuilt_trains.items()) + list(skipped_trains.items()):
+            print(('rebuilt ' if name in rebuilt_trains else 'skipped ') + name + ': ' + ', '.join(reasons))
+    else:
+        print(get_times("S1 1111"))
@@ -0,0 +1,225 @@
+"""
+Module with the blocking time timelines of trains: the absolute start and end of the blocking time of every section a
+train passes on its journey. The timeline of a train is calculated once per run and kept in compact arrays (section
+codes of library.interner, positions and times as milliseconds since epoch), so checking a train against many other
+trains does not expand its occupancy times again. Timelines can be saved to and loaded from output/cache.
+"""
+import json
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from os import makedirs, path, replace
+
+import numpy as np
+
+from library.cache import LRUCache
+from library.interner import CODE_DTYPE, get_interner
+from library.schedule_catalog import CACHE_DIR, get_catalog
+
+from modules.block_identification import BlockTable
+from modules.occupancy_times import get_times, schedule_hash, times_source_stamp
+
+TIMELINES_PATH = path.join(CACHE_DIR, 'timelines.npz')
+TIMELINES_VERSION = 3
+TIME_DTYPE = 'datetime64[ms]'  # int64 milliseconds since epoch, the resolution of the occupancy times
+MS_PER_MINUTE = 60000
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+PERSIST_TIMELINES = True  # keep the timelines in output/cache for the next run
+
+timeline_cache = LRUCache()  # train -> (source stamp, Timeline), one entry per train
+
+
+@dataclass
+class Timeline:
+    """
+    Blocking times of all sections of a train in the order of its journey, one array entry per section
+    """
+    start_abschnitt_code: np.ndarray
+    end_abschnitt_code: np.ndarray
+    start_abschnitt_pos: np.ndarray  # NaN if unknown
+    end_abschnitt_pos: np.ndarray
+    start_time: np.ndarray  # start of the blocking time in UTC
+    end_time: np.ndarray  # end of the blocking time in UTC
+
+    def __len__(self):
+        return len(self.start_time)
+
+    def section_keys(self):
+        """
+        :return: int64 array with one key per section, equal for sections with equal start and end codes
+        """
+        return self.start_abschnitt_code.astype(np.int64) * (1 << 32) + self.end_abschnitt_code
+
+    @classmethod
+    def from_section_times(cls, section_times):
+        """
+        :param section_times: output of calculate_section_times
+        :return: Timeline
+        """
+        return cls(section_times['start_abschnitt_code'], section_times['end_abschnitt_code'],
+                   section_times['start_abschnitt_pos'], section_times['end_abschnitt_pos'],
+                   section_times['start_time'].astype(TIME_DTYPE), section_times['end_time'].astype(TIME_DTYPE))
+
+
+def to_epoch_ms(time):
+    """
+    :param time: timezone aware datetime
+    :return: milliseconds since epoch as int
+    """
+    return (time - EPOCH) // timedelta(milliseconds=1)
+
+
+def minutes_to_ms(values):
+    """
+    :param values: times in minutes, as read from the occupancy times
+    :return: numpy int64 array of the times in milliseconds
+    """
+    return np.rint(np.asarray(values, dtype=np.float64) * MS_PER_MINUTE).astype(np.int64)
+
+
+def timeline_stamp(train):
+    """
+    :return: stamp of the occupancy times and of the schedule (departure times) the timeline of a train is built from
+    """
+    return times_source_stamp(train), schedule_hash(train)
+
+
+def get_timeline(train):
+    """
+    Function to get the timeline of a train, calculated on first use and kept in timeline_cache as long as the
+    occupancy times and the schedule of the train do not change
+    :param train: Train as string with format '<line> <journey_id>'
+    :return: Timeline
+    """
+    stamp = timeline_stamp(train)
+    entry = timeline_cache.get(train)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    # replaces the timeline of an older version of the train
+    timeline = Timeline.from_section_times(calculate_section_times(train))
+    timeline_cache.put(train, (stamp, timeline), len(timeline))
+    return timeline
+
+
+def save_timelines(timelines_path=TIMELINES_PATH):
+    """
+    Function to write the timelines of timeline_cache to one npz file, except the ones whose train or inputs changed
+    since they were calculated
+    :param timelines_path: path of the file
+    """
+    keys, columns = [], {field.name: [] for field in fields(Timeline)}
+    for train, (stamp, timeline) in timeline_cache.items():
+        if stamp != timeline_stamp(train):
+            continue
+        keys.append((train, stamp))
+        for name in columns:
+            columns[name].append(getattr(timeline, name))
+    arrays = {name: np.concatenate(values) if values else np.empty(0) for name, values in columns.items()}
+    arrays['offsets'] = np.cumsum([0] + [len(columns['start_time'][i]) for i in range(len(keys))])
+    arrays['meta'] = np.array(json.dumps({'version': TIMELINES_VERSION, 'keys': keys, 'ids': get_interner().strings}))
+
+    makedirs(path.dirname(timelines_path), exist_ok=True)
+    with open(timelines_path + '.tmp', 'wb') as timelines_file:
+        np.savez(timelines_file, **arrays)
+    # replace only when complete, readers never see a half written file
+    replace(timelines_path + '.tmp', timelines_path)
+
+
+def _to_stamp(value):
+    # json turns the tuples of a stamp into lists
+    return tuple(_to_stamp(item) for item in value) if isinstance(value, list) else value
+
+
+def load_timelines(timelines_path=TIMELINES_PATH):
+    """
+    Function to fill timeline_cache from the file written by save_timelines. Only timelines whose stamp matches the
+    current inputs of their train are loaded, codes are translated to the current interner.
+    :param timelines_path: path of the file
+    """
+    try:
+        with np.load(timelines_path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            if meta.get('version') != TIMELINES_VERSION:
+                return
+            offsets = arrays['offsets']
+            columns = {field.name: arrays[field.name] for field in fields(Timeline)}
+    except (OSError, ValueError, KeyError):
+        return
+    translate = get_interner().translate
+    for name in ('start_abschnitt_code', 'end_abschnitt_code'):
+        columns[name] = translate(columns[name], meta['ids'])
+    for i, (train, stamp) in enumerate(meta['keys']):
+        stamp = _to_stamp(stamp)
+        if stamp != timeline_stamp(train):
+            continue
+        timeline = Timeline(**{name: values[offsets[i]:offsets[i + 1]] for name, values in columns.items()})
+        timeline_cache.put(train, (stamp, timeline), len(timeline))
+
+
+def calculate_section_times(train):
+    """
+    Calculates the blocking time of the train for every section of a block on the trains journey depending on the
+    departure time of the train. All times are int64 milliseconds since epoch (UTC), the driving, Vorbelegungs- and
+    Nachbelegungszeiten of a link are flattened into one value per section and summed up from the departure of the link.
+    :param train: Train as string with format '<line> <journey_id>'
+    :return: A dictionary with the section codes (see library.interner) and positions (NaN if unknown) and the start
+    and end of the blocking times as numpy arrays
+    """
+    departure_times = get_catalog().get(train).get_departure_times()
+    links = [get_times(train, link_id=link_id - 1) for link_id in departure_times]
+    tables = [BlockTable.of(link[4]) for link in links]
+
+    # link of every block, block and index inside the block of every section
+    blocks_per_link = np.array([len(table) for table in tables], dtype=np.int64)
+    link_of_block = np.repeat(np.arange(len(tables)), blocks_per_link)
+    counts = np.concatenate([np.diff(table.abschnitt_offsets) for table in tables] + [np.empty(0, dtype=np.int64)])
+    block_of = np.repeat(np.arange(len(counts)), counts)
+    block_start = np.concatenate(([0], np.cumsum(counts)))
+    section = np.arange(block_start[-1]) - block_start[block_of]
+
+    # driving time to the end of every section summed up over the journey, anchored to the departure of every link
+    driving = np.cumsum(_section_values([times for link in links for times in link[2]], block_of, section))
+    driven = np.concatenate(([0], driving))
+    link_block_start = np.concatenate(([0], np.cumsum(blocks_per_link)))
+    departures = np.array([to_epoch_ms(departure) for departure in departure_times.values()], dtype=np.int64)
+    anchor = departures - driven[block_start[link_block_start[:-1]]]
+    # entry time of a block is the exit time of the last section of the block before
+    block_entry = anchor[link_of_block] + driven[block_start[:-1]]
+    exit_time = anchor[link_of_block[block_of]] + driving
+    for k, link_id in enumerate(departure_times):
+        last_block = link_block_start[k + 1] - 1
+        if link_id < len(departure_times) and blocks_per_link[k] and counts[last_block]:
+            # exit time of the last section in the link is based on the departure time of the next link
+            last = block_start[last_block + 1] - 1
+            exit_time[last] = \
+                to_epoch_ms(departure_times[link_id + 1]) + driving[last] - driven[block_start[last_block]]
+
+    vorbelegungszeiten = minutes_to_ms([value for link in links for value in link[1]])
+    nachbelegungszeiten = _section_values([times for link in links for times in link[3]], block_of, section)
+
+    def concatenate(name, dtype):
+        return np.concatenate([table.abschnitt_columns[name] for table in tables] + [np.empty(0, dtype=dtype)]) \
+            .astype(dtype)
+
+    return {
+        'start_abschnitt_code': concatenate('start_abschnitt_id', CODE_DTYPE),
+        'end_abschnitt_code': concatenate('end_abschnitt_id', CODE_DTYPE),
+        'start_abschnitt_pos': concatenate('start_abschnitt_pos', np.float64),
+        'end_abschnitt_pos': concatenate('end_abschnitt_pos', np.float64),
+        'start_time': block_entry[block_of] - vorbelegungszeiten[block_of],
+        'end_time': exit_time + nachbelegungszeiten,
+    }
+
+
+def _section_values(values, block_of, section):
+    # value of every section from one list of minutes per block, 0 for sections the list of their block does not reach
+    lengths = np.array([len(block_values) for block_values in values], dtype=np.int64)
+    flat = minutes_to_ms(np.fromiter(chain.from_iterable(values), dtype=np.float64, count=int(lengths.sum())))
+    inside = section < lengths[block_of]
+    section_values = np.zeros(len(section), dtype=np.int64)
+    section_values[inside] = flat[(np.cumsum(lengths) - lengths)[block_of[inside]] + section[inside]]
+    return section_values
+
+
+if __name__ == "__main__":
+    print(get_timeline('S1 1111'))
@@ -3,53 +3,57 @@ Module to extract relevant train pairs by comparing signal attributes and time o
 Possible cases of trains in lines and nodes are considered.
 """
 import itertools
-import os
-import re
-import string
+from datetime import datetime, timedelta, timezone
 from os import path
 from pathlib import Path
-from xml.etree import ElementTree as ET
 
+import numpy as np
 import pandas as pd
-from library.parser import parse_date_time
+from library.executor import get_executor, report_errors
+from library.interner import get_interner
+from library.schedule_catalog import get_catalog
 
 package_dir = Path(__file__).parent.parent
-schedules_root_dir = path.join(package_dir, Path('resources/schedules'))
-parsed_schedules = {}
+
+ENGINE_COMBINATIONS = 'combinations'
+ENGINE_PRUNING = 'pruning'
+PAIR_ENGINE = ENGINE_PRUNING
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 
 def get_relevant_directories():
     """
     Function to search for all directories with schedule_esf.xml and to build cartesian product of all possible train
-    pairs directories with element name as corresponding train id and line
+    pairs directories with element name as corresponding train id and line. The trains are taken from the schedule
+    catalog, which only parses schedules that changed since the last run
 
     :return: list of all possible (train id line) names as tuple of two trains (any)
     """
-    relevant_directories = []
-    for dir_name, _, file_list in os.walk(schedules_root_dir):
-        if 'schedule_esf.xml' in file_list:
-            schedule_path = path.join(dir_name, Path('schedule_esf.xml'))
-            characters = re.escape(string.punctuation)
-            train_dir = re.sub(r'[' + characters + ']', ' ',
-                               (dir_name.split('schedules')[1])[1:])  # output-format
-            relevant_directories.append(train_dir)
-            parsed_schedules[train_dir] = ET.parse(schedule_path).getroot()
-    return relevant_directories
-
-
-def get_relevant_train_pairs():
+    return get_catalog().trains()
+
+
+def get_relevant_train_pairs(executor=None, engine=None):
     """
     Function to return all relevant pairs of trains from given resources
 
     :param with_time_constraint: False if used for minimum headways
+    :param executor: library.executor.Executor checking the pairs, None for the default executor. Only used by the
+    combinations engine
+    :param engine: 'combinations' to check every combination of two trains with is_relevant_pair, 'pruning' to only
+    check links that run at the same time, None for PAIR_ENGINE. Both engines return the same pairs in the same order.
     :return: list of relevant pairs of trains with ids and lines
     """
+    engine = PAIR_ENGINE if engine is None else engine
     relevant_directories = get_relevant_directories()
-    relevant_pairs = []
-
-    for pair in itertools.combinations(relevant_directories, 2):
-        if is_relevant_pair(pair[0], pair[1]):
-            relevant_pairs.append(pair)
+    if engine == ENGINE_PRUNING:
+        relevant_pairs = prune_train_pairs(relevant_directories)
+    elif engine == ENGINE_COMBINATIONS:
+        pairs = list(itertools.combinations(relevant_directories, 2))
+        batch = get_executor(executor).map(is_relevant_train_pair, pairs)
+        report_errors(batch, 'train pair')
+        relevant_pairs = [pair for pair, relevant in batch.succeeded(pairs) if relevant]
+    else:
+        raise ValueError(f'unknown pair engine {engine}, expected {ENGINE_COMBINATIONS} or {ENGINE_PRUNING}')
 
     trains_pairs = {'Relevant_Trains_Pairs': relevant_pairs}
     relevant_trains_df = pd.DataFrame(data=trains_pairs)
@@ -59,6 +63,14 @@ def get_relevant_train_pairs():
     return relevant_pairs
 
 
+def is_relevant_train_pair(pair):
+    """
+    :param pair: tuple of two trains as String
+    :return: see is_relevant_pair
+    """
+    return is_relevant_pair(pair[0], pair[1])
+
+
 def is_relevant_pair(first_train, second_train):
     """
     Function to check if given two trains have minimum one common intersecting id, whilst checking if both trains are in
@@ -68,20 +80,15 @@ def is_relevant_pair(first_train, second_train):
     :param second_train: Train id and line as String
     :return: True if given two trains are relevant, otherwise False
     """
-    for link_of_first_train in parsed_schedules[first_train]:
-        first_train_element_ids = [node[0].text for node in link_of_first_train.find('Verlauf')]
-        for link_of_second_train in parsed_schedules[second_train]:
-            second_train_element_ids = [node[0].text for node in link_of_second_train.find('Verlauf')]
-            common_ids = set.intersection(set(first_train_element_ids), set(second_train_element_ids))
+    catalog = get_catalog()
+    for link_of_first_train in catalog.get(first_train).links:
+        for link_of_second_train in catalog.get(second_train).links:
+            common_ids = link_of_first_train.element_code_set & link_of_second_train.element_code_set
             if len(common_ids) != 0:
-                first_train_departure = parse_date_time(
-                    link_of_first_train.find('Origin')[0].find('abfahrtzeit').text)
-                first_train_arrival = parse_date_time(
-                    link_of_first_train.find('Destination')[2].find('ankunftzeit').text)
-                second_train_departure = parse_date_time(
-                    link_of_second_train.find('Origin')[0].find('abfahrtzeit').text)
-                second_train_arrival = parse_date_time(
-                    link_of_second_train.find('Destination')[2].find('ankunftzeit').text)
+                first_train_departure = link_of_first_train.departure_time
+                first_train_arrival = link_of_first_train.arrival_time
+                second_train_departure = link_of_second_train.departure_time
+                second_train_arrival = link_of_second_train.arrival_time
                 if first_train_departure < second_train_departure:  # first train departs first
                     if second_train_departure < first_train_arrival:
                         # second train departs before first train arrives to destination if condition holds true
@@ -99,5 +106,87 @@ def is_relevant_pair(first_train, second_train):
     return False
 
 
+def prune_train_pairs(trains):
+    """
+    Function to find the relevant pairs of many trains without checking every combination. The links of all trains are
+    indexed by their departure, so only links that run at the same time are compared, and their elements are compared
+    as bitsets.
+    :param trains: list of trains as String
+    :return: list of the pairs of trains is_relevant_pair holds for, in the order of itertools.combinations
+    :raises TypeError: if some links have timezone aware and others timezone naive times
+    """
+    catalog = get_catalog()
+    owner, links = [], []
+    for i, train in enumerate(trains):
+        for link in catalog.get(train).links:
+            owner.append(i)
+            links.append(link)
+    owner = np.array(owner, dtype=np.int64)
+    if len({time.tzinfo is None for link in links for time in (link.departure_time, link.arrival_time)}) > 1:
+        # is_relevant_pair can not compare them either
+        raise TypeError('schedules mix timezone naive and timezone aware departure and arrival times')
+    departure = np.array([_microseconds(link.departure_time) for link in links], dtype=np.int64)
+    arrival = np.array([_microseconds(link.arrival_time) for link in links], dtype=np.int64)
+    bitsets = element_bitsets(links)
+
+    # links of different trains running at the same time, as (first, second) in the order of the trains
+    earlier, later = overlapping_links(departure, arrival)
+    different = owner[earlier] != owner[later]
+    earlier, later = earlier[different], later[different]
+    is_first = owner[earlier] < owner[later]
+    first, second = np.where(is_first, earlier, later), np.where(is_first, later, earlier)
+
+    # the time constraint of is_relevant_pair, it only differs from the index for links departing at the same time
+    first_earlier = departure[first] < departure[second]
+    relevant = np.where(first_earlier, departure[second] < arrival[first], departure[first] < arrival[second])
+    first, second = first[relevant], second[relevant]
+    relevant = np.any(bitsets[first] & bitsets[second], axis=1)
+
+    pair_codes = np.unique(owner[first[relevant]] * len(trains) + owner[second[relevant]])
+    return [(trains[code // len(trains)], trains[code % len(trains)]) for code in pair_codes.tolist()]
+
+
+def overlapping_links(departure, arrival):
+    """
+    Function to find the links that depart while another link is running, with an index of the links sorted by their
+    departure
+    :param departure: departure times of all links
+    :param arrival: arrival times of all links
+    :return: arrays with the indices of the earlier and the later departing link of every pair of links where the later
+    one departs before the earlier one arrives or both depart at the same time
+    """
+    order = np.argsort(departure, kind='stable')
+    departures = departure[order]
+    upper = np.maximum(np.searchsorted(departures, arrival[order], side='left'),
+                       np.searchsorted(departures, departures, side='right'))
+    lower = np.arange(1, len(order) + 1)
+    counts = np.maximum(upper - lower, 0)
+    earlier = np.repeat(np.arange(len(order)), counts)
+    later = np.repeat(lower - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return order[earlier], order[later]
+
+
+def element_bitsets(links):
+    """
+    Function to build a bitset of the element ids of every link, one bit per code of library.interner
+    :param links: list of LinkRecord
+    :return: uint64 array with one row per link, two links share an element if their rows share a bit
+    """
+    codes = [link.element_codes for link in links]
+    # bit 0 is the code of a missing id
+    words = (len(get_interner()) + 1 + 63) // 64
+    link_of = np.repeat(np.arange(len(links)), [len(link_codes) for link_codes in codes])
+    bits = np.concatenate(codes + [np.empty(0, dtype=np.int64)]).astype(np.int64) + 1
+    bitsets = np.zeros((len(links), words), dtype=np.uint64)
+    np.bitwise_or.at(bitsets, (link_of, bits // 64), np.left_shift(np.uint64(1), (bits % 64).astype(np.uint64)))
+    return bitsets
+
+
+def _microseconds(time):
+    # integer microseconds since epoch, naive times are only compared with other naive times
+    epoch = EPOCH if time.tzinfo is not None else EPOCH.replace(tzinfo=None)
+    return (time - epoch) // timedelta(microseconds=1)
+
+
 if __name__ == '__main__':
     print(get_relevant_directories())
@@ -12,7 +12,9 @@ import numpy as np
 import pandas as pd
 from elements.trajectory import get_waypoints
 from library import parser
-from library.train_schedule_parser import Train
+from library.schedule_catalog import get_catalog
+from library.schedule_store import get_train
+from library.trajectory_store import get_link_trajectories
 from library.utils import determine_direction, get_absolute_kilometrage
 
 from occupancy_times import get_times
@@ -47,16 +49,12 @@ def visualize_lines(lines_to_plot, plot_first_journey_only=False, plot_one_dir_o
         START_TIME = parser.parse_date_time(start_time)
     else:
         earliest_departure_time = datetime.datetime.max
+        catalog = get_catalog()
         for line in lines_to_plot:
-            line_folder = path.join(package_dir, Path('resources/schedules/'), line)
-            for _, dirs, _ in os.walk(line_folder):
-                for directory in dirs:
-                    try:
-                        abfahrt_zeit = list(parser.get_departure_time(line, directory).values())[0].replace(tzinfo=None)
-                    except FileNotFoundError:
-                        continue
-                    if (abfahrt_zeit - earliest_departure_time).total_seconds() < 0:
-                        earliest_departure_time = abfahrt_zeit
+            for journey in catalog.get_line(line):
+                abfahrt_zeit = journey.links[0].departure_time.replace(tzinfo=None)
+                if (abfahrt_zeit - earliest_departure_time).total_seconds() < 0:
+                    earliest_departure_time = abfahrt_zeit
         START_TIME = (earliest_departure_time - timedelta(minutes=10))
 
     # Y-Axis height in minutes
@@ -71,11 +69,11 @@ def visualize_lines(lines_to_plot, plot_first_journey_only=False, plot_one_dir_o
         for _, dirs, _ in os.walk(line_folder):
             for directory in dirs:
                 try:
-                    train = Train(train_line=line, train_journey_id=directory)
+                    train = get_train(line, directory)
                 except FileNotFoundError:
                     continue
                 nodes_list = train.get_verlauf()
-                records_list = train.get_trajectory()
+                trajectories = get_link_trajectories(line, directory)
 
                 link_id = 0
                 last_block_driving_time = None
@@ -86,8 +84,7 @@ def visualize_lines(lines_to_plot, plot_first_journey_only=False, plot_one_dir_o
                 # Abfahrtzeit of the current link in minutes since plot start time
                 base_time = (list(abfahrt_zeit.values())[0].replace(tzinfo=None) - START_TIME).total_seconds() / 60
 
-                for (nodes, records) in zip(nodes_list.values(), records_list.values()):
-                    records = records[0]
+                for (nodes, records) in zip(nodes_list.values(), trajectories):
                     # For visualization
                     direction = determine_direction(nodes)
                     if PLOT_ONLY_ONE_DIR:
@@ -170,7 +167,7 @@ def visualize_blocking_times(ax, link_id, abfahrt_zeiten, vorbelegungszeiten, dr
     :param driving_times: list containing the driving_times for the blocks to plot
     :param nachbelegungszeiten: list containing the nachbelegungszeiten for the blocks to plot
     :param blocks: list containing the Blocks to plot
-    :param records: see parser class
+    :param records: trajectory columns of the link (see library.trajectory_loader) or <records> node
     :param base_position: the position of the first element of the link
     :param direction:driving direction "F" or "S"
     :param last_block_vorbelegungszeit_height: the vorbeleungszeit of the last block of previous link if there was one
@@ -244,7 +241,7 @@ def visualize_blocking_times(ax, link_id, abfahrt_zeiten, vorbelegungszeiten, dr
 def plot_driving_dynamic(records, direction, base_time, base_position, last_traj_pos=None, last_traj_time=None):
     """
     Plots the trajectory of the train
-    :param records: see parser class
+    :param records: trajectory columns of the link (see library.trajectory_loader) or <records> node
     :param direction: driving direction "S" or "F"
     :param base_time: Abfahrtzeit of the current link in minutes since plot start time
     :param base_position: Position of the first element of the link
@@ -263,17 +260,25 @@ def plot_driving_dynamic(records, direction, base_time, base_position, last_traj
         x_kilometrierungen.append(last_traj_pos)
         y_times.append(last_traj_time)
 
-    for record in records:
-        relative_time = float(record.find("Upper_absolute_ts").text) / 60
-        relative_position = float(record.find("Lower_xs").text) / 1000
-
-        relative_time += base_time
+    if hasattr(records, 'xs'):
+        relative_positions = records.xs / 1000
         if direction == "F":
-            relative_position *= -1
-        relative_position += base_position
+            relative_positions *= -1
+        x_kilometrierungen.extend((relative_positions + base_position).tolist())
+        y_times.extend((records.upper_absolute_ts / 60 + base_time).tolist())
+        relative_position, relative_time = x_kilometrierungen[-1], y_times[-1]
+    else:
+        for record in records:
+            relative_time = float(record.find("Upper_absolute_ts").text) / 60
+            relative_position = float(record.find("Lower_xs").text) / 1000
 
-        x_kilometrierungen.append(relative_position)
-        y_times.append(relative_time)
+            relative_time += base_time
+            if direction == "F":
+                relative_position *= -1
+            relative_position += base_position
+
+            x_kilometrierungen.append(relative_position)
+            y_times.append(relative_time)
 
     plt.scatter(x_kilometrierungen, y_times, zorder=2, s=0, c='black', label="_nolegend_")
     plt.plot(x_kilometrierungen, y_times, zorder=2, c='black', label="_nolegend_", linewidth=size)
@@ -297,7 +302,10 @@ def visualize_first_block(ax, records, link_id, base_time, last_block_vorbelegun
     else:
         block_start = block.start_hauptsignal_pos - block_length
 
-    abfahrts_zeit += float(records[0].find("Upper_absolute_ts").text.replace(",", ".")) / 60
+    if hasattr(records, 'xs'):
+        abfahrts_zeit += float(records.upper_absolute_ts[0]) / 60
+    else:
+        abfahrts_zeit += float(records[0].find("Upper_absolute_ts").text.replace(",", ".")) / 60
     vorbelegungs_height = last_block_vorbelegungszeit_height
     bottom = base_time - vorbelegungs_height - last_block_fahrzeit_height
     # Plot data as bars, with x_start as x and x_end as width and y_start as bottom and y_end as height
@@ -0,0 +1,7 @@
+"""
+Makes the packages of the repository importable when pytest is run from any directory
+"""
+import sys
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
@@ -0,0 +1,60 @@
+"""
+Parity of the sweep conflict engine with the pairwise one on randomised timelines, with sections entered at the same
+time, empty and negative blocking times, reversed and repeated train pairs
+"""
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+import modules.conflict_identification as conflict_identification
+from modules.timelines import TIME_DTYPE, Timeline
+
+TRAINS = 12
+SECTIONS = 4
+
+
+def random_timelines(seed):
+    generator = random.Random(seed)
+    timelines = {}
+    for i in range(TRAINS):
+        length = generator.randint(0, 15)
+        start = np.array([generator.randint(0, 20) for _ in range(length)], dtype='datetime64[m]').astype(TIME_DTYPE)
+        end = start + np.array([generator.randint(-1, 6) for _ in range(length)], dtype='timedelta64[m]')
+        codes = np.array([generator.randint(-1, SECTIONS) for _ in range(length)], dtype=np.int32)
+        timelines[f'T{i} {i}'] = Timeline(codes, codes, np.arange(length, dtype=np.float64),
+                                          np.arange(length, dtype=np.float64), start, end)
+    return timelines
+
+
+@pytest.fixture
+def timelines(request, monkeypatch):
+    timelines = random_timelines(request.param)
+    catalog = type('Catalog', (), {'trains': lambda self: list(timelines)})()
+    monkeypatch.setattr(conflict_identification, 'get_timeline', timelines.__getitem__)
+    monkeypatch.setattr(conflict_identification, 'get_times_many', lambda trains: None)
+    monkeypatch.setattr(conflict_identification, 'get_catalog', lambda: catalog)
+    monkeypatch.setattr(conflict_identification, 'PERSIST_TIMELINES', False)
+    return timelines
+
+
+@pytest.mark.parametrize('timelines', range(20), indirect=True)
+def test_sweep_matches_pairs_for_all_combinations(timelines):
+    pairs = list(itertools.combinations(timelines, 2))
+    assert conflict_identification.sweep_conflicts(None) == conflict_identification.pair_conflicts(pairs)
+
+
+@pytest.mark.parametrize('timelines', range(20), indirect=True)
+def test_sweep_matches_pairs_for_given_pairs(timelines):
+    generator = random.Random(len(timelines))
+    pairs = [pair if generator.random() < 0.5 else pair[::-1] for pair in itertools.combinations(timelines, 2)]
+    generator.shuffle(pairs)
+    pairs = pairs[:40] + pairs[:5]  # some pairs twice
+    assert conflict_identification.sweep_conflicts(pairs) == conflict_identification.pair_conflicts(pairs)
+
+
+@pytest.mark.parametrize('timelines', [0], indirect=True)
+def test_sweep_without_pairs(timelines):
+    conflicts = conflict_identification.sweep_conflicts([])
+    assert all(column == [] for column in conflicts.values())
@@ -0,0 +1,62 @@
+"""
+The join of two timelines in get_conflict_blocks compared to a nested loop over all sections of both trains, on
+timelines that pass the same section many times
+"""
+import random
+
+import numpy as np
+import pytest
+
+import modules.conflict_identification as conflict_identification
+from library.interner import get_interner
+from modules.timelines import TIME_DTYPE, Timeline
+
+SECTIONS = 3
+
+
+def random_timeline(generator, length):
+    start = np.array([generator.randint(0, 30) for _ in range(length)], dtype='datetime64[m]').astype(TIME_DTYPE)
+    end = start + np.array([generator.randint(-1, 8) for _ in range(length)], dtype='timedelta64[m]')
+    start_codes = np.array([generator.randint(-1, SECTIONS) for _ in range(length)], dtype=np.int32)
+    end_codes = np.array([generator.randint(-1, SECTIONS) for _ in range(length)], dtype=np.int32)
+    positions = np.array([np.nan if generator.random() < 0.1 else float(k) for k in range(length)])
+    return Timeline(start_codes, end_codes, positions, positions + 0.5, start, end)
+
+
+def nested_loop_conflicts(first, second):
+    rows = []
+    for i in range(len(first)):
+        for j in range(len(second)):
+            if (first.start_abschnitt_code[i], first.end_abschnitt_code[i]) != \
+                    (second.start_abschnitt_code[j], second.end_abschnitt_code[j]):
+                continue
+            first_start, first_end = first.start_time[i].item(), first.end_time[i].item()
+            second_start, second_end = second.start_time[j].item(), second.end_time[j].item()
+            if first_start < second_start:
+                if second_start < first_end:
+                    rows.append((i, second_start - first_start))
+            elif first_start < second_end:
+                rows.append((i, first_start - second_start))
+
+    strings_of = get_interner().strings_of
+    return {
+        'start_abschnitt_id': strings_of([first.start_abschnitt_code[i] for i, _ in rows]),
+        'end_abschnitt_id': strings_of([first.end_abschnitt_code[i] for i, _ in rows]),
+        'start_abschnitt_pos': [None if np.isnan(first.start_abschnitt_pos[i]) else first.start_abschnitt_pos[i]
+                                for i, _ in rows],
+        'end_abschnitt_pos': [None if np.isnan(first.end_abschnitt_pos[i]) else first.end_abschnitt_pos[i]
+                              for i, _ in rows],
+        'delta': [delta for _, delta in rows],
+    }
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_join_matches_nested_loop(seed, monkeypatch):
+    generator = random.Random(seed)
+    timelines = {'A 1': random_timeline(generator, generator.randint(0, 25)),
+                 'B 2': random_timeline(generator, generator.randint(0, 25))}
+    monkeypatch.setattr(conflict_identification, 'get_timeline', timelines.__getitem__)
+
+    for first_train, second_train in [('A 1', 'B 2'), ('B 2', 'A 1'), ('A 1', 'A 1')]:
+        conflicts = conflict_identification.get_conflict_blocks(first_train, second_train)
+        assert conflicts == nested_loop_conflicts(timelines[first_train], timelines[second_train])
@@ -0,0 +1,44 @@
+"""
+Lookup of model trains in the registry compared to reading the excel file with pandas like before the registry
+"""
+import pandas as pd
+import pytest
+
+import library.model_trains as model_trains
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    sheets = {
+        'Model Train 1': pd.DataFrame({'Linien': ['S1', 'RB20', 'S1'], model_trains.TOTAL_LENGTH_COLUMN: [1, 2, 3]}),
+        'Model Train 2': pd.DataFrame({'Linien': ['RB20', 'RE50', 'RB20'], model_trains.TOTAL_LENGTH_COLUMN: [4, 5, 6]}),
+        'Notes': pd.DataFrame({'Text': ['no lines']}),
+    }
+    monkeypatch.setattr(model_trains, '_read_cache', lambda mtime: sheets)
+    monkeypatch.setattr(model_trains, '_write_cache', lambda sheets, mtime: None)
+    for key in ('mtime', 'sheets', 'lines'):
+        monkeypatch.setitem(model_trains._registry, key, None)
+    return sheets
+
+
+def test_first_row_of_a_sheet_and_last_sheet_win(sheets):
+    assert model_trains.get_train_total_length('s1') == 1
+    assert model_trains.get_train_total_length('RB20') == 4
+    assert model_trains.get_train_total_length('RE50') == 5
+    assert model_trains.get_train_total_length('S2') is None
+
+
+def test_columns(sheets):
+    data_frame = model_trains.get_model_train_data('Model Train 2', [model_trains.TOTAL_LENGTH_COLUMN, 'Linien'])
+    assert data_frame.equals(sheets['Model Train 2'])
+    assert model_trains.get_model_train_data(2, None).equals(sheets['Notes'])
+
+
+@pytest.mark.parametrize('sheet_name', ['Model Train 1', 0])
+def test_unknown_columns_raise_like_pandas(sheet_name):
+    columns = ['Linien', 'Unknown']
+    with pytest.raises(ValueError) as expected:
+        pd.read_excel(model_trains.path_model_trains, sheet_name=sheet_name, usecols=columns)
+    with pytest.raises(ValueError) as error:
+        model_trains.get_model_train_data(sheet_name, columns)
+    assert str(error.value) == str(expected.value)
@@ -0,0 +1,124 @@
+"""
+Parity of the vectorized engine for occupancy times with the scalar engine, which looks up every position of a block
+on its own, on the real schedules and on made up links with the fallbacks of the scalar engine: blocks without a
+Vorsignal, start positions in front of the trajectory and the end station (no speed known, d_weg of 200 m)
+"""
+from os import listdir, path
+
+import numpy as np
+import pytest
+
+import modules.occupancy_times as occupancy_times
+from elements.trajectory import TrajectoryIndex
+from library.model_trains import get_train_total_length
+from library.parser import get_all_verlauf_nodes
+from library.trajectory_loader import TrajectoryArrays
+from library.trajectory_store import get_link_trajectories
+from modules.block_identification import Block, Fahrstrassenabschnitt
+
+INITIAL_POSITION = 10.0
+TRAIN_LENGTH = 150
+
+
+def real_trains():
+    trains = []
+    for line in sorted(listdir(occupancy_times.SCHEDULES_ROOT_DIR)):
+        line_dir = path.join(occupancy_times.SCHEDULES_ROOT_DIR, line)
+        if path.isdir(line_dir):
+            trains.extend(f'{line} {journey}' for journey in sorted(listdir(line_dir)))
+    return trains
+
+
+def scalar_times(trajectory, blocks, train_total_length, initial_position, direction):
+    times = [occupancy_times.calculate_occupancy_time(trajectory, block, train_total_length, initial_position,
+                                                      direction) for block in blocks]
+    return [[time[column] for time in times] for column in range(4)]
+
+
+def vectorized_times(trajectory, blocks, train_total_length, initial_position, direction):
+    return list(occupancy_times.calculate_times_vectorized(trajectory, blocks, train_total_length, initial_position,
+                                                           direction))
+
+
+@pytest.mark.parametrize('train', real_trains())
+def test_engines_match_on_schedules(train):
+    line, journey = train.split()
+    train_length = get_train_total_length(line)
+    last = {'scalar': (None, None), 'vectorized': (None, None)}
+    for nodes, records in zip(get_all_verlauf_nodes(line, journey), get_link_trajectories(line, journey)):
+        results = {}
+        for engine in occupancy_times.ENGINES:
+            *times, last_fstr_id, last_fstr_pos = occupancy_times.calculate_times(nodes, records, train_length,
+                                                                                  *last[engine], engine=engine)
+            results[engine] = times
+            last[engine] = (last_fstr_id, last_fstr_pos)
+        assert results['vectorized'] == results['scalar']
+
+
+def made_up_link(direction):
+    """
+    :return: trajectory over 3 km starting at 40 km/h and getting faster, and a function to get the kilometrisierung
+    some metres along the link
+    """
+    xs = np.arange(0, 3001, 50, dtype=np.float64)
+    vs = np.linspace(40, 120, len(xs))
+    ts = np.cumsum(np.concatenate([[0], np.diff(xs) / (vs[1:] / 3.6)]))
+    timestamps = (1595404800000 + ts * 1000).astype(np.int64)
+    trajectory = TrajectoryArrays(xs=xs, vs=vs, ts=ts, upper_absolute_ts=ts, timestamps=timestamps)
+
+    def at(metres):
+        return INITIAL_POSITION + metres / 1000 if direction == 'S' else INITIAL_POSITION - metres / 1000
+
+    return TrajectoryIndex(trajectory, direction, INITIAL_POSITION), at
+
+
+def abschnitte(at, *metres):
+    return [Fahrstrassenabschnitt(f'A{start}', at(start), f'A{end}', at(end)) for start, end in zip(metres, metres[1:])]
+
+
+def made_up_blocks(at):
+    return [
+        # starts in front of the trajectory, so its start falls back to the initial position and the speed at its
+        # only Fahrstrassenabschnitt is unknown: end station with a d_weg of 200 m
+        Block('B0', None, None, 'H0', at(-300), abschnitte(at, -300, 400), 'H1', at(400)),
+        # without Vorsignal, one Fahrstrassenabschnitt starting in front of the trajectory
+        Block('B1', None, None, 'H1', at(400), abschnitte(at, -100, 700, 1200), 'H2', at(1200)),
+        # with Vorsignal and Zugschlussstelle
+        Block('B2', 'V3', at(900), 'H2', at(1200), abschnitte(at, 1200, 1500, 1800, 2100), 'H3', at(2100),
+              'Z3', at(2200), 6),
+        # with Vorsignal, without Zugschlussstelle, the raeumfahrstrecke ends beyond the trajectory
+        Block('B3', 'V4', at(1900), 'H3', at(2100), abschnitte(at, 2100, 2950), 'H4', at(2950)),
+    ]
+
+
+@pytest.mark.parametrize('direction', ['S', 'F'])
+def test_engines_match_on_fallbacks(direction, capsys):
+    trajectory, at = made_up_link(direction)
+    blocks = made_up_blocks(at)
+
+    expected = scalar_times(trajectory, blocks, TRAIN_LENGTH, INITIAL_POSITION, direction)
+    scalar_output = capsys.readouterr().out
+    assert vectorized_times(trajectory, blocks, TRAIN_LENGTH, INITIAL_POSITION, direction) == expected
+    assert capsys.readouterr().out == scalar_output
+
+    # the end station case is taken, the Vorbelegungszeit of blocks without Vorsignal is the constant one
+    assert 'Endhaltestelle' in scalar_output
+    assert expected[0][0] == expected[0][1] != expected[0][2]
+
+
+@pytest.mark.parametrize('direction', ['S', 'F'])
+@pytest.mark.parametrize('engine', [scalar_times, vectorized_times])
+def test_position_in_front_of_trajectory(direction, engine):
+    trajectory, at = made_up_link(direction)
+    position = at(-500)
+    block = Block('B0', 'V0', position, 'H0', at(100), abschnitte(at, 100, 400), 'H1', at(400))
+    with pytest.raises(ValueError, match=f'position {position}'):
+        engine(trajectory, [block], TRAIN_LENGTH, INITIAL_POSITION, direction)
+
+
+@pytest.mark.parametrize('engine', [scalar_times, vectorized_times])
+def test_initial_position_in_front_of_trajectory(engine):
+    trajectory, at = made_up_link('S')
+    block = Block('B0', None, None, 'H0', at(-300), abschnitte(at, -300, 400), 'H1', at(400))
+    with pytest.raises(ValueError, match=f'position {INITIAL_POSITION - 1}'):
+        engine(trajectory, [block], TRAIN_LENGTH, INITIAL_POSITION - 1, 'S')
@@ -0,0 +1,71 @@
+"""
+Parity of the pruning engine for relevant train pairs with the check of every combination on randomised schedules, with
+links departing at the same time, empty links and timezone naive and aware times
+"""
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+import modules.train_pairs as train_pairs
+
+TRAINS = 60
+ELEMENTS = 25
+
+
+class Link:
+    def __init__(self, departure_time, arrival_time, codes):
+        self.departure_time = departure_time
+        self.arrival_time = arrival_time
+        self.element_codes = np.array(sorted(codes), dtype=np.int32)
+        self.element_code_set = frozenset(codes)
+
+
+class Journey:
+    def __init__(self, links):
+        self.links = links
+
+
+def random_catalog(seed, tzinfo=None):
+    generator = random.Random(seed)
+    start = datetime(2020, 7, 22, 8, tzinfo=tzinfo)
+    journeys = {}
+    for i in range(TRAINS):
+        links = []
+        for _ in range(generator.randint(0, 4)):
+            departure = start + timedelta(minutes=generator.randint(0, 60))
+            arrival = departure + timedelta(minutes=generator.randint(-2, 10))
+            codes = set(generator.sample(range(-1, ELEMENTS), generator.randint(0, 3)))
+            links.append(Link(departure, arrival, codes))
+        journeys[f'T{i} {i}'] = Journey(links)
+    return journeys
+
+
+def use_catalog(monkeypatch, journeys):
+    catalog = type('Catalog', (), {'get': lambda self, train: journeys[train], 'trains': lambda self: list(journeys)})()
+    monkeypatch.setattr(train_pairs, 'get_catalog', lambda: catalog)
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('tzinfo', [None, timezone.utc, timezone(timedelta(hours=2))])
+def test_pruning_matches_combinations(monkeypatch, seed, tzinfo):
+    journeys = random_catalog(seed, tzinfo)
+    use_catalog(monkeypatch, journeys)
+    trains = list(journeys)
+    expected = [pair for pair in itertools.combinations(trains, 2) if train_pairs.is_relevant_pair(*pair)]
+    assert train_pairs.prune_train_pairs(trains) == expected
+
+
+def test_pruning_rejects_mixed_timezones(monkeypatch):
+    journeys = random_catalog(0, timezone.utc)
+    journeys['Naive 1'] = Journey([Link(datetime(2020, 7, 22, 8), datetime(2020, 7, 22, 9), {1})])
+    use_catalog(monkeypatch, journeys)
+    with pytest.raises(TypeError):
+        train_pairs.prune_train_pairs(list(journeys))
+
+
+def test_pruning_without_trains(monkeypatch):
+    use_catalog(monkeypatch, {})
+    assert train_pairs.prune_train_pairs([]) == []
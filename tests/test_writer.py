@@ -0,0 +1,61 @@
+"""
+write_et against the former minidom round-trip on a real occupancy_times.xml and on edge cases
+"""
+import glob
+import xml.etree.ElementTree as ET
+from os import path
+from xml.dom import minidom
+
+import pytest
+
+from library.writer import write_et
+
+PACKAGE_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+OCCUPANCY_TIMES_FILES = sorted(glob.glob(path.join(PACKAGE_DIR, 'output', 'occupancy_times', '*', '*',
+                                                   'occupancy_times.xml')))
+
+EDGE_CASES = [
+    '<a>t<b>x</b>tail</a>',
+    '<a><b>x</b>tail<c/>  <d>y</d>\n</a>',
+    '<a>  </a>',
+    '<a><b> </b><c>\n</c></a>',
+    '<a x="line&#10;break" y="&quot;quoted&quot; &amp; &lt;tag&gt;" z="tab&#09;cr&#13;"/>',
+    '<a>&amp; &lt; &gt; "quotes" \'apostrophes\'</a>',
+    '<a>windows&#13;\nline&#13;ends</a>',
+    '<a><b/><c></c><d>Ümlaut</d></a>',
+    '<a>text<b>x<c>y</c>inner tail</b></a>',
+]
+
+
+def minidom_output(element):
+    return minidom.parseString(ET.tostring(element, 'utf-8')).toprettyxml(indent='  ')
+
+
+def write_et_output(element, tmp_path):
+    xml_path = str(tmp_path / 'written.xml')
+    write_et(element, xml_path)
+    with open(xml_path, 'r', encoding='utf-8', newline='') as xml_file:
+        return xml_file.read()
+
+
+@pytest.mark.parametrize('xml', EDGE_CASES)
+def test_edge_cases_match_minidom(xml, tmp_path):
+    element = ET.fromstring(xml)
+    assert write_et_output(element, tmp_path) == minidom_output(element)
+
+
+@pytest.mark.skipif(not OCCUPANCY_TIMES_FILES, reason='no occupancy_times.xml in output')
+def test_occupancy_times_match_minidom(tmp_path):
+    element = ET.parse(OCCUPANCY_TIMES_FILES[0]).getroot()
+    assert write_et_output(element, tmp_path) == minidom_output(element)
+
+
+@pytest.mark.skipif(not OCCUPANCY_TIMES_FILES, reason='no occupancy_times.xml in output')
+def test_occupancy_times_without_whitespace_match_minidom(tmp_path):
+    # trees built in code have no whitespace text, like the ones export_occupancy_times writes
+    element = ET.parse(OCCUPANCY_TIMES_FILES[0]).getroot()
+    for node in element.iter():
+        node.tail = None
+        if len(node):
+            node.text = None
+    assert write_et_output(element, tmp_path) == minidom_output(element)